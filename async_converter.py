@@ -0,0 +1,146 @@
+from typing import AsyncIterator, Optional
+import asyncio
+import threading
+
+import batch
+import converter
+import path_check
+import progress
+
+
+_END = object()
+
+
+class Conversion:
+    """一次提交的转换任务，可 await 得到实际使用的转换模式
+
+    输出先写入临时文件，转换成功后才改名为目标路径（见 converter.StagedOutput）。
+    取消（cancel 或取消 await 它的任务）时先通知转换线程在下一帧前停止，等待其关闭
+    容器并删除本次写下的临时文件后再抛出 asyncio.CancelledError；目标路径上已有的
+    文件与已经完成的输出不受影响。
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        output_path: str,
+        options: dict,
+        limiter: asyncio.Semaphore,
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        self._options = options
+        self._limiter = limiter
+        self._cancel_event = threading.Event()
+        self._updates: "asyncio.Queue" = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run())
+
+    def __await__(self):
+        return self._task.__await__()
+
+    def done(self) -> bool:
+        return self._task.done()
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+        self._task.cancel()
+
+    async def updates(self) -> AsyncIterator[progress.Progress]:
+        """逐个产出进度快照，转换结束（包括出错与取消）时停止；只应有一个消费者"""
+
+        while True:
+            snapshot = await self._updates.get()
+            if snapshot is _END:
+                return
+            yield snapshot
+
+    def _report(self, snapshot: progress.Progress) -> None:
+        # 在转换线程中调用，交给事件循环线程放入队列
+        self._loop.call_soon_threadsafe(self._updates.put_nowait, snapshot)
+
+    def _convert(self) -> str:
+        path_check.validate_input_path(self.input_path)
+        path_check.validate_output_dir(self.output_path)
+        staged = converter.StagedOutput(self.output_path, self._options)
+        try:
+            mode = converter.convert_file(
+                self.input_path,
+                staged.output_path,
+                progress_callback=self._report,
+                cancel_event=self._cancel_event,
+                **staged.options,
+            )
+            staged.commit()
+        except BaseException:
+            staged.discard()
+            raise
+        return mode
+
+    async def _run(self) -> str:
+        try:
+            async with self._limiter:
+                future = self._loop.run_in_executor(None, self._convert)
+                try:
+                    return await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    self._cancel_event.set()
+                    # 等待转换线程关闭容器并清理临时文件，线程因取消抛出的异常不再关心
+                    await asyncio.gather(future, return_exceptions=True)
+                    raise
+                except progress.Cancelled:
+                    raise asyncio.CancelledError()
+        finally:
+            self._updates.put_nowait(_END)
+
+
+class AsyncConverter:
+    """在 asyncio 服务中调用转换：转换在线程池中运行，不阻塞事件循环
+
+    max_concurrent 为同时运行的转换数，默认按 CPU 数与每个任务的编解码线程数推算
+    （与批量模式相同）；未指定 threads 时每个任务按并发数均分可用的 CPU。
+
+        service = AsyncConverter(max_concurrent=2)
+        job = service.submit("input.mp4", "output.mp4", mode="sbs2tab")
+        async for snapshot in job.updates():
+            print(progress.format_human(snapshot))
+        mode = await job
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None):
+        self.max_concurrent, self.threads = batch.plan_concurrency(max_concurrent)
+        self._limiter: Optional[asyncio.Semaphore] = None
+
+    def submit(
+        self, input_path: str, output_path: Optional[str] = None, **options
+    ) -> Conversion:
+        """提交转换并立即返回任务，超出并发数的任务排队等待；需在事件循环中调用
+
+        options 原样传给 converter.convert_file（progress_callback 与 cancel_event
+        由任务自身提供）。
+        """
+
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_concurrent)
+        options.setdefault("threads", self.threads)
+        if output_path is None:
+            output_path = converter.default_output_path(input_path)
+        return Conversion(input_path, output_path, options, self._limiter)
+
+    async def convert(
+        self, input_path: str, output_path: Optional[str] = None, **options
+    ) -> str:
+        """转换单个文件并返回实际使用的转换模式"""
+        return await self.submit(input_path, output_path, **options)
+
+
+_default_converter: Optional[AsyncConverter] = None
+
+
+async def convert(input_path: str, output_path: Optional[str] = None, **options) -> str:
+    """使用进程内共享的 AsyncConverter 转换单个文件，见 AsyncConverter.submit"""
+
+    global _default_converter
+    if _default_converter is None:
+        _default_converter = AsyncConverter()
+    return await _default_converter.convert(input_path, output_path, **options)
@@ -0,0 +1,180 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+import glob
+import os
+import time
+
+import converter
+import path_check
+import presets
+
+
+VIDEO_EXTENSIONS = {
+    ".mp4",
+    ".m4v",
+    ".mkv",
+    ".mov",
+    ".avi",
+    ".ts",
+    ".m2ts",
+    ".mts",
+    ".webm",
+    ".flv",
+    ".wmv",
+    ".mpg",
+    ".mpeg",
+}
+
+# 单个转换任务默认分配的编解码线程数，用于推算默认并发数
+DEFAULT_THREADS_PER_JOB = 4
+
+
+class BatchResult(NamedTuple):
+    input_path: str
+    output_path: str
+    status: str  # ok / skipped / failed
+    message: str
+    seconds: float
+
+
+def is_batch_input(paths: Sequence[str]) -> bool:
+    """多个输入、目录或尚不存在的通配符路径都按批量模式处理"""
+
+    if len(paths) != 1:
+        return True
+    path = paths[0]
+    return os.path.isdir(path) or (not os.path.exists(path) and glob.has_magic(path))
+
+
+def _is_source_video(path: str) -> bool:
+    """按扩展名筛选视频文件，并跳过之前转换留下的 *_converted 输出与未完成的临时文件"""
+    name, ext = os.path.splitext(os.path.basename(path))
+    return ext.lower() in VIDEO_EXTENSIONS and not name.endswith(
+        ("_converted", ".partial")
+    )
+
+
+def collect_inputs(patterns: Sequence[str], recursive: bool = False) -> List[str]:
+    """展开目录与通配符，返回去重后的视频文件列表"""
+
+    inputs: List[str] = []
+    seen = set()
+
+    def add(path: str) -> None:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            inputs.append(path)
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                candidates = [
+                    os.path.join(root, name)
+                    for root, _, names in os.walk(pattern)
+                    for name in names
+                ]
+            else:
+                candidates = [
+                    os.path.join(pattern, name) for name in os.listdir(pattern)
+                ]
+            for path in sorted(candidates):
+                if _is_source_video(path):
+                    add(path)
+        elif glob.has_magic(pattern) and not os.path.exists(pattern):
+            for path in sorted(glob.glob(pattern, recursive=recursive)):
+                if os.path.isfile(path) and _is_source_video(path):
+                    add(path)
+        else:
+            add(pattern)
+
+    return inputs
+
+
+def plan_concurrency(jobs: Optional[int] = None) -> Tuple[int, int]:
+    """返回 (并发任务数, 每个任务的编解码线程数)，两者之积不超过可用 CPU 数"""
+
+    cpus = presets.available_cpus()
+    if jobs is None:
+        jobs = max(1, cpus // DEFAULT_THREADS_PER_JOB)
+    if jobs < 1:
+        raise ValueError(f"并发任务数必须为正数，当前：{jobs}")
+    return jobs, max(1, cpus // jobs)
+
+
+def _convert_job(input_path: str, output_path: str, options: dict) -> BatchResult:
+    """工作进程入口：转换单个文件，异常转为失败结果而不中断整个批次"""
+
+    started = time.perf_counter()
+    staged = None
+    try:
+        path_check.validate_input_path(input_path)
+        path_check.validate_output_dir(output_path)
+        # 先写入临时文件，成功后再改名：中断不会留下被 skip_existing 误判为已完成的
+        # 残缺文件，也不会破坏已有的输出
+        staged = converter.StagedOutput(output_path, options)
+        mode = converter.convert_file(input_path, staged.output_path, **staged.options)
+        staged.commit()
+        status, message = "ok", mode
+    except Exception as e:
+        status, message = "failed", str(e)
+        if staged is not None:
+            staged.discard()
+    return BatchResult(
+        input_path, output_path, status, message, time.perf_counter() - started
+    )
+
+
+def convert_batch(
+    input_paths: Sequence[str],
+    output_dir: Optional[str] = None,
+    jobs: Optional[int] = None,
+    skip_existing: bool = False,
+    report: Optional[Callable[[BatchResult], None]] = None,
+    **options,
+) -> List[BatchResult]:
+    """在一个进程池中批量转换多个文件，每完成一个文件调用一次 report
+
+    options 原样传给 converter.convert_file（不含 workers，批量模式按文件并行）。
+    """
+
+    jobs, threads = plan_concurrency(jobs)
+    options.setdefault("threads", threads)
+
+    results: List[BatchResult] = []
+
+    def finish(result: BatchResult) -> None:
+        results.append(result)
+        if report is not None:
+            report(result)
+
+    pending = []
+    claimed = set()
+    for input_path in input_paths:
+        output_path = converter.default_output_path(input_path, output_dir)
+        key = os.path.abspath(output_path)
+        if key in claimed:
+            finish(BatchResult(input_path, output_path, "failed", "输出文件重名", 0.0))
+        elif skip_existing and os.path.exists(output_path):
+            finish(BatchResult(input_path, output_path, "skipped", "输出已存在", 0.0))
+        else:
+            claimed.add(key)
+            pending.append((input_path, output_path))
+
+    if not pending:
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+        futures = [
+            executor.submit(_convert_job, input_path, output_path, options)
+            for input_path, output_path in pending
+        ]
+        try:
+            for future in as_completed(futures):
+                finish(future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return results
@@ -0,0 +1,4 @@
+"""性能基准测试：在本地合成的立体测试片段上测量转换与检测性能
+
+在项目根目录以模块方式运行，例如 ``python -m benchmarks.throughput``。
+"""
@@ -0,0 +1,136 @@
+from typing import Callable, NamedTuple, Optional
+import os
+
+import av
+import numpy as np
+
+
+# 左右两路视图之间的水平视差（像素），使两路画面相似但不完全相同
+DISPARITY = 8
+# 每帧画面平移的像素数，模拟运动
+MOTION = 4
+
+
+class ClipSpec(NamedTuple):
+    """合成立体片段的规格：layout 为 sbs / tab，split 为左/上视图所占比例"""
+
+    name: str
+    layout: str
+    width: int
+    height: int
+    split: float = 0.5
+    codec: str = "libx264"
+    pix_fmt: str = "yuv420p"
+    frames: int = 24
+    rate: int = 24
+
+    @property
+    def mode(self) -> str:
+        """转换该片段对应的转换模式"""
+        return "sbs2tab" if self.layout == "sbs" else "tab2sbs"
+
+
+def _resample(values: np.ndarray, length: int, axis: int) -> np.ndarray:
+    """沿 axis 线性插值到 length 个采样点"""
+
+    positions = np.linspace(0, values.shape[axis] - 1, length)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, values.shape[axis] - 1)
+    weight = (positions - lower).reshape([-1 if i == axis else 1 for i in range(3)])
+    return (
+        np.take(values, lower, axis=axis) * (1 - weight)
+        + np.take(values, upper, axis=axis) * weight
+    )
+
+
+def texture(width: int, height: int, seed: int) -> np.ndarray:
+    """生成平滑的 RGB 纹理：低分辨率随机色块线性插值放大后叠加细小噪声"""
+
+    rng = np.random.default_rng(seed)
+    cells = rng.uniform(0, 255, ((height + 63) // 64 + 1, (width + 63) // 64 + 1, 3))
+    smooth = _resample(_resample(cells, height, 0), width, 1)
+    grain = rng.normal(0, 4, (height, width, 1))
+    return np.clip(smooth + grain, 0, 255).astype(np.uint8)
+
+
+def _scale(image: np.ndarray, width: int, height: int) -> np.ndarray:
+    """最近邻缩放"""
+    rows = np.arange(height) * image.shape[0] // height
+    cols = np.arange(width) * image.shape[1] // width
+    return image[rows][:, cols]
+
+
+def render_frame(spec: ClipSpec, index: int, texture: np.ndarray) -> np.ndarray:
+    """按布局拼接左右两路视图，返回一帧 RGB 画面
+
+    两路视图是同一画面（带少量视差）分别缩放到各自区域的尺寸，
+    与非对称分割的片源一致。
+    """
+
+    shift = index * MOTION
+    if spec.layout == "sbs":
+        first = int(spec.width * spec.split)
+        sizes = ((first, spec.height), (spec.width - first, spec.height))
+    else:
+        first = int(spec.height * spec.split)
+        sizes = ((spec.width, first), (spec.width, spec.height - first))
+
+    views = [
+        _scale(np.roll(texture, shift + eye * DISPARITY, axis=1), width, height)
+        for eye, (width, height) in enumerate(sizes)
+    ]
+    return np.concatenate(views, axis=1 if spec.layout == "sbs" else 0)
+
+
+def make_clip(
+    spec: ClipSpec,
+    path: str,
+    seed: int = 0,
+    render: Optional[Callable[[int], np.ndarray]] = None,
+) -> str:
+    """用 PyAV 编码合成片段；编码使用最快的预设，只求尽快得到输入文件
+
+    render 以帧序号为参数返回该帧的 RGB 画面，默认按 spec 用 render_frame 合成。
+    """
+
+    if render is None:
+        image = texture(spec.width, spec.height, seed)
+
+        def render(index: int) -> np.ndarray:
+            return render_frame(spec, index, image)
+
+    options = {"preset": "ultrafast"} if spec.codec in ("libx264", "libx265") else {}
+
+    with av.open(path, mode="w") as container:
+        stream = container.add_stream(spec.codec, rate=spec.rate, options=options)
+        stream.width = spec.width
+        stream.height = spec.height
+        stream.pix_fmt = spec.pix_fmt
+        for index in range(spec.frames):
+            frame = av.VideoFrame.from_ndarray(render(index), format="rgb24").reformat(
+                format=spec.pix_fmt
+            )
+            frame.pts = index
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+def ensure_clip(
+    spec: ClipSpec,
+    work_dir: str,
+    ext: Optional[str] = None,
+    render: Optional[Callable[[int], np.ndarray]] = None,
+) -> str:
+    """返回片段路径，工作目录中尚不存在时先生成；render 见 make_clip"""
+
+    ext = ext or (".mkv" if spec.codec == "ffv1" else ".mp4")
+    path = os.path.join(work_dir, f"{spec.name}{ext}")
+    if not os.path.exists(path):
+        os.makedirs(work_dir, exist_ok=True)
+        temp_path = os.path.join(work_dir, f".{spec.name}.tmp{ext}")
+        make_clip(spec, temp_path, render=render)
+        os.replace(temp_path, path)
+    return path
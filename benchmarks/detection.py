@@ -0,0 +1,423 @@
+"""格式检测的准确率与速度基准测试
+
+合成已知布局与分割比例的立体画面（SBS / TAB，分割比例 0.4–0.6，含黑边、低纹理、
+强噪声等变体，以及应判为无法确定的单目画面），分别评估按宽高比判断格式
+（video_info.get_video_format）与各分割线检测实现的准确率、分割比例误差及每帧耗时，
+结果以 JSON 输出。新的检测实现只有在准确率不下降时才应替换现有实现：
+
+    python -m benchmarks.detection -o detection.json
+    python -m benchmarks.detection --detectors pyramid exhaustive --variants plain noisy
+    python -m benchmarks.detection --clips --frames 5
+"""
+
+from contextlib import redirect_stderr
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+import video_info
+from benchmarks.clips import MOTION, ClipSpec, ensure_clip, render_frame, texture
+from benchmarks.throughput import environment
+
+
+# 每路视图的高度（像素），宽度按视图宽高比推算；画面较小，穷举搜索也能在可接受的时间内完成
+VIEW_HEIGHT = 270
+# 视图宽高比：16:9 与 4:3 片源拼接后的整体宽高比各不相同，用于检验宽高比判断
+VIEW_ASPECTS = {"16x9": 16 / 9, "4x3": 4 / 3}
+# 左/上视图所占比例
+SPLITS = (0.4, 0.45, 0.5, 0.55, 0.6)
+# 画面变体：plain 为普通纹理，letterbox 每路视图上下带黑边，flat 为低对比度的低纹理画面，
+# noisy 叠加每帧、每路各不相同的强噪声
+VARIANTS = ("plain", "letterbox", "flat", "noisy")
+# mono 为单目画面，不应被判为任何立体格式
+LAYOUTS = ("sbs", "tab", "mono")
+
+# letterbox 变体每条黑边占视图高度的比例（约为 2.39:1 画面放入 16:9 视图）
+LETTERBOX_RATIO = 0.12
+# flat 变体相对于普通纹理的对比度
+FLAT_CONTRAST = 0.25
+# noisy 变体叠加的高斯噪声标准差
+NOISE_SIGMA = 8.0
+# 端到端测试（--clips）时编码的片段帧数
+CLIP_FRAMES = 24
+
+EXPECTED_FORMATS = {
+    "sbs": video_info.VideoFormat.sbs,
+    "tab": video_info.VideoFormat.tab,
+    "mono": video_info.VideoFormat.notsure,
+}
+
+
+class Case(NamedTuple):
+    """一个已知真值的测试画面：布局、视图宽高比、分割比例与画面变体"""
+
+    layout: str
+    view: str
+    split: float
+    variant: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.layout}-{self.view}-{self.split:g}-{self.variant}"
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        view_width = round(VIEW_HEIGHT * VIEW_ASPECTS[self.view] / 2) * 2
+        if self.layout == "sbs":
+            return 2 * view_width, VIEW_HEIGHT
+        if self.layout == "tab":
+            return view_width, 2 * VIEW_HEIGHT
+        return view_width, VIEW_HEIGHT
+
+    @property
+    def expected(self) -> video_info.VideoFormat:
+        return EXPECTED_FORMATS[self.layout]
+
+    @property
+    def seed(self) -> int:
+        return zlib.crc32(self.name.encode())
+
+
+def build_cases(
+    layouts=LAYOUTS, views=tuple(VIEW_ASPECTS), splits=SPLITS, variants=VARIANTS
+) -> List[Case]:
+    """按各维度的组合生成测试画面；单目画面没有分割线，每种视图与变体只生成一个"""
+
+    cases = []
+    for layout, view, variant in itertools.product(layouts, views, variants):
+        for split in splits if layout != "mono" else (0.5,):
+            cases.append(Case(layout, view, split, variant))
+    return cases
+
+
+def _view_rows(case: Case, height: int) -> List[Tuple[int, int]]:
+    """各路视图所占的行范围（SBS 与单目画面只有一组）"""
+
+    if case.layout != "tab":
+        return [(0, height)]
+    first = int(height * case.split)
+    return [(0, first), (first, height)]
+
+
+def render(case: Case, index: int, texture: np.ndarray) -> np.ndarray:
+    """渲染测试画面的第 index 帧（RGB）"""
+
+    width, height = case.size
+    if case.layout == "mono":
+        image = np.roll(texture, index * MOTION, axis=1)
+    else:
+        spec = ClipSpec(case.name, case.layout, width, height, case.split)
+        image = render_frame(spec, index, texture)
+
+    if case.variant == "letterbox":
+        image = image.copy()
+        for top, bottom in _view_rows(case, height):
+            bar = int((bottom - top) * LETTERBOX_RATIO)
+            image[top : top + bar] = 0
+            image[bottom - bar : bottom] = 0
+    elif case.variant == "flat":
+        image = (image.astype(np.float32) - 128) * FLAT_CONTRAST + 128
+    elif case.variant == "noisy":
+        rng = np.random.default_rng((case.seed, index))
+        image = image + rng.normal(0, NOISE_SIGMA, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+class Detector(NamedTuple):
+    """一种分割线检测实现，参数对应 video_info 中检测函数的同名参数"""
+
+    method: str
+    prefilter: bool = False
+
+
+# 检测实现名称 -> 参数，新增检测实现时在此注册
+DETECTORS: Dict[str, Detector] = {
+    "pyramid": Detector("pyramid"),
+    "pyramid-prefilter": Detector("pyramid", prefilter=True),
+    "exhaustive": Detector("exhaustive"),
+}
+# exhaustive 为逐像素穷举的参考实现，耗时约为其余实现的数十倍，默认不运行
+DEFAULT_DETECTORS = ("pyramid", "pyramid-prefilter")
+
+
+def _detect_frames(
+    case: Case, detector: Detector, frames: int, threshold: float
+) -> Tuple[video_info.VideoFormat, float, float]:
+    """在内存中渲染的画面上检测，只计分割线搜索本身的耗时"""
+
+    width, height = case.size
+    image = texture(width, height, case.seed)
+    # 检测函数接收 BGR 画面
+    images = [
+        np.ascontiguousarray(render(case, index, image)[..., ::-1])
+        for index in range(frames)
+    ]
+    started = time.perf_counter()
+    format, split = video_info.detect_split_direction_and_position(
+        images, threshold, detector.method, detector.prefilter, digits=None
+    )
+    return format, split, time.perf_counter() - started
+
+
+def _detect_clip(
+    case: Case, detector: Detector, frames: int, threshold: float, work_dir: str
+) -> Tuple[video_info.VideoFormat, float, float]:
+    """先把画面编码为片段，再从片段中抽帧检测，耗时包含抽帧与解码"""
+
+    width, height = case.size
+    image = texture(width, height, case.seed)
+    spec = ClipSpec(
+        f"detect-{case.name}",
+        case.layout,
+        width,
+        height,
+        case.split,
+        frames=CLIP_FRAMES,
+    )
+    path = ensure_clip(
+        spec, work_dir, render=lambda index: render(case, index, image)
+    )
+    started = time.perf_counter()
+    format, split = video_info.detect_split_from_video(
+        path,
+        num_frames=frames,
+        threshold_sim=threshold,
+        method=detector.method,
+        prefilter=detector.prefilter,
+        random_seed=0,
+        digits=None,
+    )
+    return format, split, time.perf_counter() - started
+
+
+def run_case(
+    case: Case,
+    detector_name: str,
+    frames: int,
+    threshold: float,
+    work_dir: Optional[str] = None,
+) -> Dict:
+    """运行一次检测；给定 work_dir 时端到端地从编码后的片段中抽帧检测"""
+
+    detector = DETECTORS[detector_name]
+    if work_dir is None:
+        format, split, seconds = _detect_frames(case, detector, frames, threshold)
+    else:
+        format, split, seconds = _detect_clip(
+            case, detector, frames, threshold, work_dir
+        )
+    correct = format == case.expected
+    width, height = case.size
+    # 只有方向判断正确的立体画面才有分割比例误差；检测结果不取整，同时折算为像素
+    split_error = split_error_px = None
+    if correct and case.layout != "mono":
+        split_error = abs(split - case.split)
+        split_error_px = split_error * (width if case.layout == "sbs" else height)
+    return {
+        "case": {**case._asdict(), "name": case.name, "width": width, "height": height},
+        "detector": detector_name,
+        "expected": case.expected.value,
+        "detected": format.value,
+        "split": split,
+        "correct": correct,
+        "split_error": split_error,
+        "split_error_px": split_error_px,
+        "seconds_per_frame": seconds / frames,
+    }
+
+
+def evaluate_aspect_ratio(cases: List[Case]) -> Dict:
+    """按宽高比判断格式的准确率：每种画面尺寸只评估一次"""
+
+    results = []
+    seen = set()
+    for case in cases:
+        key = (case.size, case.layout)
+        if key in seen:
+            continue
+        seen.add(key)
+        width, height = case.size
+        # 无法判断时 get_video_format 会向标准错误输出提示，此处不需要
+        with redirect_stderr(io.StringIO()):
+            format = video_info.get_video_format(width, height)
+        results.append(
+            {
+                "layout": case.layout,
+                "view": case.view,
+                "width": width,
+                "height": height,
+                "expected": case.expected.value,
+                "detected": format.value,
+                "correct": format == case.expected,
+            }
+        )
+    correct = sum(result["correct"] for result in results)
+    return {
+        "accuracy": correct / len(results) if results else 0.0,
+        "results": results,
+    }
+
+
+def summarize(results: List[Dict]) -> Dict[str, Dict]:
+    """按检测实现汇总准确率、分割比例误差与每帧耗时，并按画面变体细分准确率"""
+
+    summary = {}
+    for detector_name in dict.fromkeys(result["detector"] for result in results):
+        runs = [result for result in results if result["detector"] == detector_name]
+        measured = [run for run in runs if run["split_error"] is not None]
+        errors = [run["split_error"] for run in measured]
+        errors_px = [run["split_error_px"] for run in measured]
+        by_variant = {}
+        for variant in dict.fromkeys(run["case"]["variant"] for run in runs):
+            variant_runs = [run for run in runs if run["case"]["variant"] == variant]
+            by_variant[variant] = sum(run["correct"] for run in variant_runs) / len(
+                variant_runs
+            )
+        summary[detector_name] = {
+            "cases": len(runs),
+            "accuracy": sum(run["correct"] for run in runs) / len(runs),
+            "mean_split_error": statistics.mean(errors) if errors else None,
+            "max_split_error": max(errors) if errors else None,
+            "mean_split_error_px": statistics.mean(errors_px) if errors_px else None,
+            "max_split_error_px": max(errors_px) if errors_px else None,
+            "seconds_per_frame": statistics.mean(
+                run["seconds_per_frame"] for run in runs
+            ),
+            "accuracy_by_variant": by_variant,
+        }
+    return summary
+
+
+def run_benchmarks(
+    cases: List[Case],
+    detectors: List[str],
+    frames: int = 3,
+    threshold: float = 0.65,
+    work_dir: Optional[str] = None,
+    report: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """依次运行每个测试画面与检测实现的组合；给定 work_dir 时端到端测试编码后的片段"""
+
+    if frames < 1:
+        raise ValueError(f"检测帧数必须为正数，当前：{frames}")
+    # 检测依赖的模块首次导入需要数百毫秒，预先导入以免计入第一个组合的耗时
+    import cv2  # noqa: F401
+    from skimage.metrics import structural_similarity  # noqa: F401
+
+    results = []
+    for case in cases:
+        for detector_name in detectors:
+            result = run_case(case, detector_name, frames, threshold, work_dir)
+            results.append(result)
+            if report is not None:
+                report(result)
+
+    return {
+        "environment": environment(),
+        "source": "clips" if work_dir is not None else "frames",
+        "frames": frames,
+        "threshold": threshold,
+        "aspect_ratio": evaluate_aspect_ratio(cases),
+        "detectors": summarize(results),
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="格式检测准确率与速度基准测试")
+    parser.add_argument(
+        "--detectors",
+        nargs="+",
+        choices=list(DETECTORS),
+        default=list(DEFAULT_DETECTORS),
+        help="要测试的检测实现，默认 " + " ".join(DEFAULT_DETECTORS),
+    )
+    parser.add_argument(
+        "--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS), help="画面布局"
+    )
+    parser.add_argument(
+        "--views",
+        nargs="+",
+        choices=list(VIEW_ASPECTS),
+        default=list(VIEW_ASPECTS),
+        help="每路视图的宽高比",
+    )
+    parser.add_argument(
+        "--splits", nargs="+", type=float, default=list(SPLITS), help="分割比例"
+    )
+    parser.add_argument(
+        "--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS), help="画面变体"
+    )
+    parser.add_argument("--frames", type=int, default=3, help="每个画面参与检测的帧数")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.65,
+        help="分割线检测的 SSIM 阈值，用于评估阈值的取值",
+    )
+    parser.add_argument(
+        "--clips",
+        action="store_true",
+        help="端到端测试：把画面编码为片段后抽帧检测，耗时包含抽帧与解码",
+    )
+    parser.add_argument(
+        "--work-dir",
+        default=os.path.join(tempfile.gettempdir(), "sbs-tab-trans-bench"),
+        help="--clips 时合成片段的目录，已生成的片段会被复用",
+    )
+    parser.add_argument("-o", "--output", help="JSON 结果文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    cases = build_cases(args.layouts, args.views, args.splits, args.variants)
+
+    def report(result: Dict) -> None:
+        split = f"{result['split']:.3f}" if result["split_error"] is not None else "-"
+        print(
+            f"{result['case']['name']:<26} {result['detector']:<18} "
+            f"{result['detected']:<9} {split:>6}  "
+            f"{'ok' if result['correct'] else 'MISS':<4} "
+            f"{result['seconds_per_frame'] * 1000:9.1f} ms/frame",
+            file=sys.stderr,
+        )
+
+    data = run_benchmarks(
+        cases,
+        args.detectors,
+        args.frames,
+        args.threshold,
+        args.work_dir if args.clips else None,
+        report,
+    )
+
+    print(
+        f"宽高比判断准确率 {data['aspect_ratio']['accuracy']:.1%}", file=sys.stderr
+    )
+    for detector_name, summary in data["detectors"].items():
+        error = summary["mean_split_error_px"]
+        print(
+            f"{detector_name:<18} 准确率 {summary['accuracy']:6.1%}  "
+            f"平均分割误差 {'-' if error is None else f'{error:.1f} px'}  "
+            f"{summary['seconds_per_frame'] * 1000:9.1f} ms/frame",
+            file=sys.stderr,
+        )
+
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""命令行冷启动耗时基准测试
+
+每次在全新的解释器进程中运行 main.py，测量从启动到退出的墙钟时间，并用
+-X importtime 检查是否加载了分割线检测才需要的模块（cv2、skimage、scipy）：
+
+    python -m benchmarks.startup -o startup.json
+    python -m benchmarks.startup --repeat 20 --budget 500
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.clips import ClipSpec, ensure_clip
+from benchmarks.throughput import environment
+
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "main.py")
+
+# 只在非标准分割线检测时才应加载的模块
+DETECTION_MODULES = ("cv2", "skimage", "scipy")
+
+# 指定模式转换所用的小片段，转换本身的耗时可以忽略
+CLIP = ClipSpec("startup-sbs", "sbs", 640, 180, frames=2)
+
+
+class Case(NamedTuple):
+    name: str
+    # 输入片段路径、输出路径 -> main.py 的参数
+    arguments: Callable[[str, str], List[str]]
+
+
+CASES = [
+    Case("help", lambda clip, output: ["--help"]),
+    Case(
+        "explicit-mode",
+        lambda clip, output: [clip, "-m", "sbs2tab", "-o", output, "--no-cache"],
+    ),
+]
+
+
+def _run(arguments: List[str], importtime: bool = False) -> subprocess.CompletedProcess:
+    options = ["-X", "importtime"] if importtime else []
+    return subprocess.run(
+        [sys.executable, *options, MAIN_PATH, *arguments],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+
+def _imported_modules(importtime_log: str) -> List[str]:
+    """从 -X importtime 的输出中取出加载的顶层模块名"""
+
+    modules = set()
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        name = line.rsplit("|", 1)[1].strip()
+        if name and name != "imported package":
+            modules.add(name.split(".")[0])
+    return sorted(modules)
+
+
+def run_case(case: Case, clip_path: str, output_path: str, repeat: int) -> Dict:
+    """重复运行 repeat 次，记录各次墙钟时间及加载的检测模块"""
+
+    arguments = case.arguments(clip_path, output_path)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _run(arguments)
+        timings.append(time.perf_counter() - started)
+
+    modules = _imported_modules(_run(arguments, importtime=True).stderr)
+    return {
+        "case": case.name,
+        "repeat": repeat,
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+        "detection_modules": [name for name in modules if name in DETECTION_MODULES],
+    }
+
+
+def run_benchmarks(
+    cases: List[Case],
+    work_dir: str,
+    repeat: int = 5,
+    report: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    clip_path = ensure_clip(CLIP, work_dir)
+    output_path = os.path.join(work_dir, "out_startup.mp4")
+    results = []
+    try:
+        for case in cases:
+            result = run_case(case, clip_path, output_path, repeat)
+            results.append(result)
+            if report is not None:
+                report(result)
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    return {"environment": environment(), "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="命令行冷启动耗时基准测试")
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=[case.name for case in CASES],
+        help="要测试的场景，默认全部",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景重复次数")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        metavar="MS",
+        help="耗时预算（毫秒）：任一场景的中位数超出预算或加载了检测模块时以非零状态退出",
+    )
+    parser.add_argument(
+        "--work-dir",
+        default=os.path.join(tempfile.gettempdir(), "sbs-tab-trans-bench"),
+        help="合成片段与临时输出目录，已生成的片段会被复用",
+    )
+    parser.add_argument("-o", "--output", help="JSON 结果文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    cases = [case for case in CASES if not args.cases or case.name in args.cases]
+
+    def report(result: Dict) -> None:
+        loaded = ", ".join(result["detection_modules"]) or "无"
+        print(
+            f"{result['case']:<16} {result['median_ms']:8.1f} ms 中位数  "
+            f"{result['min_ms']:8.1f} ms 最快  检测模块: {loaded}",
+            file=sys.stderr,
+        )
+
+    data = run_benchmarks(cases, args.work_dir, args.repeat, report)
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.budget is not None:
+        over = [
+            result["case"]
+            for result in data["results"]
+            if result["median_ms"] > args.budget or result["detection_modules"]
+        ]
+        if over:
+            print(f"超出启动耗时预算: {', '.join(over)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
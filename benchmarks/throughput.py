@@ -0,0 +1,259 @@
+"""转换吞吐量基准测试
+
+在本地合成的立体片段上运行各转换引擎，记录帧率、耗时、CPU 时间与峰值内存，
+结果以 JSON 输出，便于跨版本比较：
+
+    python -m benchmarks.throughput -o results.json
+    python -m benchmarks.throughput --clips 1080p-sbs --engines native rgb filter --frames 12
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import av
+
+import parallel_av
+import transformer_av
+from benchmarks.clips import ClipSpec, ensure_clip
+
+
+CLIPS = [
+    ClipSpec("1080p-sbs", "sbs", 3840, 1080),
+    ClipSpec("1080p-sbs-split0.4", "sbs", 3840, 1080, split=0.4),
+    ClipSpec(
+        "1080p-tab-ffv1", "tab", 1920, 2160, split=0.45, codec="ffv1", pix_fmt="yuv444p"
+    ),
+    ClipSpec("4k-sbs", "sbs", 7680, 2160),
+    ClipSpec(
+        "4k-sbs-hevc10", "sbs", 7680, 2160, codec="libx265", pix_fmt="yuv420p10le"
+    ),
+    ClipSpec("8k-tab", "tab", 7680, 4320, codec="libx265", frames=12),
+]
+
+Engine = Callable[[ClipSpec, str, str], int]
+
+
+def _transformer_engine(**options) -> Engine:
+    def run(spec: ClipSpec, input_path: str, output_path: str) -> int:
+        return transformer_av.convert(
+            spec.mode,
+            input_path,
+            output_path,
+            spec.width,
+            spec.height,
+            spec.frames,
+            spec.split,
+            **options,
+        )
+
+    return run
+
+
+def _parallel_engine(spec: ClipSpec, input_path: str, output_path: str) -> int:
+    parallel_av.convert_parallel(
+        spec.mode,
+        input_path,
+        output_path,
+        spec.width,
+        spec.height,
+        spec.frames,
+        spec.split,
+        workers=os.cpu_count() or 1,
+    )
+    return spec.frames
+
+
+# 引擎名称 -> 转换函数，新增转换引擎时在此注册
+ENGINES: Dict[str, Engine] = {
+    "native": _transformer_engine(pixel_mode="native"),
+    "rgb": _transformer_engine(pixel_mode="rgb"),
+    "filter": _transformer_engine(pixel_mode="filter"),
+    "pipeline": _transformer_engine(pixel_mode="native", pipeline=True),
+    "parallel": _parallel_engine,
+}
+
+
+def _peak_rss_mb(usage: resource.struct_rusage) -> float:
+    # Linux 上 ru_maxrss 的单位为 KB，macOS 上为字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / (1 << 20)
+
+
+def _own_peak_rss_mb() -> float:
+    """本进程自启动以来的峰值内存
+
+    Linux 上 ru_maxrss 在 fork 时继承自父进程，exec 之后也不重置，测得的往往是
+    启动基准测试的父进程的峰值；/proc/self/status 中的 VmHWM 在 exec 时由内核重新
+    计数，只反映本进程。其他平台退回 ru_maxrss。
+    """
+
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+def _measure(
+    engine_name: str, spec: ClipSpec, input_path: str, output_path: str
+) -> Dict:
+    """在全新的（spawn）子进程中运行，使峰值内存只反映本次转换
+
+    分段并行引擎的工作进程由本进程创建，其峰值（ru_maxrss）至多继承本进程启动后的
+    内存，与本进程的峰值取较大者。
+    """
+
+    started_self = resource.getrusage(resource.RUSAGE_SELF)
+    started_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+
+    frames = ENGINES[engine_name](spec, input_path, output_path)
+
+    wall = time.perf_counter() - started
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = sum(
+        getattr(end, field) - getattr(begin, field)
+        for begin, end in (
+            (started_self, usage_self),
+            (started_children, usage_children),
+        )
+        for field in ("ru_utime", "ru_stime")
+    )
+    return {
+        "frames": frames,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "fps": frames / wall if wall > 0 else 0.0,
+        "peak_rss_mb": max(_own_peak_rss_mb(), _peak_rss_mb(usage_children)),
+    }
+
+
+def run_case(
+    engine_name: str, spec: ClipSpec, input_path: str, output_path: str
+) -> Dict:
+    """在独立的子进程中运行一次转换并返回测量结果"""
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(
+            _measure, engine_name, spec, input_path, output_path
+        ).result()
+
+
+def environment() -> Dict:
+    """记录运行环境，比较不同时间的结果时据此判断是否可比"""
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pyav": av.__version__,
+        "ffmpeg": {
+            name: ".".join(map(str, version))
+            for name, version in av.library_versions.items()
+        },
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmarks(
+    clips: List[ClipSpec],
+    engines: List[str],
+    work_dir: str,
+    repeat: int = 1,
+    report: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """依次运行每个片段与引擎的组合，重复多次时保留耗时最短的一次"""
+
+    results = []
+    for spec in clips:
+        input_path = ensure_clip(spec, work_dir)
+        for engine_name in engines:
+            _, ext = os.path.splitext(input_path)
+            output_path = os.path.join(work_dir, f"out_{spec.name}_{engine_name}{ext}")
+            runs = [
+                run_case(engine_name, spec, input_path, output_path)
+                for _ in range(repeat)
+            ]
+            best = min(runs, key=lambda run: run["wall_seconds"])
+            result = {
+                "clip": spec._asdict(),
+                "engine": engine_name,
+                "repeat": repeat,
+                **best,
+            }
+            os.remove(output_path)
+            results.append(result)
+            if report is not None:
+                report(result)
+
+    return {"environment": environment(), "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="转换吞吐量基准测试")
+    parser.add_argument(
+        "--clips",
+        nargs="+",
+        choices=[spec.name for spec in CLIPS],
+        help="要测试的片段，默认全部",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=list(ENGINES),
+        default=list(ENGINES),
+        help="要测试的转换引擎，默认全部",
+    )
+    parser.add_argument("--frames", type=int, help="覆盖各片段的帧数")
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="每个组合重复次数，取最快一次"
+    )
+    parser.add_argument(
+        "--work-dir",
+        default=os.path.join(tempfile.gettempdir(), "sbs-tab-trans-bench"),
+        help="合成片段与临时输出目录，已生成的片段会被复用",
+    )
+    parser.add_argument("-o", "--output", help="JSON 结果文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    clips = [spec for spec in CLIPS if not args.clips or spec.name in args.clips]
+    if args.frames:
+        clips = [
+            spec._replace(name=f"{spec.name}-{args.frames}f", frames=args.frames)
+            for spec in clips
+        ]
+
+    def report(result: Dict) -> None:
+        print(
+            f"{result['clip']['name']:<24} {result['engine']:<10} "
+            f"{result['fps']:8.2f} fps  {result['wall_seconds']:7.2f}s wall  "
+            f"{result['cpu_seconds']:7.2f}s cpu  {result['peak_rss_mb']:8.1f} MB",
+            file=sys.stderr,
+        )
+
+    data = run_benchmarks(clips, args.engines, args.work_dir, args.repeat, report)
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
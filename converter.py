@@ -0,0 +1,568 @@
+import os
+import threading
+import uuid
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import frames_av
+import transformer_av
+import parallel_av
+import probe
+import profiling
+import progress
+import resumable
+import video_info
+
+
+def default_output_path(input_path: str, output_dir: Optional[str] = None) -> str:
+    """默认输出路径：与输入同名并追加 _converted 后缀；标准输入对应标准输出"""
+
+    if input_path == transformer_av.STREAM_PATH:
+        return transformer_av.STREAM_PATH
+    input_dir = os.path.dirname(input_path)
+    input_name = os.path.basename(input_path)
+    name, ext = os.path.splitext(input_name)
+    return os.path.join(
+        input_dir if output_dir is None else output_dir, f"{name}_converted{ext}"
+    )
+
+
+class StagedOutput:
+    """先把输出写入同目录下的临时文件，转换成功后再改名为目标路径
+
+    每个实例使用不同的临时文件名，同一任务的多次尝试（包括被重新领取的任务与仍在
+    运行的旧进程）互不覆盖；失败时只删除本次写下的临时文件，目标路径上已有的文件
+    保持不变。HLS / DASH 分段输出与断点续转的主输出无法整体改名，直接写入目标路径，
+    discard 时仅当目标在转换前不存在才删除（连同 HLS / DASH 的分段与播放列表临时
+    文件）；断点续转的检查点保留，以相同参数重新运行即可继续。
+
+        staged = StagedOutput(output_path, options)
+        try:
+            mode = convert_file(input_path, staged.output_path, **staged.options)
+        except Exception:
+            staged.discard()
+            raise
+        staged.commit()
+    """
+
+    def __init__(self, output_path: str, options: dict):
+        tag = uuid.uuid4().hex[:8]
+        outputs = options.get("outputs") or ()
+        targets = [(output_path, options.get("output_format"))] + [
+            (spec.path, spec.format) for spec in outputs
+        ]
+        self._paths: List[Tuple[str, str]] = []
+        for index, (path, output_format) in enumerate(targets):
+            direct = (
+                path == transformer_av.STREAM_PATH
+                or transformer_av.segmented_output(path, output_format)
+                or (index == 0 and options.get("resume", False))
+            )
+            self._paths.append((path, path if direct else _staged_path(path, tag)))
+        self._existing = {path for path, _ in targets if os.path.exists(path)}
+
+        self.output_path = self._paths[0][1]
+        self.options = dict(options)
+        if outputs:
+            self.options["outputs"] = [
+                spec._replace(path=staged)
+                for spec, (_, staged) in zip(outputs, self._paths[1:])
+            ]
+
+    def commit(self) -> None:
+        for path, staged in self._paths:
+            if staged != path:
+                os.replace(staged, path)
+
+    def discard(self, direct: bool = True) -> None:
+        """删除临时文件；direct 为 False 时保留直接写入目标路径的输出（可能已由其他进程接手）"""
+
+        for path, staged in self._paths:
+            if staged != path:
+                if os.path.isfile(staged):
+                    os.remove(staged)
+            elif (
+                direct
+                and path != transformer_av.STREAM_PATH
+                and path not in self._existing
+            ):
+                for artifact in [path, *transformer_av.segment_files(path)]:
+                    if os.path.isfile(artifact):
+                        os.remove(artifact)
+
+
+def _staged_path(path: str, tag: str) -> str:
+    # 保留扩展名，未指定封装格式时仍按扩展名推断
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{tag}.partial{ext}")
+
+
+# 分割线方向对应的转换模式
+FORMAT_MODES = {
+    video_info.VideoFormat.sbs: "sbs2tab",
+    video_info.VideoFormat.tab: "tab2sbs",
+}
+
+UNDETECTED_MESSAGE = "无法自动检测视频格式，请手动指定转换模式（--mode）"
+
+
+def detect_mode(
+    video_probe: probe.VideoProbe,
+    mode: Optional[str] = None,
+    autodetect_nonstandard: bool = False,
+    split_search: str = "pyramid",
+    split_prefilter: bool = False,
+    early_stop_tolerance: Optional[float] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    inline_frames: Optional[int] = None,
+    check: Optional[Callable[[], None]] = None,
+) -> Tuple[Optional[str], float]:
+    """确定转换模式与分割比例：优先使用指定模式，其次按宽高比判断，最后检测非标准分割线
+
+    给定 inline_frames 或输入为无法抽帧的标准输入时不单独抽帧：没有缓存的检测结果时
+    返回的模式为 None，由转换流程在开头缓存的 inline_frames 个解码帧上检测，
+    输入只解码一次。check 在抽帧检测时每抽取一帧调用一次，用于响应取消。
+    """
+
+    if not mode:
+        detected_format = video_info.get_video_format(
+            video_probe.width, video_probe.height
+        )
+        if detected_format == video_info.VideoFormat.sbs:
+            mode = "sbs2tab"
+        elif detected_format == video_info.VideoFormat.tab:
+            mode = "tab2sbs"
+        else:
+            autodetect_nonstandard = True
+
+    split = 0.5
+    if autodetect_nonstandard and not mode:
+        if video_probe.is_stream or inline_frames is not None:
+            cached = video_probe.cached_inline_split(
+                split_search,
+                split_prefilter,
+                inline_frames or transformer_av.DEFAULT_DETECT_FRAMES,
+            )
+            if cached is None:
+                return None, split
+            format, split = cached
+        else:
+            format, split = video_probe.detect_split(
+                split_search, split_prefilter, early_stop_tolerance, profiler, check
+            )
+        mode = FORMAT_MODES.get(format)
+
+    if not mode:
+        raise ValueError(UNDETECTED_MESSAGE)
+
+    return mode, split
+
+
+def _detect_inline(
+    frames: List[np.ndarray],
+    split_search: str,
+    split_prefilter: bool,
+    record: Optional[Callable[[video_info.VideoFormat, float], None]] = None,
+    check: Optional[Callable[[], None]] = None,
+) -> Tuple[str, float]:
+    """在转换开头缓存的帧上检测分割线；给定 record 时先以检测结果调用它（写入缓存）"""
+
+    format, split = video_info.detect_split_direction_and_position(
+        frames, method=split_search, prefilter=split_prefilter, check=check
+    )
+    if record is not None:
+        record(format, split)
+    mode = FORMAT_MODES.get(format)
+    if not mode:
+        raise ValueError(UNDETECTED_MESSAGE)
+    return mode, split
+
+
+def _inline_detector(
+    video_probe: probe.VideoProbe,
+    inline_frames: int,
+    split_search: str,
+    split_prefilter: bool,
+    check: Optional[Callable[[], None]] = None,
+) -> Callable[[List[np.ndarray]], Tuple[str, float]]:
+    """转换流程使用的内联检测函数，检测结果按检测参数写入 video_probe 的缓存"""
+
+    def record(format: video_info.VideoFormat, split: float) -> None:
+        video_probe.store_inline_split(
+            split_search, split_prefilter, inline_frames, format, split
+        )
+
+    return lambda frames: _detect_inline(
+        frames, split_search, split_prefilter, record, check
+    )
+
+
+def _time_range(
+    rate: Optional[float],
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    start_frame: Optional[int] = None,
+    frame_count: Optional[int] = None,
+) -> Tuple[Optional[float], Optional[float]]:
+    """把以秒或帧数给出的转换范围统一换算为 (起点, 时长) 秒"""
+
+    if start is not None and start_frame is not None:
+        raise ValueError("起点只能以秒或帧数之一指定")
+    if duration is not None and frame_count is not None:
+        raise ValueError("时长只能以秒或帧数之一指定")
+    if start_frame is not None or frame_count is not None:
+        if not rate:
+            raise ValueError("无法获取视频帧率，请以秒为单位指定转换范围")
+        if start_frame is not None:
+            start = start_frame / rate
+        if frame_count is not None:
+            duration = frame_count / rate
+    return start, duration
+
+
+def _range_frames(
+    rate: Optional[float],
+    total_frames: int,
+    start: Optional[float],
+    duration: Optional[float],
+) -> int:
+    """估算转换范围内的帧数，用于进度显示；无法估算时返回 0"""
+
+    if not rate:
+        return 0
+    remaining = total_frames - round((start or 0.0) * rate)
+    if duration is None:
+        return max(remaining, 0)
+    frames = round(duration * rate)
+    return min(frames, remaining) if total_frames > 0 else frames
+
+
+def convert_file(
+    input_path: str,
+    output_path: str,
+    mode: Optional[str] = None,
+    autodetect_nonstandard: bool = False,
+    progress_callback=None,
+    workers: int = 1,
+    pixel_mode: str = "native",
+    pipeline: bool = False,
+    queue_size: int = transformer_av.DEFAULT_QUEUE_SIZE,
+    threads: int = 0,
+    speed: Optional[str] = None,
+    split_search: str = "pyramid",
+    split_prefilter: bool = False,
+    early_stop_tolerance: Optional[float] = None,
+    cache: Optional[probe.ProbeCache] = None,
+    input_format: Optional[str] = None,
+    output_format: Optional[str] = None,
+    memory_limit: Optional[int] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    resume: bool = False,
+    chunk_seconds: float = resumable.DEFAULT_CHUNK_SECONDS,
+    half: bool = False,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    start_frame: Optional[int] = None,
+    frame_count: Optional[int] = None,
+    outputs: Sequence[transformer_av.OutputSpec] = (),
+    cancel_event: Optional[threading.Event] = None,
+    raw_format: Optional[str] = None,
+    inline_detect: Optional[int] = None,
+    segment_seconds: Optional[float] = None,
+) -> str:
+    """检测格式并转换单个文件，返回实际使用的转换模式
+
+    输入文件只打开一次，探测、检测与转换共用同一个容器；给定 cache 时复用已缓存的
+    探测与检测结果。
+    输入/输出路径为 "-" 时读写标准输入/输出，input_format / output_format 指定封装格式；
+    此时需要的非标准分割线检测改在转换开头缓存的若干帧上进行。
+    memory_limit（字节）限制流水线模式下缓冲的画面总量，只能与 pipeline 同时使用。
+    给定 profiler 时记录探测、检测及转换各阶段的耗时。
+    progress_callback 以 progress.Progress 为参数，转换过程中每隔一段时间调用一次，
+    结束时再以 done 为 True 调用一次。
+    speed 为速度档位（fast / balanced / quality），见 transformer_av.convert。
+    resume 为 True 时按约 chunk_seconds 秒的关键帧对齐分段写入检查点，中断后以相同参数
+    重新运行可从断点继续，见 resumable.convert_resumable。
+    half 为 True 时输出与源视频分辨率相同的半宽 SBS / 半高 TAB。
+    start / duration（秒）或 start_frame / frame_count（帧）指定只转换的范围，
+    用于快速预览检测结果或编码设置，见 transformer_av.convert。
+    outputs 为同时写入的其他输出（布局、尺寸、编码器、码率），输入只解码一次。
+    cancel_event 被设置后转换在下一帧（分段模式下为下一个分段）前抛出
+    progress.Cancelled 停止，已打开的容器均会关闭；探测时的帧数扫描与分割线检测
+    同样逐帧（逐个数据包）检查。
+    给定 raw_format（frames_av.ARRAY_FORMATS 中的像素格式）时不编码，把转换后的画面
+    写入 output_path 处内存映射的 .npy 文件，见 frames_av.write_raw。
+    给定 inline_detect 时非标准分割线检测不单独抽帧，改在转换解码的前 inline_detect 帧上
+    进行，检测期间这些帧缓存在内存中，确定分割线后再送入编码器，输入只解码一次；
+    分段转换须预先确定分割线，不能与 workers > 1 或 resume 同时使用。
+    给定 segment_seconds 或 output_path 为 .m3u8 / .mpd 时按分段写入 MP4 分片或
+    HLS / DASH 分段并随之更新播放列表，见 transformer_av.open_output。
+    """
+
+    streaming = transformer_av.STREAM_PATH in (input_path, output_path)
+    if streaming and workers > 1:
+        raise ValueError("标准输入/输出不支持多进程分段转换（--workers）")
+    if memory_limit is not None and not pipeline:
+        raise ValueError("内存上限（--memory-limit）只在流水线模式（--pipeline）下生效")
+    if streaming and resume:
+        raise ValueError("标准输入/输出不支持断点续转（--resume）")
+    ranged = any(
+        value is not None for value in (start, duration, start_frame, frame_count)
+    )
+    if ranged and (workers > 1 or resume):
+        raise ValueError("指定转换范围时不支持多进程分段转换与断点续转")
+    if outputs and (workers > 1 or resume):
+        raise ValueError("同时写入多个输出时不支持多进程分段转换与断点续转")
+    if raw_format is not None and (workers > 1 or resume or outputs or streaming):
+        raise ValueError("原始画面输出不支持多进程分段转换、断点续转、多个输出与标准输入/输出")
+    segmented = transformer_av.segmented_output(
+        output_path, output_format, segment_seconds
+    )
+    if segmented and (workers > 1 or resume or raw_format is not None):
+        raise ValueError("分段输出不支持多进程分段转换、断点续转与原始画面输出")
+    if inline_detect is not None:
+        if inline_detect < 1:
+            raise ValueError(f"内联检测帧数必须为正数，当前：{inline_detect}")
+        if workers > 1 or resume:
+            raise ValueError("内联检测不支持多进程分段转换与断点续转")
+    if streaming and inline_detect is None:
+        inline_detect = transformer_av.DEFAULT_DETECT_FRAMES
+    # 帧数扫描与分割线检测在创建 ProgressTracker 之前进行，逐帧检查是否已被取消
+    check = progress.cancel_check(cancel_event)
+
+    with profiling.stage(profiler, "probe"):
+        video_probe = probe.VideoProbe(
+            input_path, cache, input_format, check, threads, speed
+        )
+
+    with video_probe:
+        mode, split = detect_mode(
+            video_probe,
+            mode,
+            autodetect_nonstandard,
+            split_search,
+            split_prefilter,
+            early_stop_tolerance,
+            profiler,
+            inline_detect,
+            check,
+        )
+        width = video_probe.width
+        height = video_probe.height
+        total_frames = video_probe.total_frames
+        if ranged:
+            start, duration = _time_range(
+                video_probe.rate, start, duration, start_frame, frame_count
+            )
+            total_frames = _range_frames(
+                video_probe.rate, total_frames, start, duration
+            )
+        tracker = None
+        if progress_callback is not None or cancel_event is not None:
+            tracker = progress.ProgressTracker(
+                total_frames,
+                video_probe.rate,
+                progress_callback,
+                cancel_event=cancel_event,
+            )
+            tracker.check_cancelled()
+
+        detector = None
+        if mode is None:
+            inline_detector = _inline_detector(
+                video_probe, inline_detect, split_search, split_prefilter, check
+            )
+
+            def detector(frames: List[np.ndarray]) -> Tuple[str, float]:
+                nonlocal mode
+                mode, split = inline_detector(frames)
+                return mode, split
+
+        if raw_format is not None:
+            frames_av.write_raw(
+                frames_av.iter_frames(
+                    mode,
+                    input_path,
+                    width,
+                    height,
+                    split,
+                    raw_format,
+                    "half" if half else "full",
+                    copy=False,
+                    pixel_mode=pixel_mode,
+                    pipeline=pipeline,
+                    queue_size=queue_size,
+                    threads=threads,
+                    speed=speed,
+                    in_container=video_probe.take_container(),
+                    detector=detector,
+                    detect_frames=inline_detect,
+                    start=start,
+                    duration=duration,
+                    profiler=profiler,
+                ),
+                output_path,
+                total_frames,
+                tracker,
+            )
+        elif resume:
+            resumable.convert_resumable(
+                mode,
+                input_path,
+                output_path,
+                width,
+                height,
+                total_frames,
+                split,
+                workers,
+                tracker,
+                pixel_mode=pixel_mode,
+                threads=threads,
+                speed=speed,
+                profiler=profiler,
+                chunk_seconds=chunk_seconds,
+                half=half,
+                rate=video_probe.rate,
+            )
+        elif workers > 1:
+            parallel_av.convert_parallel(
+                mode,
+                input_path,
+                output_path,
+                width,
+                height,
+                total_frames,
+                split,
+                workers,
+                tracker,
+                pixel_mode=pixel_mode,
+                threads=threads,
+                speed=speed,
+                profiler=profiler,
+                half=half,
+            )
+        else:
+            transformer_av.convert(
+                mode,
+                input_path,
+                output_path,
+                width,
+                height,
+                total_frames,
+                split,
+                tracker,
+                pixel_mode=pixel_mode,
+                pipeline=pipeline,
+                queue_size=queue_size,
+                threads=threads,
+                speed=speed,
+                in_container=video_probe.take_container(),
+                detector=detector,
+                detect_frames=inline_detect,
+                output_format=output_format,
+                memory_limit=memory_limit,
+                profiler=profiler,
+                half=half,
+                start=start,
+                duration=duration,
+                outputs=outputs,
+                segment_seconds=segment_seconds,
+            )
+
+    if tracker is not None:
+        tracker.finish()
+    return mode
+
+
+def read_frames(
+    input_path: str,
+    mode: Optional[str] = None,
+    autodetect_nonstandard: bool = False,
+    pixel_format: str = "rgb24",
+    layout: str = "full",
+    out_width: Optional[int] = None,
+    out_height: Optional[int] = None,
+    copy: bool = True,
+    pixel_mode: str = "native",
+    pipeline: bool = False,
+    queue_size: int = transformer_av.DEFAULT_QUEUE_SIZE,
+    threads: int = 0,
+    speed: Optional[str] = None,
+    split_search: str = "pyramid",
+    split_prefilter: bool = False,
+    early_stop_tolerance: Optional[float] = None,
+    cache: Optional[probe.ProbeCache] = None,
+    input_format: Optional[str] = None,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    start_frame: Optional[int] = None,
+    frame_count: Optional[int] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    inline_detect: Optional[int] = None,
+) -> Iterator[frames_av.ConvertedFrame]:
+    """检测格式后逐帧产出转换后的画面（frames_av.ConvertedFrame），不经过编码
+
+    格式检测与范围参数同 convert_file；pixel_format、layout、out_width / out_height
+    与 copy 见 frames_av.iter_frames。copy 为 False 时产出的数组视图只在取下一帧
+    之前有效。
+    """
+
+    if inline_detect is not None and inline_detect < 1:
+        raise ValueError(f"内联检测帧数必须为正数，当前：{inline_detect}")
+    if input_path == transformer_av.STREAM_PATH and inline_detect is None:
+        inline_detect = transformer_av.DEFAULT_DETECT_FRAMES
+
+    with profiling.stage(profiler, "probe"):
+        video_probe = probe.VideoProbe(
+            input_path, cache, input_format, threads=threads, speed=speed
+        )
+
+    with video_probe:
+        mode, split = detect_mode(
+            video_probe,
+            mode,
+            autodetect_nonstandard,
+            split_search,
+            split_prefilter,
+            early_stop_tolerance,
+            profiler,
+            inline_detect,
+        )
+        if any(
+            value is not None for value in (start, duration, start_frame, frame_count)
+        ):
+            start, duration = _time_range(
+                video_probe.rate, start, duration, start_frame, frame_count
+            )
+
+        yield from frames_av.iter_frames(
+            mode,
+            input_path,
+            video_probe.width,
+            video_probe.height,
+            split,
+            pixel_format,
+            layout,
+            out_width,
+            out_height,
+            copy,
+            pixel_mode=pixel_mode,
+            pipeline=pipeline,
+            queue_size=queue_size,
+            threads=threads,
+            speed=speed,
+            in_container=video_probe.take_container(),
+            detector=(
+                None
+                if mode is not None
+                else _inline_detector(
+                    video_probe, inline_detect, split_search, split_prefilter
+                )
+            ),
+            detect_frames=inline_detect,
+            start=start,
+            duration=duration,
+            profiler=profiler,
+        )
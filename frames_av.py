@@ -0,0 +1,335 @@
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import math
+import os
+import struct
+
+import av
+import numpy as np
+
+import profiling
+import progress
+import transformer_av
+
+
+# 可直接以 (高, 宽, 通道) 数组访问的打包像素格式：通道数与数据类型
+ARRAY_FORMATS = {
+    "rgb24": (3, "u1"),
+    "bgr24": (3, "u1"),
+    "rgba": (4, "u1"),
+    "bgra": (4, "u1"),
+    "gray": (1, "u1"),
+    "rgb48le": (3, "<u2"),
+    "gray16le": (1, "<u2"),
+}
+
+# .npy 文件头（含魔数与长度字段）的固定长度：足以容纳任意帧数的四维形状，
+# 写入过程中改写帧数时数据的偏移保持不变
+RAW_HEADER_SIZE = 128
+
+
+class ConvertedFrame(NamedTuple):
+    """转换后的一帧画面
+
+    index 为从 0 开始的帧序号，pts / time 为源视频流中的显示时间戳及对应的秒数
+    （未知时为 None）；array 为 (高, 宽, 通道) 的数组，gray 类格式为 (高, 宽)。
+    """
+
+    index: int
+    pts: Optional[int]
+    time: Optional[float]
+    array: np.ndarray
+
+
+def frame_array(frame: av.VideoFrame) -> np.ndarray:
+    """以数组视图访问打包像素格式的帧数据，不复制；视图在帧被复用或释放前有效"""
+
+    format_name = frame.format.name
+    if format_name not in ARRAY_FORMATS:
+        raise ValueError(f"不支持以数组输出的像素格式: {format_name}")
+    channels, dtype = ARRAY_FORMATS[format_name]
+    dtype = np.dtype(dtype)
+    plane = frame.planes[0]
+    array = np.ndarray(
+        (frame.height, frame.width, channels),
+        dtype=dtype,
+        buffer=plane,
+        strides=(plane.line_size, channels * dtype.itemsize, dtype.itemsize),
+    )
+    return array[..., 0] if channels == 1 else array
+
+
+def _convert_frames(
+    items: Iterable,
+    layout: transformer_av.Layout,
+    width: int,
+    height: int,
+    pixel_format: str,
+    pixel_mode: str,
+    pool: transformer_av.FramePool,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Iterator[av.VideoFrame]:
+    """按布局重排视频帧并转换到 pixel_format，缩放在同一次 reformat 中完成"""
+
+    if pixel_mode == "filter":
+        filter_frame = profiling.wrap(
+            profiler, "filter", transformer_av.FilterArranger(layout, width, height)
+        )
+        for _, frame in items:
+            yield filter_frame(frame, pixel_format)
+        return
+
+    arrange = profiling.wrap(profiler, "rearrange", transformer_av._arrange)
+    to_format = profiling.wrap(
+        profiler, "reformat", transformer_av._to_encoder_format
+    )
+
+    for _, frame in items:
+        arranged = arrange(frame, layout, width, height, pixel_mode, pool)
+        yield to_format(arranged, frame, layout, pixel_format, pool)
+
+
+def iter_frames(
+    mode: Optional[str],
+    input_path: str,
+    width: int,
+    height: int,
+    split: float,
+    pixel_format: str = "rgb24",
+    layout: str = "full",
+    out_width: Optional[int] = None,
+    out_height: Optional[int] = None,
+    copy: bool = True,
+    pixel_mode: str = "native",
+    pipeline: bool = False,
+    queue_size: int = transformer_av.DEFAULT_QUEUE_SIZE,
+    threads: int = 0,
+    speed: Optional[str] = None,
+    in_container=None,
+    detector: Optional[Callable[[List[np.ndarray]], Tuple[str, float]]] = None,
+    detect_frames: int = transformer_av.DEFAULT_DETECT_FRAMES,
+    input_format: Optional[str] = None,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Iterator[ConvertedFrame]:
+    """逐帧产出转换后的画面，不经过编码，供进程内的下游处理（深度估计、质检等）使用
+
+    首个视频流的每一帧按 mode 与 split 重排，layout（见 transformer_av.OUTPUT_LAYOUTS）
+    与 out_width / out_height 指定输出布局和尺寸，再转换到 ARRAY_FORMATS 中的
+    pixel_format。copy 为 False 时产出指向内部帧缓冲区的数组视图，不做任何复制，
+    视图只在取下一帧之前有效，需要保留时由调用方自行复制。
+    其余参数与 transformer_av.convert 相同：mode 为 None 时在开头缓存的
+    detect_frames 帧上调用 detector 得到 (mode, split)；start / duration（秒）
+    限定时间范围，先定位到起点之前最近的关键帧。
+    """
+
+    if pixel_format not in ARRAY_FORMATS:
+        raise ValueError(f"不支持以数组输出的像素格式: {pixel_format}")
+    if pixel_mode not in transformer_av.PIXEL_MODES:
+        raise ValueError(f"不支持的像素处理模式: {pixel_mode}")
+    if (start is not None and start < 0) or (duration is not None and duration <= 0):
+        raise ValueError(f"无效的时间范围：起点 {start}，时长 {duration}")
+    if mode is None and detector is None:
+        raise ValueError("未指定转换模式时必须提供分割线检测函数")
+    threads = transformer_av._resolve_threads(threads, speed)
+    spec = transformer_av.OutputSpec("", layout, out_width, out_height)
+
+    with transformer_av._open_input(
+        input_path, in_container, input_format
+    ) as in_container:
+        video_stream = in_container.streams.video[0]
+        transformer_av._configure_decoders(
+            [video_stream.codec_context], threads, speed
+        )
+
+        pool_size, queue_size = transformer_av.plan_buffers(
+            transformer_av._frame_bytes(pixel_format, width, height),
+            pipeline,
+            queue_size,
+        )
+        pool = transformer_av.FramePool(pool_size)
+
+        start_pts = end_pts = None
+        if start or duration is not None:
+            start_pts, end_pts = transformer_av._range_pts(
+                video_stream, start, duration
+            )
+            if start_pts is not None and input_path != transformer_av.STREAM_PATH:
+                in_container.seek(start_pts, backward=True, stream=video_stream)
+
+        stages = [
+            transformer_av._demux_decode(
+                in_container, [video_stream.index], start_pts, end_pts, profiler
+            )
+        ]
+        try:
+            if pipeline:
+                stages.append(transformer_av._prefetch(stages[-1], queue_size))
+
+            if mode is None:
+                buffered, replay = transformer_av._lookahead(stages[-1], detect_frames)
+                stages.append(replay)
+                with profiling.stage(profiler, "detect.search"):
+                    mode, split = detector(
+                        [frame.to_ndarray(format="bgr24") for _, frame in buffered]
+                    )
+
+            stages.append(
+                _convert_frames(
+                    stages[-1],
+                    transformer_av.plan_output(mode, width, height, split, spec),
+                    width,
+                    height,
+                    pixel_format,
+                    pixel_mode,
+                    pool,
+                    profiler,
+                )
+            )
+            if pipeline:
+                stages.append(transformer_av._prefetch(stages[-1], queue_size))
+
+            for index, frame in enumerate(stages[-1]):
+                array = frame_array(frame)
+                yield ConvertedFrame(
+                    index, frame.pts, frame.time, array.copy() if copy else array
+                )
+                # 调用方取下一帧时才归还，此前产出的视图一直有效
+                pool.release(frame)
+        finally:
+            pool.close()
+            for stage in reversed(stages):
+                stage.close()
+
+
+def timestamps_path(path: str) -> str:
+    """原始画面文件对应的时间戳文件：frames.npy -> frames.pts.npy"""
+
+    root, _ = os.path.splitext(path)
+    return f"{root}.pts.npy"
+
+
+class RawWriter:
+    """把画面逐帧写入内存映射的 .npy 文件，其他进程可用 np.load(path, mmap_mode="r")
+    直接映射读取，无需编码或复制
+
+    文件按 capacity 帧预先分配，写满时容量加倍。写入过程中文件头记录的是已分配的
+    帧数；close 时截断到实际写入的帧数并改写文件头，同时把各帧的时间戳（秒，
+    未知为 NaN）写入 timestamps_path 对应的文件。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        frame_shape: Tuple[int, ...],
+        dtype: np.dtype,
+        capacity: int = 0,
+    ):
+        self.path = path
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = math.prod(self.frame_shape) * self.dtype.itemsize
+        self.count = 0
+        self.capacity = 0
+        self._times: List[float] = []
+        self._array: Optional[np.memmap] = None
+        self._file = open(path, "w+b")
+        try:
+            self._reserve(max(capacity, 1))
+        except BaseException:
+            self._file.close()
+            raise
+
+    @property
+    def bytes_written(self) -> int:
+        return RAW_HEADER_SIZE + self.count * self.frame_bytes
+
+    def _write_header(self, frames: int) -> None:
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (frames, *self.frame_shape),
+            }
+        )
+        # 版本 1.0：魔数、版本号、2 字节头长度，头部以空格补齐并以换行结尾
+        length = RAW_HEADER_SIZE - 10
+        if len(header) + 1 > length:
+            raise ValueError(f"画面尺寸过大，无法写入 .npy 文件头: {self.frame_shape}")
+        self._file.seek(0)
+        self._file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", length))
+        self._file.write(header.ljust(length - 1).encode("latin1") + b"\n")
+        self._file.flush()
+
+    def _reserve(self, capacity: int) -> None:
+        if self._array is not None:
+            self._array.flush()
+            self._array = None
+        self._file.truncate(RAW_HEADER_SIZE + capacity * self.frame_bytes)
+        self._write_header(capacity)
+        self._array = np.memmap(
+            self._file,
+            dtype=self.dtype,
+            mode="r+",
+            offset=RAW_HEADER_SIZE,
+            shape=(capacity, *self.frame_shape),
+        )
+        self.capacity = capacity
+
+    def append(self, array: np.ndarray, time: Optional[float] = None) -> None:
+        if array.shape != self.frame_shape:
+            raise ValueError(f"画面形状不一致: {array.shape}，应为 {self.frame_shape}")
+        if self.count >= self.capacity:
+            self._reserve(self.capacity * 2)
+        self._array[self.count] = array
+        self._times.append(math.nan if time is None else time)
+        self.count += 1
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        try:
+            self._array.flush()
+            self._array = None
+            self._file.truncate(self.bytes_written)
+            self._write_header(self.count)
+        finally:
+            self._file.close()
+        np.save(timestamps_path(self.path), np.array(self._times, dtype=np.float64))
+
+    def __enter__(self) -> "RawWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_raw(
+    frames: Iterable[ConvertedFrame],
+    path: str,
+    capacity: int = 0,
+    tracker: Optional[progress.ProgressTracker] = None,
+) -> int:
+    """把 iter_frames 产出的画面写入内存映射的 .npy 文件，返回写入的帧数
+
+    capacity 为预计的帧数（如探测得到的总帧数），用于预先分配文件；给定 tracker 时
+    每写入一帧更新一次进度。iter_frames 以 copy=False 产出视图时，每帧只在写入
+    映射时复制一次。
+    """
+
+    writer = None
+    try:
+        for frame in frames:
+            if writer is None:
+                writer = RawWriter(
+                    path, frame.array.shape, frame.array.dtype, capacity
+                )
+            writer.append(frame.array, frame.time)
+            if tracker is not None:
+                tracker.update(writer.count, writer.bytes_written, writer.bytes_written)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("没有可写入的画面")
+    return writer.count
@@ -0,0 +1,323 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional
+import json
+import os
+import sqlite3
+import time
+
+
+# 任务状态：queued 等待领取（含等待重试），running 已被某个工作进程租用，
+# done / failed / cancelled 为终态
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+# 租约时长（秒）：工作进程须在到期前续约，否则任务被视为失联并重新入队
+DEFAULT_LEASE_SECONDS = 60.0
+# 每个任务最多尝试的次数（含租约过期）
+DEFAULT_MAX_ATTEMPTS = 3
+# 首次重试前的等待时间（秒），之后每次加倍
+DEFAULT_RETRY_DELAY = 30.0
+# 等待其他进程释放数据库锁的最长时间（秒）
+DEFAULT_BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    progress TEXT,
+    mode TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+"""
+
+
+class Job(NamedTuple):
+    id: int
+    input_path: str
+    output_path: str
+    options: Dict
+    priority: int
+    status: str
+    attempts: int
+    max_attempts: int
+    worker: Optional[str]
+    lease_expires: Optional[float]
+    not_before: float
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+    error: Optional[str]
+    progress: Optional[Dict]  # 最近一次的 progress.Progress.to_dict()
+    mode: Optional[str]  # 完成后实际使用的转换模式
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+
+def _job(row: sqlite3.Row) -> Job:
+    values = dict(row)
+    values["options"] = json.loads(values["options"])
+    values["progress"] = json.loads(values["progress"]) if values["progress"] else None
+    return Job(**values)
+
+
+class JobQueue:
+    """基于 SQLite 的持久化转换任务队列，多个进程、多个节点可以同时领取任务
+
+    领取、续约与状态变更都在 BEGIN IMMEDIATE 事务中完成，同一任务不会被两个工作进程
+    同时租用。数据库放在共享存储上供多个节点使用时，使用默认的回滚日志模式
+    （WAL 依赖共享内存，不能跨节点），且共享文件系统须支持 POSIX 文件锁；
+    各节点的时钟应保持同步，租约以墙钟时间计算。
+    连接不能跨线程或进程共享，每个线程 / 进程各自创建 JobQueue。
+    """
+
+    def __init__(self, path: str, busy_timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            path, timeout=busy_timeout, isolation_level=None
+        )
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def submit(
+        self,
+        input_path: str,
+        output_path: str,
+        options: Optional[Dict] = None,
+        priority: int = 0,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> int:
+        """加入一个任务并返回任务号；options 为传给 converter.convert_file 的参数（须可
+        序列化为 JSON），priority 越大越先被领取，同优先级按提交顺序"""
+
+        if max_attempts < 1:
+            raise ValueError(f"最大尝试次数必须为正数，当前：{max_attempts}")
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO jobs (input_path, output_path, options, priority,"
+                " max_attempts, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    input_path,
+                    output_path,
+                    json.dumps(options or {}, ensure_ascii=False),
+                    priority,
+                    max_attempts,
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid
+
+    def _expire_leases(self, connection: sqlite3.Connection, now: float) -> None:
+        """把租约已过期（工作进程失联）的任务重新入队，尝试次数用尽的记为失败"""
+
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', finished = ?, worker = NULL,"
+            " lease_expires = NULL, error = '租约过期：工作进程失联'"
+            " WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+            (now, now),
+        )
+        connection.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = NULL,"
+            " error = '租约过期：工作进程失联', not_before = ?"
+            " WHERE status = 'running' AND lease_expires < ?",
+            (now, now),
+        )
+
+    def claim(
+        self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ) -> Optional[Job]:
+        """领取优先级最高的一个待处理任务并租用 lease_seconds 秒，没有任务时返回 None"""
+
+        now = time.time()
+        with self._transaction() as connection:
+            self._expire_leases(connection, now)
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' AND not_before <= ?"
+                " ORDER BY priority DESC, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?,"
+                " attempts = attempts + 1, started = ?, progress = NULL WHERE id = ?",
+                (worker, now + lease_seconds, now, row["id"]),
+            )
+            return _job(
+                connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            )
+
+    def _update_leased(self, job_id: int, worker: str, assignments: str, values) -> bool:
+        """只在任务仍由 worker 租用时更新，返回是否更新成功"""
+
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f"UPDATE jobs SET {assignments}"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (*values, job_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def renew(
+        self,
+        job_id: int,
+        worker: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        progress: Optional[Dict] = None,
+    ) -> bool:
+        """续约并记录进度；任务已被取消或租约已被收回时返回 False，工作进程应停止转换"""
+
+        if progress is None:
+            return self._update_leased(
+                job_id, worker, "lease_expires = ?", (time.time() + lease_seconds,)
+            )
+        return self._update_leased(
+            job_id,
+            worker,
+            "lease_expires = ?, progress = ?",
+            (time.time() + lease_seconds, json.dumps(progress)),
+        )
+
+    def complete(
+        self,
+        job_id: int,
+        worker: str,
+        mode: Optional[str] = None,
+        progress: Optional[Dict] = None,
+    ) -> bool:
+        return self._update_leased(
+            job_id,
+            worker,
+            "status = 'done', finished = ?, worker = NULL, lease_expires = NULL,"
+            " error = NULL, mode = ?, progress = coalesce(?, progress)",
+            (time.time(), mode, None if progress is None else json.dumps(progress)),
+        )
+
+    def fail(
+        self,
+        job_id: int,
+        worker: str,
+        error: str,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+    ) -> Optional[str]:
+        """记录失败：尝试次数未用尽时按指数退避重新入队，返回任务的新状态；
+        任务已不由 worker 租用时返回 None"""
+
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT attempts, max_attempts FROM jobs"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] >= row["max_attempts"]:
+                status, not_before, finished = "failed", now, now
+            else:
+                status = "queued"
+                not_before = now + retry_delay * 2 ** (row["attempts"] - 1)
+                finished = None
+            connection.execute(
+                "UPDATE jobs SET status = ?, not_before = ?, finished = ?, error = ?,"
+                " worker = NULL, lease_expires = NULL WHERE id = ?",
+                (status, not_before, finished, error, job_id),
+            )
+            return status
+
+    def release(self, job_id: int, worker: str) -> bool:
+        """工作进程退出前归还未开始处理的任务，不计入尝试次数"""
+
+        return self._update_leased(
+            job_id,
+            worker,
+            "status = 'queued', worker = NULL, lease_expires = NULL,"
+            " attempts = attempts - 1, started = NULL",
+            (),
+        )
+
+    def cancel(self, job_id: int) -> bool:
+        """取消等待中或运行中的任务；运行中的任务由工作进程在下次续约时发现并停止"""
+
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ?, worker = NULL,"
+                " lease_expires = NULL WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+            return cursor.rowcount == 1
+
+    def retry(self, job_id: int) -> bool:
+        """把失败或已取消的任务重新入队，尝试次数清零"""
+
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, not_before = 0,"
+                " finished = NULL, error = NULL, progress = NULL"
+                " WHERE id = ? AND status IN ('failed', 'cancelled')",
+                (job_id,),
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id: int) -> Optional[Job]:
+        row = self._connection.execute(
+            "SELECT * FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return None if row is None else _job(row)
+
+    def jobs(self, status: Optional[str] = None) -> List[Job]:
+        """按任务号列出任务，可只列出某一状态"""
+
+        if status is not None and status not in JOB_STATUSES:
+            raise ValueError(f"未知的任务状态: {status}")
+        if status is None:
+            rows = self._connection.execute("SELECT * FROM jobs ORDER BY id")
+        else:
+            rows = self._connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)
+            )
+        return [_job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数"""
+
+        counts = {status: 0 for status in JOB_STATUSES}
+        for row in self._connection.execute(
+            "SELECT status, count(*) AS n FROM jobs GROUP BY status"
+        ):
+            counts[row["status"]] = row["n"]
+        return counts
@@ -1,11 +1,19 @@
 import os
 import sys
 import av
-import cv2
 import argparse
 
+import batch
+import converter
+import frames_av
+import job_queue
 import transformer_av
 import path_check
+import presets
+import probe
+import profiling
+import progress
+import resumable
 import video_info
 
 
@@ -45,9 +53,63 @@ def main() -> None:
         description="3D视频格式转换器：支持SBS与TAB互相转换"
     )
 
-    parser.add_argument("input", help="输入视频文件路径")
+    parser.add_argument(
+        "input",
+        nargs="+",
+        help="输入视频文件路径（多个文件、目录或通配符时进入批量模式，- 表示标准输入）",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="输出视频文件路径（批量模式下为输出目录，默认与输入文件同目录，- 表示标准输出）",
+    )
+
+    parser.add_argument(
+        "--add-output",
+        action="append",
+        type=parse_output_spec,
+        default=[],
+        metavar="SPEC",
+        help="同时写入的其他输出，可重复指定，输入只解码一次。格式为 路径[,键=值...]，"
+        f"键为 layout（{'/'.join(transformer_av.OUTPUT_LAYOUTS)}）、size（如 1920x1080、"
+        "1920x 或 x1080）、codec、bitrate（如 4M）、format、segment（分段秒数，见 --segment），"
+        "例如 left.mp4,layout=left,codec=libx265,bitrate=4M（仅单文件模式）",
+    )
+
+    parser.add_argument(
+        "--raw",
+        nargs="?",
+        const="rgb24",
+        choices=list(frames_av.ARRAY_FORMATS),
+        metavar="PIXFMT",
+        help="不编码，把转换后的画面写入内存映射的 NumPy 文件（.npy，时间戳写入同名 .pts.npy），"
+        f"供其他进程直接映射读取；可指定像素格式（{'/'.join(frames_av.ARRAY_FORMATS)}），"
+        "默认 rgb24（仅单文件模式）",
+    )
+
+    parser.add_argument(
+        "--segment",
+        nargs="?",
+        type=float,
+        const=transformer_av.DEFAULT_SEGMENT_SECONDS,
+        metavar="SECONDS",
+        help="分段写入，下游可在转换开始后数秒内开始上传或播放：输出为 .m3u8 / .mpd 时写入 "
+        "HLS / DASH 分片 MP4 分段并在每个分段完成时更新播放列表（此时默认分段 "
+        f"{transformer_av.DEFAULT_SEGMENT_SECONDS:g} 秒），MP4/MOV 按分段写为分片，"
+        "分段边界强制插入关键帧。不能与 --workers、--resume、--raw 同时使用",
+    )
+
+    parser.add_argument(
+        "--input-format",
+        help="输入封装格式（如 mpegts、matroska），从标准输入读取且无法自动识别时指定",
+    )
 
-    parser.add_argument("-o", "--output", help="输出视频文件路径")
+    parser.add_argument(
+        "--format",
+        help=f"输出封装格式，写入标准输出时默认 {transformer_av.DEFAULT_STREAM_FORMAT}，"
+        "mp4/mov 会改为分片写入",
+    )
 
     parser.add_argument(
         "-m",
@@ -56,6 +118,34 @@ def main() -> None:
         help="转换模式：sbs2tab(SBS转TAB) 或 tab2sbs(TAB转SBS)",
     )
 
+    parser.add_argument(
+        "--half",
+        action="store_true",
+        help="输出半高TAB / 半宽SBS：保持源视频分辨率，两路视图各压缩一半",
+    )
+
+    parser.add_argument(
+        "--start",
+        type=parse_time,
+        metavar="TIME",
+        help="只转换从该时间点开始的部分（秒，或 [时:]分:秒），定位到其前最近的关键帧后开始解码",
+    )
+
+    parser.add_argument(
+        "--duration",
+        type=parse_time,
+        metavar="TIME",
+        help="只转换该时长（秒，或 [时:]分:秒），与 --start 配合用于快速预览",
+    )
+
+    parser.add_argument(
+        "--start-frame", type=int, metavar="N", help="以帧序号指定起点，代替 --start"
+    )
+
+    parser.add_argument(
+        "--frame-count", type=int, metavar="N", help="以帧数指定转换长度，代替 --duration"
+    )
+
     parser.add_argument(
         "-a",
         "--autodetect-nonstandard",
@@ -63,79 +153,444 @@ def main() -> None:
         help="启用非标准分割线检测（适用于非对称分割的视频）",
     )
 
-    parser.add_argument("-v", "--verbose", action="store_true", help="显示详细转换进度")
+    parser.add_argument(
+        "--inline-detect",
+        nargs="?",
+        type=int,
+        const=transformer_av.DEFAULT_DETECT_FRAMES,
+        metavar="N",
+        help="非标准分割线检测不单独抽帧，改在转换解码的前 N 帧（默认 "
+        f"{transformer_av.DEFAULT_DETECT_FRAMES}）上进行，检测期间这些帧缓存在内存中，"
+        "输入只解码一次；标准输入总是如此检测。不能与 --workers、--resume 同时使用",
+    )
+
+    parser.add_argument(
+        "--split-search",
+        choices=list(video_info.SPLIT_SEARCH_METHODS),
+        default="pyramid",
+        help="非标准分割线搜索方式：pyramid(由粗到精) 或 exhaustive(逐像素穷举，参考实现)",
+    )
+
+    parser.add_argument(
+        "--split-prefilter",
+        action="store_true",
+        help="分割线搜索前先用行/列投影相关性预筛选候选位置",
+    )
+
+    parser.add_argument(
+        "--early-stop",
+        type=float,
+        metavar="TOL",
+        help="非标准分割检测的提前停止容差：已有 3 帧的分割比例相差不超过 TOL 时停止抽帧",
+    )
+
+    parser.add_argument(
+        "--pixel-mode",
+        choices=list(transformer_av.PIXEL_MODES),
+        default="native",
+        help="像素处理模式（重排引擎）：native(在解码器原生像素格式上按平面重排)、rgb(转换为RGB后拼接)"
+        " 或 filter(在 libav 滤镜图中裁剪、拼接并转换像素格式)",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="启用流水线模式：解码、画面重排、编码/封装在独立线程中并行执行",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=transformer_av.DEFAULT_QUEUE_SIZE,
+        help="流水线模式下各阶段之间的队列容量（帧数），用于限制内存占用",
+    )
+
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        metavar="MB",
+        help="流水线模式下缓冲画面的内存上限（MB），超出时自动缩小队列容量；"
+        "须与 --pipeline 同时使用",
+    )
+
+    parser.add_argument(
+        "--speed",
+        choices=list(presets.SPEED_PRESETS),
+        help="速度档位：编解码器启用多线程并按编码器选用对应预设（fast 最快，quality 画质最好），"
+        "默认保持编码器自身的默认设置",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        help="视频解码器与编码器各自的线程数，默认按进程可用的 CPU 数（考虑亲和性与 cgroup 限制）推算",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="并行转换的工作进程数：大于1时按关键帧分段，多进程转换后无损拼接",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="断点续转：按关键帧分段写入检查点（输出路径加 .parts 目录），"
+        "中断后以相同命令重新运行时跳过已完成的分段",
+    )
+
+    parser.add_argument(
+        "--chunk-seconds",
+        type=float,
+        default=resumable.DEFAULT_CHUNK_SECONDS,
+        help="断点续转模式下每个分段的目标时长（秒）",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="批量模式下同时转换的文件数，默认按 CPU 数与每个任务的编解码线程数推算",
+    )
+
+    parser.add_argument(
+        "-r", "--recursive", action="store_true", help="批量模式下递归查找子目录"
+    )
+
+    parser.add_argument(
+        "--skip-existing", action="store_true", help="输出文件已存在时跳过该文件"
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        help=f"探测/检测结果缓存目录（默认 ${probe.CACHE_DIR_ENV} 或 {probe.DEFAULT_CACHE_DIR}）",
+    )
+
+    parser.add_argument(
+        "--no-cache", action="store_true", help="不读取也不写入探测/检测结果缓存"
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="JSON",
+        help="统计解复用/解码/重排/编码/封装及格式检测各阶段耗时，结束时输出摘要；"
+        "给定路径时同时写入 JSON 报告（仅单文件模式）",
+    )
+
+    parser.add_argument(
+        "--progress",
+        choices=["human", "json"],
+        help="输出转换进度（帧数、速度、写入字节数、码率与剩余时间）到标准错误：human 为单行"
+        "刷新的可读格式，json 为每行一个 JSON 对象（仅单文件模式）",
+    )
+
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="显示详细转换进度，同 --progress human"
+    )
+
+    parser.add_argument(
+        "--queue",
+        metavar="DB",
+        help="不在本进程中转换，而是把任务加入该 SQLite 任务队列，由 worker.py run 领取转换",
+    )
+
+    parser.add_argument(
+        "--priority",
+        type=int,
+        default=0,
+        help="加入任务队列时的优先级，数值越大越先被领取",
+    )
+
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=job_queue.DEFAULT_MAX_ATTEMPTS,
+        help="加入任务队列时每个任务最多尝试的次数（失败后按指数退避重试）",
+    )
 
     args = parser.parse_args()
     # args = parser.parse_args(["test.mp4", "-m", "sbs2tab"])  # 测试用
 
+    if args.memory_limit is not None and not args.pipeline:
+        # 其他转换方式不缓冲画面，内存上限不起作用，不应静默忽略
+        print("转换失败: --memory-limit 只在流水线模式下生效，请同时指定 --pipeline", file=sys.stderr)
+        sys.exit(1)
+
+    if args.queue:
+        run_enqueue(args)
+        return
+
+    if batch.is_batch_input(args.input):
+        run_batch(args)
+        return
+
     try:
-        input_path = path_check.validate_input_path(args.input)
+        input_path = path_check.validate_input_path(args.input[0])
 
         if not args.output:
-            input_dir = os.path.dirname(args.input)
-            input_name = os.path.basename(args.input)
-            name, ext = os.path.splitext(input_name)
-            default_output = os.path.join(input_dir, f"{name}_converted{ext}")
-            args.output = default_output
+            args.output = converter.default_output_path(input_path)
+            if args.raw:
+                args.output = os.path.splitext(args.output)[0] + ".npy"
         output_path = path_check.validate_output_dir(args.output)
 
-        if os.path.abspath(input_path) == os.path.abspath(output_path):
+        if (
+            output_path != path_check.STREAM_PATH
+            and os.path.abspath(input_path) == os.path.abspath(output_path)
+        ):
+            raise ValueError("输入文件和输出文件不能相同")
+
+        outputs = [
+            spec._replace(path=path_check.validate_output_dir(spec.path))
+            for spec in args.add_output
+        ]
+        all_paths = [output_path] + [spec.path for spec in outputs]
+        if len({os.path.abspath(path) for path in all_paths}) != len(all_paths):
+            raise ValueError("多个输出不能写入同一文件")
+        if os.path.abspath(input_path) in map(os.path.abspath, all_paths[1:]):
             raise ValueError("输入文件和输出文件不能相同")
 
-        def progress_callback(percent: float) -> None:
-            if args.verbose:
-                print(f"转换进度: {percent:.1f}%", end="\r", file=sys.stderr)
+        if (
+            args.skip_existing
+            and output_path != path_check.STREAM_PATH
+            and os.path.exists(output_path)
+        ):
+            print(f"输出文件已存在，跳过: {output_path}", file=sys.stderr)
+            return
 
-        width, height, total_frames = video_info.get_video_info(input_path)
+        progress_format = args.progress or ("human" if args.verbose else None)
 
-        if not args.mode:
-            detected_format = video_info.get_video_format(width, height)
-            if detected_format == video_info.VideoFormat.sbs:
-                args.mode = "sbs2tab"
-            elif detected_format == video_info.VideoFormat.tab:
-                args.mode = "tab2sbs"
+        def progress_callback(snapshot: progress.Progress) -> None:
+            if progress_format == "json":
+                print(progress.format_json(snapshot), file=sys.stderr, flush=True)
             else:
-                args.autodetect_nonstandard = True
-
-        split = 0.5
-        if args.autodetect_nonstandard and not args.mode:
-            frames = video_info.sample_frames(input_path)
-            format, split = video_info.detect_split_direction_and_position(frames)
-            if format is video_info.VideoFormat.sbs:
-                args.mode = "sbs2tab"
-            elif format is video_info.VideoFormat.tab:
-                args.mode = "tab2sbs"
-
-        if not args.mode:
-            raise ValueError("无法自动检测视频格式，请手动指定转换模式（--mode）")
-
-        if args.mode == "sbs2tab":
-            transformer_av.sbs_to_tab(
-                input_path,
-                output_path,
-                width,
-                height,
-                total_frames,
-                split,
-                progress_callback if args.verbose else None,
-            )
+                # 补齐空格覆盖上一次较长的输出
+                line = progress.format_human(snapshot).ljust(79)
+                print(line, end="\r", file=sys.stderr)
+
+        profiler = None if args.profile is None else profiling.Profiler()
+
+        converter.convert_file(
+            input_path,
+            output_path,
+            progress_callback=progress_callback if progress_format else None,
+            workers=args.workers,
+            input_format=args.input_format,
+            output_format=args.format,
+            profiler=profiler,
+            outputs=outputs,
+            raw_format=args.raw,
+            **conversion_options(args),
+        )
+
+        if profiler is not None:
+            print(f"\n{profiler.summary()}", file=sys.stderr)
+            if args.profile:
+                profiler.write(args.profile)
+
+        names = [
+            "标准输出" if path == path_check.STREAM_PATH else path for path in all_paths
+        ]
+        print(f"\n转换完成！输出文件: {', '.join(names)}", file=sys.stderr)
+
+    except Exception as e:
+        print(f"转换失败: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _parse_bit_rate(text: str) -> int:
+    units = {"k": 10**3, "m": 10**6, "g": 10**9}
+    scale = units.get(text[-1:].lower(), 1)
+    return int(float(text[:-1] if scale != 1 else text) * scale)
+
+
+def parse_output_spec(text: str) -> transformer_av.OutputSpec:
+    """解析 --add-output 的 路径[,键=值...]"""
+
+    path, *items = text.split(",")
+    spec = transformer_av.OutputSpec(path)
+    try:
+        for item in items:
+            key, value = item.split("=", 1)
+            if key == "layout":
+                if value not in transformer_av.OUTPUT_LAYOUTS:
+                    raise ValueError(value)
+                spec = spec._replace(layout=value)
+            elif key == "size":
+                width, height = value.lower().split("x")
+                spec = spec._replace(
+                    width=int(width) if width else None,
+                    height=int(height) if height else None,
+                )
+            elif key == "codec":
+                spec = spec._replace(codec=value)
+            elif key == "bitrate":
+                spec = spec._replace(bit_rate=_parse_bit_rate(value))
+            elif key == "format":
+                spec = spec._replace(format=value)
+            elif key == "segment":
+                spec = spec._replace(segment_seconds=float(value))
+            else:
+                raise ValueError(key)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的输出规格: {text}")
+    if not path:
+        raise argparse.ArgumentTypeError(f"无效的输出规格: {text}")
+    return spec
+
+
+def parse_time(text: str) -> float:
+    """解析秒数或 [时:]分:秒 格式的时间"""
+
+    try:
+        seconds = 0.0
+        for part in text.split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间: {text}")
+    if seconds < 0 or text.count(":") > 2:
+        raise argparse.ArgumentTypeError(f"无效的时间: {text}")
+    return seconds
+
+
+def conversion_options(args: argparse.Namespace) -> dict:
+    """单文件与批量模式共用的转换参数"""
+
+    options = {
+        "mode": args.mode,
+        "autodetect_nonstandard": args.autodetect_nonstandard,
+        "pixel_mode": args.pixel_mode,
+        "pipeline": args.pipeline,
+        "queue_size": args.queue_size,
+        "memory_limit": args.memory_limit << 20 if args.memory_limit else None,
+        "split_search": args.split_search,
+        "split_prefilter": args.split_prefilter,
+        "early_stop_tolerance": args.early_stop,
+        "inline_detect": args.inline_detect,
+        "segment_seconds": args.segment,
+        "cache": None if args.no_cache else probe.ProbeCache(args.cache_dir),
+        "speed": args.speed,
+        "resume": args.resume,
+        "chunk_seconds": args.chunk_seconds,
+        "half": args.half,
+        "start": args.start,
+        "duration": args.duration,
+        "start_frame": args.start_frame,
+        "frame_count": args.frame_count,
+    }
+    # 未指定时由单文件转换或批量模式各自推算线程数
+    if args.threads:
+        options["threads"] = args.threads
+    return options
+
+
+def run_enqueue(args: argparse.Namespace) -> None:
+    """把单个文件或批量输入加入任务队列，转换参数随任务一起保存"""
+
+    try:
+        if args.workers > 1:
+            raise ValueError("加入任务队列时不支持 -j，由各节点的 worker 并发处理任务")
+        if path_check.STREAM_PATH in args.input or args.output == path_check.STREAM_PATH:
+            raise ValueError("任务队列不支持标准输入/输出")
+
+        options = conversion_options(args)
+        # 探测缓存由各 worker 按自身的 --cache-dir / --no-cache 设置
+        del options["cache"]
+        if args.format:
+            options["output_format"] = args.format
+        if args.raw and args.add_output:
+            raise ValueError("--raw 不能与 --add-output 同时使用")
+
+        if batch.is_batch_input(args.input):
+            if args.add_output or args.raw:
+                raise ValueError("批量加入任务队列时不支持 --add-output 与 --raw")
+            pairs = [
+                (input_path, converter.default_output_path(input_path, args.output))
+                for input_path in batch.collect_inputs(args.input, args.recursive)
+            ]
+            if not pairs:
+                raise FileNotFoundError(f"未找到可转换的视频文件: {' '.join(args.input)}")
         else:
-            transformer_av.tab_to_sbs(
-                input_path,
-                output_path,
-                width,
-                height,
-                total_frames,
-                split,
-                progress_callback if args.verbose else None,
-            )
-
-        print(f"\n转换完成！输出文件: {output_path}", file=sys.stderr)
+            input_path = path_check.validate_input_path(args.input[0])
+            output_path = args.output or converter.default_output_path(input_path)
+            if args.raw and not args.output:
+                output_path = os.path.splitext(output_path)[0] + ".npy"
+            pairs = [(input_path, output_path)]
+            if args.add_output:
+                # 任务可能在其他节点上运行，路径统一记录为绝对路径
+                options["outputs"] = [
+                    spec._replace(path=os.path.abspath(spec.path))._asdict()
+                    for spec in args.add_output
+                ]
+            if args.raw:
+                options["raw_format"] = args.raw
+
+        with job_queue.JobQueue(args.queue) as queue:
+            for input_path, output_path in pairs:
+                if args.skip_existing and os.path.exists(output_path):
+                    print(f"[跳过] {input_path} 输出已存在", file=sys.stderr)
+                    continue
+                job_id = queue.submit(
+                    os.path.abspath(input_path),
+                    os.path.abspath(output_path),
+                    options,
+                    args.priority,
+                    args.max_attempts,
+                )
+                print(f"[已加入] #{job_id} {input_path} -> {output_path}", file=sys.stderr)
 
+    except Exception as e:
+        print(f"加入任务队列失败: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+
+def run_batch(args: argparse.Namespace) -> None:
+    """批量模式：在一个进程池中转换目录/通配符匹配到的全部文件"""
+
+    try:
+        if args.add_output:
+            raise ValueError("批量模式不支持 --add-output")
+        if args.raw:
+            raise ValueError("批量模式不支持 --raw")
+        input_paths = batch.collect_inputs(args.input, args.recursive)
+        if not input_paths:
+            raise FileNotFoundError(f"未找到可转换的视频文件: {' '.join(args.input)}")
+        if args.output:
+            path_check.validate_output_dir(os.path.join(args.output, ""))
     except Exception as e:
         print(f"转换失败: {str(e)}", file=sys.stderr)
         sys.exit(1)
 
+    labels = {"ok": "成功", "skipped": "跳过", "failed": "失败"}
+
+    def report(result: batch.BatchResult) -> None:
+        if result.status == "ok":
+            detail = f"-> {result.output_path} ({result.seconds:.1f}s)"
+        else:
+            detail = result.message
+        print(f"[{labels[result.status]}] {result.input_path} {detail}", file=sys.stderr)
+
+    results = batch.convert_batch(
+        input_paths,
+        args.output,
+        args.jobs,
+        args.skip_existing,
+        report,
+        **conversion_options(args),
+    )
+
+    counts = {status: 0 for status in labels}
+    for result in results:
+        counts[result.status] += 1
+    print(
+        f"批量转换完成：成功 {counts['ok']}，跳过 {counts['skipped']}，失败 {counts['failed']}",
+        file=sys.stderr,
+    )
+    if counts["failed"]:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
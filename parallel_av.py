@@ -0,0 +1,307 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import heapq
+import os
+import shutil
+import tempfile
+import av
+
+import profiling
+import progress
+import transformer_av
+
+
+# 每个工作进程平均分到的分段数，分段多于进程数可以平衡各段编码耗时的差异
+SEGMENTS_PER_WORKER = 4
+
+Segment = Tuple[Optional[int], Optional[int]]
+
+
+def _keyframe_before(in_container, video_stream, target_pts: int) -> Optional[int]:
+    """定位到 target_pts 之前最近的关键帧，返回其时间戳"""
+
+    in_container.seek(target_pts, backward=True, stream=video_stream)
+    for packet in in_container.demux(video_stream):
+        if packet.pts is None:
+            continue
+        if packet.is_keyframe:
+            return packet.pts
+    return None
+
+
+def _scan_keyframes(in_container, video_stream) -> List[int]:
+    """只解复用不解码，收集全部关键帧的时间戳"""
+
+    return [
+        packet.pts
+        for packet in in_container.demux(video_stream)
+        if packet.is_keyframe and packet.pts is not None
+    ]
+
+
+def plan_segments(input_path: str, segments: int) -> List[Segment]:
+    """按关键帧把首个视频流切分为约 segments 段，返回每段的 [起始, 结束) 时间戳"""
+
+    if segments < 1:
+        raise ValueError(f"分段数必须为正数，当前：{segments}")
+
+    with av.open(input_path, mode="r") as in_container:
+        video_stream = in_container.streams.video[0]
+        time_base = video_stream.time_base
+
+        if video_stream.duration and time_base:
+            start = video_stream.start_time or 0
+            boundaries = set()
+            for i in range(1, segments):
+                target = start + video_stream.duration * i // segments
+                pts = _keyframe_before(in_container, video_stream, target)
+                if pts is not None and pts > start:
+                    boundaries.add(pts)
+        else:
+            keyframes = _scan_keyframes(in_container, video_stream)
+            step = max(len(keyframes) / segments, 1)
+            boundaries = {
+                keyframes[int(i * step)]
+                for i in range(1, segments)
+                if int(i * step) < len(keyframes)
+            }
+            if keyframes:
+                boundaries.discard(keyframes[0])
+
+    points: List[Optional[int]] = [None, *sorted(boundaries), None]
+    return list(zip(points[:-1], points[1:]))
+
+
+def _convert_segment_job(
+    job: tuple, profile: bool = False
+) -> Tuple[int, Optional[Dict]]:
+    """工作进程入口：转换单个分段，返回帧数及（启用性能分析时）各阶段耗时"""
+
+    if not profile:
+        return transformer_av.convert_segment(*job), None
+    profiler = profiling.Profiler()
+    frames = transformer_av.convert_segment(*job, profiler=profiler)
+    return frames, profiler.report()["stages"]
+
+
+def _segment_packets(segment_paths: List[str]) -> Iterator[av.Packet]:
+    """依次读取各分段文件中的视频数据包"""
+
+    for segment_path in segment_paths:
+        with av.open(segment_path, mode="r") as segment:
+            for packet in segment.demux(segment.streams.video[0]):
+                if packet.dts is None:
+                    continue
+                yield packet
+
+
+def _passthrough_packets(in_container, streams) -> Iterator[av.Packet]:
+    """读取原始输入中除视频外的数据包"""
+
+    if not streams:
+        return
+    for packet in in_container.demux(*streams):
+        if packet.dts is None:
+            continue
+        yield packet
+
+
+def _packet_time(packet: av.Packet) -> float:
+    return float(packet.dts * packet.time_base)
+
+
+def _concat_segments(
+    input_path: str,
+    output_path: str,
+    segment_paths: List[str],
+) -> None:
+    """无损拼接各分段的视频数据包，并从原始输入一次性重新封装其余流"""
+
+    with av.open(input_path, mode="r") as in_container:
+        video_stream = in_container.streams.video[0]
+        other_streams = [s for s in in_container.streams if s is not video_stream]
+
+        with av.open(output_path, mode="w") as out_container:
+            stream_map = {}
+            for in_stream in in_container.streams:
+                if in_stream is video_stream:
+                    with av.open(segment_paths[0], mode="r") as first_segment:
+                        stream_map[in_stream.index] = (
+                            out_container.add_stream_from_template(
+                                first_segment.streams.video[0]
+                            )
+                        )
+                else:
+                    stream_map.update(
+                        transformer_av._add_output_streams(
+                            in_container, out_container, 0, 0, streams=[in_stream]
+                        )
+                    )
+            out_video = stream_map[video_stream.index]
+
+            # 按解码时间戳归并视频与其余流，避免封装器为交织而缓存整段视频
+            packets = heapq.merge(
+                ((_packet_time(p), 0, p) for p in _segment_packets(segment_paths)),
+                (
+                    (_packet_time(p), 1, p)
+                    for p in _passthrough_packets(in_container, other_streams)
+                ),
+                key=lambda entry: entry[:2],
+            )
+
+            last_dts = None
+            for _, is_passthrough, packet in packets:
+                if is_passthrough:
+                    packet.stream = stream_map[packet.stream.index]
+                    out_container.mux(packet)
+                    continue
+
+                # 含 B 帧时，后一段开头的解码时间戳会早于前一段末尾，顺延以保持单调递增
+                if last_dts is not None and packet.dts <= last_dts:
+                    packet.dts = last_dts + 1
+                    if packet.pts is not None and packet.pts < packet.dts:
+                        packet.pts = packet.dts
+                last_dts = packet.dts
+                packet.stream = out_video
+                out_container.mux(packet)
+
+
+def segment_jobs(
+    mode: str,
+    input_path: str,
+    segment_paths: List[str],
+    segments: List[Segment],
+    width: int,
+    height: int,
+    split: float,
+    pixel_mode: str = "native",
+    threads: int = 0,
+    speed: Optional[str] = None,
+    half: bool = False,
+) -> List[tuple]:
+    """为每个分段生成 transformer_av.convert_segment 的参数"""
+
+    return [
+        (
+            mode,
+            input_path,
+            segment_path,
+            width,
+            height,
+            split,
+            start,
+            end,
+            pixel_mode,
+            threads,
+            speed,
+            half,
+        )
+        for segment_path, (start, end) in zip(segment_paths, segments)
+    ]
+
+
+def run_segments(
+    jobs: List[tuple],
+    workers: int,
+    on_done: Callable[[int, int], None],
+    profiler: Optional[profiling.Profiler] = None,
+) -> None:
+    """转换各分段，每完成一段以 (分段序号, 帧数) 调用一次 on_done
+
+    workers 为 1 时在当前进程中按顺序转换，否则在进程池中并行转换。
+    """
+
+    if workers < 1:
+        raise ValueError(f"工作进程数必须为正数，当前：{workers}")
+
+    if workers == 1:
+        for index, job in enumerate(jobs):
+            on_done(index, transformer_av.convert_segment(*job, profiler=profiler))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_convert_segment_job, job, profiler is not None): index
+            for index, job in enumerate(jobs)
+        }
+        try:
+            for future in as_completed(futures):
+                frames_done, stats = future.result()
+                if stats is not None:
+                    profiler.merge(stats)
+                on_done(futures[future], frames_done)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def convert_parallel(
+    mode: str,
+    input_path: str,
+    output_path: str,
+    width: int,
+    height: int,
+    frames: int,
+    split: float,
+    workers: int,
+    tracker: Optional[progress.ProgressTracker] = None,
+    pixel_mode: str = "native",
+    threads: int = 0,
+    speed: Optional[str] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    half: bool = False,
+) -> None:
+    """按关键帧分段，在多个进程中并行转换后无损拼接为单个输出文件
+
+    给定 profiler 时汇总各工作进程中各阶段的累计耗时，并记录分段规划与拼接的耗时。
+    给定 tracker 时每完成一个分段更新一次进度，写入字节数按分段文件大小累计。
+    """
+
+    if workers < 1:
+        raise ValueError(f"工作进程数必须为正数，当前：{workers}")
+    if tracker is not None and tracker.total_frames <= 0:
+        tracker.total_frames = frames
+
+    with profiling.stage(profiler, "plan_segments"):
+        segments = plan_segments(input_path, workers * SEGMENTS_PER_WORKER)
+
+    _, ext = os.path.splitext(output_path)
+    temp_dir = tempfile.mkdtemp(
+        prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_path))
+    )
+    try:
+        segment_paths = [
+            os.path.join(temp_dir, f"segment_{i:05d}{ext}")
+            for i in range(len(segments))
+        ]
+        jobs = segment_jobs(
+            mode,
+            input_path,
+            segment_paths,
+            segments,
+            width,
+            height,
+            split,
+            pixel_mode,
+            threads,
+            speed,
+            half,
+        )
+
+        processed_frames = 0
+        bytes_written = 0
+
+        def on_done(index: int, frames_done: int) -> None:
+            nonlocal processed_frames, bytes_written
+            processed_frames += frames_done
+            bytes_written += os.path.getsize(segment_paths[index])
+            if tracker is not None:
+                tracker.update(processed_frames, bytes_written, bytes_written)
+
+        run_segments(jobs, workers, on_done, profiler)
+
+        with profiling.stage(profiler, "concat"):
+            _concat_segments(input_path, output_path, segment_paths)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -1,8 +1,13 @@
 import os
 
+# 表示标准输入/输出的路径，沿用转换模块的定义
+from transformer_av import STREAM_PATH
+
 
 def validate_input_path(path: str) -> str:
-    """验证输入文件有效性"""
+    """验证输入文件有效性，"-" 表示标准输入"""
+    if path == STREAM_PATH:
+        return path
     if not os.path.exists(path):
         raise FileNotFoundError(f"输入文件不存在: {path}")
     if not os.path.isfile(path):
@@ -13,7 +18,9 @@ def validate_input_path(path: str) -> str:
 
 
 def validate_output_dir(path: str) -> str:
-    """验证输出目录有效性"""
+    """验证输出目录有效性，"-" 表示标准输出"""
+    if path == STREAM_PATH:
+        return path
     dir_path = os.path.dirname(path)
     if not dir_path:
         dir_path = os.getcwd()
@@ -0,0 +1,106 @@
+from typing import Dict, Optional
+import os
+
+
+SPEED_PRESETS = ("fast", "balanced", "quality")
+
+# 各编码器在不同速度档位下的私有选项，未列出的编码器保持默认设置
+ENCODER_PRESETS: Dict[str, Dict[str, Dict[str, str]]] = {
+    "libx264": {
+        "fast": {"preset": "veryfast"},
+        "balanced": {"preset": "medium"},
+        "quality": {"preset": "slow"},
+    },
+    "libx265": {
+        "fast": {"preset": "veryfast"},
+        "balanced": {"preset": "medium"},
+        "quality": {"preset": "slow"},
+    },
+    "libsvtav1": {
+        "fast": {"preset": "10"},
+        "balanced": {"preset": "7"},
+        "quality": {"preset": "4"},
+    },
+    "libaom-av1": {
+        "fast": {"cpu-used": "8", "row-mt": "1"},
+        "balanced": {"cpu-used": "5", "row-mt": "1"},
+        "quality": {"cpu-used": "3", "row-mt": "1"},
+    },
+    "libvpx-vp9": {
+        "fast": {"deadline": "realtime", "cpu-used": "8", "row-mt": "1"},
+        "balanced": {"deadline": "good", "cpu-used": "4", "row-mt": "1"},
+        "quality": {"deadline": "good", "cpu-used": "1", "row-mt": "1"},
+    },
+    "h264_nvenc": {
+        "fast": {"preset": "p1"},
+        "balanced": {"preset": "p4"},
+        "quality": {"preset": "p7"},
+    },
+    "hevc_nvenc": {
+        "fast": {"preset": "p1"},
+        "balanced": {"preset": "p4"},
+        "quality": {"preset": "p7"},
+    },
+    "h264_qsv": {
+        "fast": {"preset": "veryfast"},
+        "balanced": {"preset": "medium"},
+        "quality": {"preset": "veryslow"},
+    },
+    "hevc_qsv": {
+        "fast": {"preset": "veryfast"},
+        "balanced": {"preset": "medium"},
+        "quality": {"preset": "veryslow"},
+    },
+}
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """读取 cgroup（v2 或 v1）的 CPU 配额，未限制或无法读取时返回 None"""
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    """当前进程实际可用的 CPU 数，同时考虑 CPU 亲和性与 cgroup 配额（容器中运行时）"""
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, int(limit + 0.5)))
+    return max(1, cpus)
+
+
+def encoder_options(codec_name: str, speed: str, threads: int = 0) -> Dict[str, str]:
+    """返回编码器在 speed 档位下的私有选项
+
+    libx265 不读取通用的线程数设置，线程数通过 x265-params 的线程池大小传入。
+    """
+
+    if speed not in SPEED_PRESETS:
+        raise ValueError(f"不支持的速度档位: {speed}")
+    options = dict(ENCODER_PRESETS.get(codec_name, {}).get(speed, {}))
+    if codec_name == "libx265" and threads > 0:
+        options["x265-params"] = f"pools={threads}"
+    return options
@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import profiling
+import progress
+import transformer_av
+import video_info
+
+
+CACHE_DIR_ENV = "SBS_TAB_TRANS_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "sbs-tab-trans", "probe"
+)
+# 缓存条目上限，超出时按最近使用时间淘汰最旧的条目
+CACHE_MAX_ENTRIES = 4096
+# 超过该时长（秒）未被使用的条目会被淘汰
+CACHE_MAX_AGE = 30 * 24 * 3600
+# 内容指纹读取文件头尾各多少字节
+FINGERPRINT_BYTES = 64 * 1024
+# 缓存格式版本，探测/检测逻辑变化导致旧结果失效时递增
+CACHE_VERSION = 2
+
+
+def fingerprint(path: str) -> str:
+    """读取文件头尾各一小段计算内容指纹，代价与文件大小无关"""
+
+    digest = hashlib.sha1()
+    size = os.path.getsize(path)
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+class ProbeCache:
+    """探测与检测结果的磁盘缓存：每个条目一个 JSON 文件，按最近使用时间淘汰"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_age: float = CACHE_MAX_AGE,
+    ):
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+    def key(self, path: str) -> str:
+        """由绝对路径、大小、修改时间与内容指纹生成缓存键"""
+
+        stat = os.stat(path)
+        raw = "\0".join(
+            [
+                str(CACHE_VERSION),
+                os.path.abspath(path),
+                str(stat.st_size),
+                str(stat.st_mtime_ns),
+                fingerprint(path),
+            ]
+        )
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict]:
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            # 更新修改时间作为最近使用时间，供淘汰策略使用
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key: str, entry: Dict) -> None:
+        """原子写入条目（先写临时文件再重命名），写入后执行淘汰"""
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, self._entry_path(key))
+            self.evict()
+        except OSError:
+            # 缓存只是加速手段，写入失败不影响转换
+            pass
+
+    def evict(self) -> None:
+        """删除过期条目，并在条目数超过上限时删除最久未使用的条目"""
+
+        entries: List[Tuple[float, str]] = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                used = os.path.getmtime(entry_path)
+            except OSError:
+                continue
+            if now - used > self.max_age:
+                self._remove(entry_path)
+            else:
+                entries.append((used, entry_path))
+
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, entry_path in entries[: len(entries) - self.max_entries]:
+                self._remove(entry_path)
+
+    @staticmethod
+    def _remove(entry_path: str) -> None:
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+
+class VideoProbe:
+    """只打开一次输入文件，携带宽高、帧数、流结构及格式检测结果直到转换结束
+
+    命中缓存时无需读取文件即可得到探测与检测结果，容器推迟到转换真正需要时才打开。
+    路径为 "-" 时从标准输入读取，此时不使用缓存，帧数未知时记为 0。
+    给定 check 时扫描帧数期间逐个数据包调用，见 video_info.count_frames。
+    threads / speed 为转换使用的解码线程设置（见 transformer_av.convert），在打开容器时
+    即应用到视频解码器：检测抽帧会先打开解码器，之后无法再修改线程设置。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache: Optional[ProbeCache] = None,
+        input_format: Optional[str] = None,
+        check: Optional[Callable[[], None]] = None,
+        threads: int = 0,
+        speed: Optional[str] = None,
+    ):
+        self.path = path
+        self.input_format = input_format
+        self.threads = transformer_av._resolve_threads(threads, speed)
+        self.speed = speed
+        self._container = None
+        self._touched = False
+        if self.is_stream:
+            cache = None
+        self.cache = cache
+        self._key = cache.key(path) if cache is not None else None
+        self._entry = cache.load(self._key) if cache is not None else None
+
+        if self._entry is None:
+            try:
+                self._entry = self._probe(check)
+            except BaseException:
+                self.close()
+                raise
+            self._save()
+
+    def __enter__(self) -> "VideoProbe":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def is_stream(self) -> bool:
+        """输入是否为不可定位的标准输入"""
+        return self.path == transformer_av.STREAM_PATH
+
+    @property
+    def width(self) -> int:
+        return self._entry["width"]
+
+    @property
+    def height(self) -> int:
+        return self._entry["height"]
+
+    @property
+    def total_frames(self) -> int:
+        return self._entry["total_frames"]
+
+    @property
+    def rate(self) -> Optional[float]:
+        """首个视频流的平均帧率，未知时为 None"""
+        return self._entry["rate"]
+
+    @property
+    def streams(self) -> List[Dict]:
+        """流结构：每个流的序号、类型与编码名称"""
+        return self._entry["streams"]
+
+    @property
+    def container(self):
+        if self._container is None:
+            self._container = transformer_av.open_input(self.path, self.input_format)
+            transformer_av._configure_decoders(
+                [stream.codec_context for stream in self._container.streams.video],
+                self.threads,
+                self.speed,
+            )
+        return self._container
+
+    def _probe(self, check: Optional[Callable[[], None]] = None) -> Dict:
+        try:
+            # 管道输入无法扫描数据包计数，帧数以外的信息不受影响
+            width, height, total_frames = video_info.read_video_info(
+                self.container, scan=not self.is_stream, check=check
+            )
+        except progress.Cancelled:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"AV获取视频信息失败：{str(e)}")
+        video_stream = self.container.streams.video[0]
+        if self.is_stream and video_stream.frames <= 0:
+            # 管道输入的时长不可靠，无法预知帧数，不报告百分比进度
+            total_frames = 0
+
+        return {
+            "width": width,
+            "height": height,
+            "total_frames": total_frames,
+            "rate": video_info.frame_rate(video_stream),
+            "streams": [
+                {
+                    "index": stream.index,
+                    "type": stream.type,
+                    "codec": stream.codec_context.name if stream.codec_context else None,
+                }
+                for stream in self.container.streams
+            ],
+            "detections": {},
+        }
+
+    def _save(self) -> None:
+        if self.cache is not None:
+            self.cache.store(self._key, self._entry)
+
+    def detect_split(
+        self,
+        method: str = "pyramid",
+        prefilter: bool = False,
+        early_stop_tolerance: Optional[float] = None,
+        profiler: Optional[profiling.Profiler] = None,
+        check: Optional[Callable[[], None]] = None,
+    ) -> Tuple[video_info.VideoFormat, float]:
+        """非标准分割线检测，结果按检测参数缓存；标准输入无法抽帧，不支持
+
+        check 见 video_info.detect_split_from_video。
+        """
+
+        if self.is_stream:
+            raise ValueError("标准输入无法抽帧检测分割线")
+
+        params = f"{method}:prefilter={int(prefilter)}:early_stop={early_stop_tolerance}"
+        cached = self._entry["detections"].get(params)
+        if cached is not None:
+            return video_info.VideoFormat(cached["format"]), cached["split"]
+
+        self._touched = True
+        format, split = video_info.detect_split_from_video(
+            self.path,
+            method=method,
+            prefilter=prefilter,
+            early_stop_tolerance=early_stop_tolerance,
+            container=self.container,
+            profiler=profiler,
+            check=check,
+        )
+        self._entry["detections"][params] = {"format": format.value, "split": split}
+        self._save()
+        return format, split
+
+    @staticmethod
+    def _inline_params(method: str, prefilter: bool, frames: int) -> str:
+        return f"inline:{method}:prefilter={int(prefilter)}:frames={frames}"
+
+    def cached_inline_split(
+        self, method: str, prefilter: bool, frames: int
+    ) -> Optional[Tuple[video_info.VideoFormat, float]]:
+        """已缓存的内联检测结果（在转换开头 frames 个解码帧上检测），没有时返回 None"""
+
+        cached = self._entry["detections"].get(
+            self._inline_params(method, prefilter, frames)
+        )
+        if cached is None:
+            return None
+        return video_info.VideoFormat(cached["format"]), cached["split"]
+
+    def store_inline_split(
+        self,
+        method: str,
+        prefilter: bool,
+        frames: int,
+        format: video_info.VideoFormat,
+        split: float,
+    ) -> None:
+        """记录转换过程中的内联检测结果，再次转换同一文件时无需检测"""
+
+        self._entry["detections"][self._inline_params(method, prefilter, frames)] = {
+            "format": format.value,
+            "split": split,
+        }
+        self._save()
+
+    def take_container(self):
+        """返回供转换使用的输入容器；检测时读取过的容器关闭后重新打开
+
+        定位回开头会丢掉时间戳早于 0 的数据包（如 AAC 的编码器延迟包），重新打开才能
+        保证与不经检测直接转换的输出完全一致。
+        """
+
+        if self._touched:
+            self.close()
+            self._touched = False
+        return self.container
+
+    def close(self) -> None:
+        if self._container is not None:
+            try:
+                self._container.close()
+            except Exception:
+                pass
+            self._container = None
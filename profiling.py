@@ -0,0 +1,153 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+import json
+import threading
+import time
+
+
+T = TypeVar("T")
+
+
+class Profiler:
+    """按阶段累计耗时与调用次数
+
+    转换与检测流程在创建时取得各阶段的计时包装（wrap / iterate），未启用性能分析时
+    直接使用原函数，热循环中没有任何额外开销。流水线模式下各阶段在不同线程中计时，
+    各阶段耗时之和可能超过总耗时；同一阶段可能在多个线程中同时计时，累计时加锁。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stats: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _stat(self, name: str) -> List[float]:
+        with self._lock:
+            return self._stats.setdefault(name, [0.0, 0])
+
+    def _record(self, stat: List[float], seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            stat[0] += seconds
+            stat[1] += calls
+
+    def add(self, name: str, seconds: float, calls: int = 1) -> None:
+        self._record(self._stat(name), seconds, calls)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """对一段代码计时，适合调用次数少的粗粒度阶段"""
+
+        stat = self._stat(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(stat, time.perf_counter() - started)
+
+    def wrap(self, name: str, func: Callable[..., T]) -> Callable[..., T]:
+        """返回对每次调用计时的 func"""
+
+        stat = self._stat(name)
+        clock = time.perf_counter
+        record = self._record
+
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stat, clock() - started)
+
+        return timed
+
+    def iterate(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """对从 iterable 取出每个元素的耗时计时"""
+
+        stat = self._stat(name)
+        clock = time.perf_counter
+        record = self._record
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    record(stat, clock() - started)
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def merge(self, stats: Dict[str, Dict]) -> None:
+        """合并其他进程中的 Profiler.report()["stages"]"""
+
+        for name, stat in stats.items():
+            self.add(name, stat["seconds"], stat["calls"])
+
+    def report(self) -> Dict:
+        """返回可序列化为 JSON 的报告"""
+
+        total = time.perf_counter() - self.started
+        with self._lock:
+            stats = [(name, tuple(stat)) for name, stat in self._stats.items()]
+        return {
+            "total_seconds": total,
+            "stages": {
+                name: {
+                    "seconds": seconds,
+                    "calls": int(calls),
+                    "mean_ms": seconds / calls * 1000 if calls else 0.0,
+                    "share": seconds / total if total > 0 else 0.0,
+                }
+                for name, (seconds, calls) in sorted(
+                    stats, key=lambda item: -item[1][0]
+                )
+            },
+        }
+
+    def summary(self) -> str:
+        """返回按耗时降序排列的文本摘要"""
+
+        report = self.report()
+        lines = ["性能分析（按耗时降序）："]
+        for name, stat in report["stages"].items():
+            lines.append(
+                f"  {name:<16}{stat['seconds']:>10.3f}s {stat['calls']:>9}次 "
+                f"{stat['mean_ms']:>10.3f}ms/次 {stat['share']:>7.1%}"
+            )
+        lines.append(f"  总耗时 {report['total_seconds']:.3f}s")
+        return "\n".join(lines)
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+
+def wrap(
+    profiler: Optional[Profiler], name: str, func: Callable[..., T]
+) -> Callable[..., T]:
+    """profiler 为 None 时原样返回 func"""
+    return func if profiler is None else profiler.wrap(name, func)
+
+
+def iterate(
+    profiler: Optional[Profiler], name: str, iterable: Iterable[T]
+) -> Iterable[T]:
+    """profiler 为 None 时原样返回 iterable"""
+    return iterable if profiler is None else profiler.iterate(name, iterable)
+
+
+@contextmanager
+def stage(profiler: Optional[Profiler], name: str) -> Iterator[None]:
+    """profiler 为 None 时不计时"""
+
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
@@ -0,0 +1,217 @@
+from typing import Callable, List, NamedTuple, Optional
+import json
+import threading
+import time
+
+
+# 两次进度回调之间的最小间隔（秒），避免逐帧输出拖慢转换
+DEFAULT_INTERVAL = 0.5
+
+
+class Cancelled(Exception):
+    """转换被调用方取消"""
+
+
+def cancel_check(
+    cancel_event: Optional[threading.Event],
+) -> Optional[Callable[[], None]]:
+    """返回 cancel_event 被设置后抛出 Cancelled 的检查函数，未给定事件时返回 None
+
+    供探测、帧数扫描与分割线检测等创建 ProgressTracker 之前的阶段逐帧调用。
+    """
+
+    if cancel_event is None:
+        return None
+
+    def check() -> None:
+        if cancel_event.is_set():
+            raise Cancelled("转换已取消")
+
+    return check
+
+
+class Progress(NamedTuple):
+    """某一时刻的转换进度快照
+
+    total_frames 为 0 表示总帧数未知（如管道输入），此时不报告百分比与剩余时间。
+    bitrate 为已编码视频的平均码率（bit/s），按已编码帧数与帧率折算出的时长计算。
+    """
+
+    frames: int
+    total_frames: int
+    elapsed: float
+    fps: float
+    bytes_written: int
+    bitrate: Optional[float]
+    eta: Optional[float]
+    done: bool = False
+
+    @property
+    def percent(self) -> Optional[float]:
+        if self.total_frames <= 0:
+            return None
+        return min(self.frames / self.total_frames * 100, 100.0)
+
+    def to_dict(self) -> dict:
+        return {**self._asdict(), "percent": self.percent}
+
+
+class ProgressTracker:
+    """累计已编码帧数与写入字节数，计算速度、码率与剩余时间并按间隔回调
+
+    转换流程以累计值调用 update，回调最多每 interval 秒触发一次；finish 时无论间隔
+    都回调一次 done 为 True 的最终进度。断点续转时先用 skip 记入已完成的部分，
+    这部分不计入速度与剩余时间的估算。
+    给定 cancel_event 时，事件被设置后的下一次 update 抛出 Cancelled，转换流程借此
+    在帧与帧之间停止，并经各层的 finally 关闭容器与后台线程。
+    """
+
+    def __init__(
+        self,
+        total_frames: int = 0,
+        rate: Optional[float] = None,
+        callback: Optional[Callable[[Progress], None]] = None,
+        interval: float = DEFAULT_INTERVAL,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        self.total_frames = total_frames
+        self.rate = rate
+        self.callback = callback
+        self.interval = interval
+        self.cancel_event = cancel_event
+        self.started = time.perf_counter()
+        self._next_report = self.started
+        self._skipped_frames = 0
+        self.frames = 0
+        self.bytes_written = 0
+        self.video_bytes = 0
+
+    def skip(self, frames: int, bytes_written: int = 0, video_bytes: int = 0) -> None:
+        """记入转换开始前已完成的部分"""
+
+        self._skipped_frames += frames
+        self.update(
+            self.frames + frames,
+            self.bytes_written + bytes_written,
+            self.video_bytes + video_bytes,
+        )
+
+    def update(self, frames: int, bytes_written: int, video_bytes: int) -> None:
+        """以累计值更新进度：帧数、写入的总字节数及其中视频数据的字节数"""
+
+        self.check_cancelled()
+        self.frames = frames
+        self.bytes_written = bytes_written
+        self.video_bytes = video_bytes
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self.callback(self.snapshot(now))
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise Cancelled("转换已取消")
+
+    def branches(self, count: int) -> List["BranchTracker"]:
+        """同一输入同时写入多个输出时，为每个输出返回一个子进度
+
+        汇总进度的帧数取各输出中最慢的一个，字节数与码率为各输出之和。
+        """
+
+        counters = [(0, 0, 0)] * count
+        lock = threading.Lock()
+
+        def update(index: int, frames: int, bytes_written: int, video_bytes: int) -> None:
+            with lock:
+                counters[index] = (frames, bytes_written, video_bytes)
+                self.update(
+                    min(counter[0] for counter in counters),
+                    sum(counter[1] for counter in counters),
+                    sum(counter[2] for counter in counters),
+                )
+
+        return [BranchTracker(index, update) for index in range(count)]
+
+    def finish(self) -> None:
+        if self.callback is not None:
+            self.callback(self.snapshot(done=True))
+
+    def snapshot(self, now: Optional[float] = None, done: bool = False) -> Progress:
+        elapsed = (now or time.perf_counter()) - self.started
+        fresh_frames = self.frames - self._skipped_frames
+        fps = fresh_frames / elapsed if elapsed > 0 else 0.0
+
+        bitrate = None
+        if self.rate and self.frames > 0:
+            bitrate = self.video_bytes * 8 * self.rate / self.frames
+
+        eta = None
+        if done:
+            eta = 0.0
+        elif self.total_frames > 0 and fps > 0:
+            eta = max(self.total_frames - self.frames, 0) / fps
+
+        return Progress(
+            self.frames,
+            self.total_frames,
+            elapsed,
+            fps,
+            self.bytes_written,
+            bitrate,
+            eta,
+            done,
+        )
+
+
+class BranchTracker:
+    """ProgressTracker.branches 返回的子进度，只提供 update"""
+
+    def __init__(self, index: int, update: Callable[[int, int, int, int], None]):
+        self._index = index
+        self._update = update
+
+    def update(self, frames: int, bytes_written: int, video_bytes: int) -> None:
+        self._update(self._index, frames, bytes_written, video_bytes)
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def format_human(progress: Progress) -> str:
+    """单行的可读进度，如：转换进度: 42.0% 1234/2940帧 58.3fps 12.4MB 3.20Mbps 剩余 00:29"""
+
+    parts = ["转换进度:"]
+    if progress.percent is not None:
+        parts.append(f"{progress.percent:.1f}%")
+        parts.append(f"{progress.frames}/{progress.total_frames}帧")
+    else:
+        parts.append(f"{progress.frames}帧")
+    parts.append(f"{progress.fps:.1f}fps")
+    parts.append(_format_bytes(progress.bytes_written))
+    if progress.bitrate is not None:
+        parts.append(f"{progress.bitrate / 1e6:.2f}Mbps")
+    if progress.done:
+        parts.append(f"用时 {_format_seconds(progress.elapsed)}")
+    elif progress.eta is not None:
+        parts.append(f"剩余 {_format_seconds(progress.eta)}")
+    return " ".join(parts)
+
+
+def format_json(progress: Progress) -> str:
+    """一行 JSON，供其他程序逐行解析"""
+    return json.dumps(progress.to_dict(), ensure_ascii=False)
@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import av
+
+import parallel_av
+import profiling
+import progress
+
+
+# 每个检查点分段的目标时长（秒），实际边界落在其前最近的关键帧上
+DEFAULT_CHUNK_SECONDS = 60.0
+# 时长与帧率均未知时按帧数估算时长所假定的帧率
+FALLBACK_RATE = 25.0
+MANIFEST_NAME = "manifest.json"
+# 清单格式版本，分段方式或文件结构变化导致旧清单失效时递增
+MANIFEST_VERSION = 1
+
+
+def parts_dir(output_path: str) -> str:
+    """检查点目录：与输出文件同目录，名称为输出文件名加 .parts"""
+    return f"{output_path}.parts"
+
+
+def _duration_seconds(input_path: str) -> Optional[float]:
+    with av.open(input_path, mode="r") as container:
+        video_stream = container.streams.video[0]
+        if video_stream.duration and video_stream.time_base:
+            return float(video_stream.duration * video_stream.time_base)
+        if container.duration:
+            return container.duration / av.time_base
+    return None
+
+
+def _chunk_count(
+    input_path: str, frames: int, chunk_seconds: float, rate: Optional[float] = None
+) -> int:
+    duration = _duration_seconds(input_path)
+    if duration is None:
+        # 时长未知时按帧数与探测到的帧率估算，帧率也未知时才假定 FALLBACK_RATE
+        duration = frames / (rate or FALLBACK_RATE)
+    return max(1, math.ceil(duration / chunk_seconds))
+
+
+def _input_identity(input_path: str) -> Dict:
+    stat = os.stat(input_path)
+    return {
+        "path": os.path.abspath(input_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def _load_manifest(manifest_path: str) -> Optional[Dict]:
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(manifest_path: str, manifest: Dict) -> None:
+    """原子写入清单，进程在写入途中被杀死也不会留下残缺的清单"""
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(manifest_path), suffix=".tmp"
+    )
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, manifest_path)
+
+
+def _chunk_path(directory: str, index: int, ext: str) -> str:
+    return os.path.join(directory, f"chunk_{index:05d}{ext}")
+
+
+def convert_resumable(
+    mode: str,
+    input_path: str,
+    output_path: str,
+    width: int,
+    height: int,
+    frames: int,
+    split: float,
+    workers: int = 1,
+    tracker: Optional[progress.ProgressTracker] = None,
+    pixel_mode: str = "native",
+    threads: int = 0,
+    speed: Optional[str] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    half: bool = False,
+    rate: Optional[float] = None,
+) -> None:
+    """按关键帧对齐的分段写入检查点，中断后以相同参数重新运行即可从断点继续
+
+    每个分段先写入临时文件，完成后重命名并记入清单。重新运行时若清单中的输入文件与
+    转换参数一致，则跳过已完成的分段，只重做未完成的分段；全部完成后无损拼接为
+    单个输出文件并删除检查点目录。参数不一致时丢弃旧检查点从头开始。
+    rate 为探测到的帧率，输入时长未知时用于由帧数估算分段数。
+    """
+
+    if chunk_seconds <= 0:
+        raise ValueError(f"分段时长必须为正数，当前：{chunk_seconds}")
+
+    directory = parts_dir(output_path)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    _, ext = os.path.splitext(output_path)
+    params = {
+        "mode": mode,
+        "width": width,
+        "height": height,
+        "split": split,
+        "pixel_mode": pixel_mode,
+        "speed": speed,
+        "half": half,
+        "chunk_seconds": chunk_seconds,
+    }
+    identity = _input_identity(input_path)
+
+    manifest = _load_manifest(manifest_path)
+    if manifest is not None and (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("input") != identity
+        or manifest.get("params") != params
+    ):
+        shutil.rmtree(directory, ignore_errors=True)
+        manifest = None
+
+    if manifest is None:
+        with profiling.stage(profiler, "plan_segments"):
+            segments = parallel_av.plan_segments(
+                input_path, _chunk_count(input_path, frames, chunk_seconds, rate)
+            )
+        os.makedirs(directory, exist_ok=True)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "input": identity,
+            "params": params,
+            "segments": [list(segment) for segment in segments],
+            "completed": {},
+        }
+        _save_manifest(manifest_path, manifest)
+
+    segments = [tuple(segment) for segment in manifest["segments"]]
+    chunk_paths = [_chunk_path(directory, i, ext) for i in range(len(segments))]
+    completed: Dict[str, int] = manifest["completed"]
+
+    # 清单记录为已完成但分段文件丢失时重新转换该分段
+    for key in list(completed):
+        if not os.path.isfile(chunk_paths[int(key)]):
+            del completed[key]
+
+    pending: List[int] = [i for i in range(len(segments)) if str(i) not in completed]
+    # 未完成的分段先写入临时文件，完成后再改名，残缺文件不会被当作已完成
+    temp_paths = [_chunk_path(directory, i, f".partial{ext}") for i in pending]
+    jobs = parallel_av.segment_jobs(
+        mode,
+        input_path,
+        temp_paths,
+        [segments[i] for i in pending],
+        width,
+        height,
+        split,
+        pixel_mode,
+        threads,
+        speed,
+        half,
+    )
+
+    processed_frames = sum(completed.values())
+    bytes_written = sum(os.path.getsize(chunk_paths[int(key)]) for key in completed)
+    if tracker is not None:
+        if tracker.total_frames <= 0:
+            tracker.total_frames = frames
+        # 之前运行完成的分段不计入本次的速度与剩余时间估算
+        tracker.skip(processed_frames, bytes_written, bytes_written)
+
+    def on_done(job_index: int, frames_done: int) -> None:
+        nonlocal processed_frames, bytes_written
+        index = pending[job_index]
+        os.replace(temp_paths[job_index], chunk_paths[index])
+        completed[str(index)] = frames_done
+        _save_manifest(manifest_path, manifest)
+
+        processed_frames += frames_done
+        bytes_written += os.path.getsize(chunk_paths[index])
+        if tracker is not None:
+            tracker.update(processed_frames, bytes_written, bytes_written)
+
+    parallel_av.run_segments(jobs, workers, on_done, profiler)
+
+    with profiling.stage(profiler, "concat"):
+        parallel_av._concat_segments(input_path, output_path, chunk_paths)
+    shutil.rmtree(directory, ignore_errors=True)
@@ -1,233 +1,1587 @@
-from typing import Dict
+from contextlib import ExitStack, contextmanager
+from fractions import Fraction
+from functools import lru_cache
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+import glob
+import math
+import os
+import queue
+import sys
+import threading
 import av
+import av.filter
 import numpy as np
-import os
-import tempfile
-import shutil
 
+import presets
+import profiling
+import progress
 
-def sbs_to_tab(
-    input_path: str,
-    output_path: str,
+
+# 像素处理模式（重排引擎）：native 直接在解码器原生像素格式的各平面上重排，
+# rgb 先转换为 rgb24 再拼接，filter 在 libav 滤镜图中裁剪并拼接，见 FilterArranger
+PIXEL_MODES = ("native", "rgb", "filter")
+
+# 流水线模式下每个阶段之间队列的默认容量（帧数）
+DEFAULT_QUEUE_SIZE = 8
+
+# 未指定转换模式时，用于内联检测分割线而预先缓存的解码帧数
+DEFAULT_DETECT_FRAMES = 10
+
+# 表示标准输入/输出的路径
+STREAM_PATH = "-"
+# 写入标准输出时默认的封装格式
+DEFAULT_STREAM_FORMAT = "matroska"
+# 写入不可定位的输出时需要分片写入的封装格式
+FRAGMENTED_FORMATS = ("mp4", "mov", "ipod", "ismv")
+# 分段输出的封装格式（播放列表 + 分片 MP4 分段），按 .m3u8 / .mpd 扩展名自动选用
+SEGMENTED_FORMATS = ("hls", "dash")
+# HLS / DASH 未指定分段时长时的默认值（秒）
+DEFAULT_SEGMENT_SECONDS = 4.0
+
+_END = object()
+
+
+class Rect(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class Layout(NamedTuple):
+    """输出画面布局：拼接画面尺寸、两路视图在源帧/拼接画面中的位置及最终输出尺寸
+
+    输出尺寸与拼接画面不同时（半宽/半高输出），缩放在转换到编码器像素格式的
+    同一次 reformat 中完成。
+    """
+
+    width: int
+    height: int
+    views: Tuple[Tuple[Rect, Rect], ...]
+    output_width: int
+    output_height: int
+
+    @property
+    def covered(self) -> bool:
+        """两路视图是否铺满整个输出画面（无需填充黑边）"""
+        return sum(dst.width * dst.height for _, dst in self.views) == (
+            self.width * self.height
+        )
+
+
+def plan_layout(
+    mode: str, width: int, height: int, split: float, half: bool = False
+) -> Layout:
+    """根据转换模式和分割比例计算输出画面布局
+
+    half 为 True 时输出半高 TAB / 半宽 SBS：保持源视频的分辨率，两路视图在
+    加倍的方向上各压缩一半。
+    """
+
+    if mode == "sbs2tab":
+        left_width = int(width * split)
+        right_width = width - left_width
+        canvas_width = max(left_width, right_width)
+        return Layout(
+            canvas_width,
+            height * 2,
+            (
+                (Rect(0, 0, left_width, height), Rect(0, 0, left_width, height)),
+                (
+                    Rect(left_width, 0, right_width, height),
+                    Rect(0, height, right_width, height),
+                ),
+            ),
+            *((width, height) if half else (canvas_width, height * 2)),
+        )
+    elif mode == "tab2sbs":
+        top_height = int(height * split)
+        bottom_height = height - top_height
+        canvas_height = max(top_height, bottom_height)
+        return Layout(
+            width * 2,
+            canvas_height,
+            (
+                (Rect(0, 0, width, top_height), Rect(0, 0, width, top_height)),
+                (
+                    Rect(0, top_height, width, bottom_height),
+                    Rect(width, 0, width, bottom_height),
+                ),
+            ),
+            *((width, height) if half else (width * 2, canvas_height)),
+        )
+    raise ValueError(f"不支持的转换模式: {mode}")
+
+
+# 输出布局：full 为完整尺寸的拼接画面，half 为与源视频分辨率相同的半宽 / 半高画面，
+# left / right 为只含左（上）/ 右（下）视图的 2D 画面
+OUTPUT_LAYOUTS = ("full", "half", "left", "right")
+
+
+class OutputSpec(NamedTuple):
+    """一个输出文件的规格，未指定的项沿用源视频
+
+    width / height 只给出一项时按布局的宽高比推算另一项；codec 为视频编码器名称，
+    bit_rate 为视频码率（bit/s），format 为封装格式。
+    segment_seconds 为分段写入的分段时长（秒），见 open_output。
+    """
+
+    path: str
+    layout: str = "full"
+    width: Optional[int] = None
+    height: Optional[int] = None
+    codec: Optional[str] = None
+    bit_rate: Optional[int] = None
+    format: Optional[str] = None
+    segment_seconds: Optional[float] = None
+
+
+def plan_output(
+    mode: str, width: int, height: int, split: float, spec: OutputSpec
+) -> Layout:
+    """按输出规格计算画面布局，指定的输出尺寸同样在转换像素格式时一并缩放"""
+
+    if spec.layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"不支持的输出布局: {spec.layout}")
+    layout = plan_layout(mode, width, height, split, spec.layout == "half")
+    if spec.layout in ("left", "right"):
+        src, _ = layout.views[0 if spec.layout == "left" else 1]
+        layout = Layout(
+            src.width,
+            src.height,
+            ((src, Rect(0, 0, src.width, src.height)),),
+            src.width,
+            src.height,
+        )
+
+    out_width, out_height = spec.width, spec.height
+    aspect = layout.output_width / layout.output_height
+    if out_width and not out_height:
+        out_height = max(2, round(out_width / aspect / 2) * 2)
+    elif out_height and not out_width:
+        out_width = max(2, round(out_height * aspect / 2) * 2)
+    if out_width and out_height:
+        layout = layout._replace(output_width=out_width, output_height=out_height)
+    return layout
+
+
+class _PlaneInfo(NamedTuple):
+    shift_x: int  # 水平下采样位移（log2）
+    shift_y: int  # 垂直下采样位移（log2）
+    bytes_per_pixel: int
+    fill: bytes  # 该平面一个像素的黑色取值
+
+
+@lru_cache(maxsize=None)
+def _plane_infos(format_name: str) -> Optional[Tuple[_PlaneInfo, ...]]:
+    """解析像素格式的平面结构，无法按字节直接重排的格式返回 None"""
+
+    probe_size = 64
+    fmt = av.VideoFormat(format_name, probe_size, probe_size)
+    if fmt.has_palette or fmt.is_bit_stream or fmt.is_bayer:
+        return None
+
+    planes: Dict[int, List] = {}
+    for component in fmt.components:
+        planes.setdefault(component.plane, []).append(component)
+    if sorted(planes) != list(range(len(planes))):
+        return None
+
+    geometry = []
+    total_bits = 0
+    for index in range(len(planes)):
+        components = planes[index]
+        plane_width = components[0].width
+        plane_height = components[0].height
+        # 同一平面内的分量必须共享采样网格（排除 yuyv422 这类打包格式）
+        if any(
+            c.width != plane_width or c.height != plane_height for c in components
+        ):
+            return None
+        if any(c.bits > 16 for c in components):
+            return None
+        bytes_per_pixel = sum(1 if c.bits <= 8 else 2 for c in components)
+        shift_x = (probe_size // plane_width).bit_length() - 1
+        shift_y = (probe_size // plane_height).bit_length() - 1
+        if plane_width << shift_x != probe_size or plane_height << shift_y != probe_size:
+            return None
+        geometry.append((shift_x, shift_y, bytes_per_pixel))
+        total_bits += plane_width * plane_height * bytes_per_pixel * 8
+
+    # 与 FFmpeg 给出的每像素填充位数核对，排除 x2rgb10 这类位打包格式
+    if total_bits != fmt.padded_bits_per_pixel * probe_size * probe_size:
+        return None
+
+    # 借助 swscale 把黑色 RGB 画面转换到目标格式，得到各平面的黑色取值（含色彩范围与字节序）
+    black = av.VideoFrame.from_ndarray(
+        np.zeros((probe_size, probe_size, 3), dtype=np.uint8), format="rgb24"
+    ).reformat(format=format_name)
+    infos = []
+    for (shift_x, shift_y, bytes_per_pixel), plane in zip(geometry, black.planes):
+        fill = bytes(memoryview(plane)[:bytes_per_pixel])
+        infos.append(_PlaneInfo(shift_x, shift_y, bytes_per_pixel, fill))
+    return tuple(infos)
+
+
+def _plane_array(plane, bytes_per_pixel: int) -> np.ndarray:
+    """以 (高, 宽*每像素字节数) 的 uint8 视图访问平面数据，不复制"""
+    buffer = np.frombuffer(plane, dtype=np.uint8)
+    rows = buffer.reshape(plane.height, plane.line_size)
+    return rows[:, : plane.width * bytes_per_pixel]
+
+
+def _native_supported(
+    frame: av.VideoFrame, layout: Layout, width: int, height: int
+) -> bool:
+    """判断当前帧能否在原生像素格式下按平面重排"""
+
+    if frame.width != width or frame.height != height:
+        return False
+    return _native_aligned(frame.format.name, layout)
+
+
+@lru_cache(maxsize=64)
+def _native_aligned(format_name: str, layout: Layout) -> bool:
+    """判断布局中的所有偏移是否落在该像素格式各平面的采样网格上"""
+
+    infos = _plane_infos(format_name)
+    if infos is None:
+        return False
+
+    # 所有分割偏移都必须落在色度采样网格上
+    for info in infos:
+        align_x = 1 << info.shift_x
+        align_y = 1 << info.shift_y
+        if layout.width % align_x or layout.height % align_y:
+            return False
+        for src, dst in layout.views:
+            for rect in (src, dst):
+                if rect.x % align_x or rect.width % align_x:
+                    return False
+                if rect.y % align_y or rect.height % align_y:
+                    return False
+    return True
+
+
+def _frame_bytes(format_name: str, width: int, height: int) -> int:
+    """估算一帧画面占用的字节数"""
+    fmt = av.VideoFormat(format_name, width, height)
+    return width * height * fmt.padded_bits_per_pixel // 8
+
+
+class FramePool:
+    """输出帧池：预先分配并循环复用按输出布局排布的帧，避免逐帧申请大块内存
+
+    最多同时持有 capacity 帧，全部借出时 acquire 阻塞到有帧被归还，
+    由此把重排与编码之间的缓冲内存限制在 capacity 帧以内。
+    """
+
+    def __init__(self, capacity: int = 1):
+        if capacity < 1:
+            raise ValueError(f"帧池容量必须为正数，当前：{capacity}")
+        self.capacity = capacity
+        self._free: List[av.VideoFrame] = []
+        self._owned: Dict[int, av.VideoFrame] = {}
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(
+        self, width: int, height: int, format_name: str, fill: bool = False
+    ) -> av.VideoFrame:
+        """借出一帧；新分配的帧在 fill 为 True 时先整帧填充黑色"""
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("帧池已关闭")
+                while self._free:
+                    frame = self._free.pop()
+                    if (
+                        frame.width == width
+                        and frame.height == height
+                        and frame.format.name == format_name
+                    ):
+                        # 编码器仍持有该帧数据的引用时另行分配缓冲区，避免覆盖尚未编码的画面
+                        frame.make_writable()
+                        return frame
+                    # 画面规格变化，丢弃不再适用的帧
+                    del self._owned[id(frame)]
+                if len(self._owned) < self.capacity:
+                    break
+                self._condition.wait()
+
+            frame = av.VideoFrame(width, height, format_name)
+            self._owned[id(frame)] = frame
+
+        if fill:
+            _fill_black(frame)
+        return frame
+
+    def release(self, frame: av.VideoFrame) -> None:
+        """归还借出的帧，不属于本帧池的帧直接忽略"""
+
+        with self._condition:
+            if self._owned.get(id(frame)) is frame and not self._closed:
+                self._free.append(frame)
+                self._condition.notify()
+
+    def close(self) -> None:
+        """关闭帧池并唤醒所有等待中的 acquire，用于中断转换"""
+
+        with self._condition:
+            self._closed = True
+            self._free.clear()
+            self._owned.clear()
+            self._condition.notify_all()
+
+
+def _fill_black(frame: av.VideoFrame) -> None:
+    infos = _plane_infos(frame.format.name)
+    for info, plane in zip(infos, frame.planes):
+        _plane_array(plane, info.bytes_per_pixel)[:] = np.tile(
+            np.frombuffer(info.fill, dtype=np.uint8), plane.width
+        )
+
+
+def _rearrange_native(
+    frame: av.VideoFrame, layout: Layout, pool: Optional[FramePool] = None
+) -> av.VideoFrame:
+    """在原生像素格式下逐平面拷贝两路视图，避免 RGB 往返转换
+
+    给定 pool 时写入从帧池借出的帧，黑边只在帧首次分配时填充一次。
+    """
+
+    format_name = frame.format.name
+    infos = _plane_infos(format_name)
+    if pool is None:
+        out_frame = av.VideoFrame(layout.width, layout.height, format_name)
+        if not layout.covered:
+            _fill_black(out_frame)
+    else:
+        out_frame = pool.acquire(
+            layout.width, layout.height, format_name, fill=not layout.covered
+        )
+
+    for info, in_plane, out_plane in zip(infos, frame.planes, out_frame.planes):
+        src_array = _plane_array(in_plane, info.bytes_per_pixel)
+        dst_array = _plane_array(out_plane, info.bytes_per_pixel)
+
+        bpp = info.bytes_per_pixel
+        for src, dst in layout.views:
+            sx = (src.x >> info.shift_x) * bpp
+            sy = src.y >> info.shift_y
+            dx = (dst.x >> info.shift_x) * bpp
+            dy = dst.y >> info.shift_y
+            w = (src.width >> info.shift_x) * bpp
+            h = src.height >> info.shift_y
+            dst_array[dy : dy + h, dx : dx + w] = src_array[sy : sy + h, sx : sx + w]
+
+    out_frame.color_range = frame.color_range
+    out_frame.colorspace = frame.colorspace
+    return out_frame
+
+
+def _rearrange_rgb(
+    frame: av.VideoFrame,
+    layout: Layout,
     width: int,
     height: int,
-    frames: int,
-    split: float,
-    progress_callback=None,
+    pool: Optional[FramePool] = None,
+) -> av.VideoFrame:
+    """转换为 rgb24 后按平面拼接两路视图"""
+
+    if frame.format.name != "rgb24" or frame.width != width or frame.height != height:
+        frame = frame.reformat(width, height, "rgb24")
+    return _rearrange_native(frame, layout, pool)
+
+
+def rearrange_frame(
+    frame: av.VideoFrame,
+    layout: Layout,
+    width: int,
+    height: int,
+    pix_fmt: str,
+    pixel_mode: str = "native",
+    pool: Optional[FramePool] = None,
+) -> av.VideoFrame:
+    """按布局重排一帧并转换到编码器像素格式，native 模式不支持时回退到 RGB 路径
+
+    给定 pool 时重排结果写入从帧池借出的帧：无需再转换像素格式时直接返回该帧，
+    由调用方编码后归还；否则转换完成后立即归还。
+    """
+
+    arranged = _arrange(frame, layout, width, height, pixel_mode, pool)
+    return _to_encoder_format(arranged, frame, layout, pix_fmt, pool)
+
+
+def _arrange(
+    frame: av.VideoFrame,
+    layout: Layout,
+    width: int,
+    height: int,
+    pixel_mode: str,
+    pool: Optional[FramePool],
+) -> av.VideoFrame:
+    if pixel_mode == "native" and _native_supported(frame, layout, width, height):
+        return _rearrange_native(frame, layout, pool)
+    return _rearrange_rgb(frame, layout, width, height, pool)
+
+
+def _to_encoder_format(
+    arranged: av.VideoFrame,
+    frame: av.VideoFrame,
+    layout: Layout,
+    pix_fmt: str,
+    pool: Optional[FramePool],
+) -> av.VideoFrame:
+    """把重排结果缩放到输出尺寸并转换到编码器像素格式，并沿用源帧的时间戳"""
+
+    out_frame = arranged.reformat(layout.output_width, layout.output_height, pix_fmt)
+    if pool is not None and out_frame is not arranged:
+        pool.release(arranged)
+    out_frame.pts = frame.pts
+    if frame.time_base is not None:
+        out_frame.time_base = frame.time_base
+    return out_frame
+
+
+class FilterArranger:
+    """filter 引擎：在 libav 滤镜图中完成裁剪、拼接、缩放与像素格式转换
+
+    两路视图经 split 与 crop 取出，不等宽/高时用 pad 补黑边，再由 vstack / hstack
+    拼接；需要缩放或转换像素格式时在图的末端由 scale / format 完成。画面数据始终
+    留在 libav 的帧缓冲区中，Python 只传递帧对象。
+    与 native 引擎相同，帧尺寸与探测结果不一致或分割偏移不在色度采样网格上时，
+    先在图内转换为 rgb24。每种输入规格与目标像素格式各建一张图，按需创建并复用。
+    """
+
+    def __init__(self, layout: Layout, width: int, height: int):
+        self.layout = layout
+        self.width = width
+        self.height = height
+        self._graphs: Dict[Tuple, av.filter.Graph] = {}
+
+    def __call__(self, frame: av.VideoFrame, pix_fmt: str) -> av.VideoFrame:
+        key = (frame.width, frame.height, frame.format.name, pix_fmt)
+        graph = self._graphs.get(key)
+        if graph is None:
+            graph = self._graphs[key] = self._build(frame, pix_fmt)
+        graph.push(frame)
+        out_frame = graph.pull()
+        out_frame.pts = frame.pts
+        if frame.time_base is not None:
+            out_frame.time_base = frame.time_base
+        return out_frame
+
+    def _build(self, frame: av.VideoFrame, pix_fmt: str) -> av.filter.Graph:
+        layout = self.layout
+        graph = av.filter.Graph()
+        source = graph.add_buffer(
+            width=frame.width,
+            height=frame.height,
+            format=frame.format.name,
+            time_base=frame.time_base or Fraction(1, 90000),
+        )
+
+        def chain(node, *filters: Tuple[str, str]):
+            for name, args in filters:
+                next_node = graph.add(name, args)
+                node.link_to(next_node)
+                node = next_node
+            return node
+
+        if (frame.width, frame.height) != (self.width, self.height) or (
+            not _native_aligned(frame.format.name, layout)
+        ):
+            source = chain(
+                source,
+                ("scale", f"{self.width}:{self.height}:flags=bilinear"),
+                ("format", "rgb24"),
+            )
+
+        views = layout.views
+        if all(dst.x == 0 for _, dst in views):
+            stack, order = "vstack", sorted(range(len(views)), key=lambda i: views[i][1].y)
+        elif all(dst.y == 0 for _, dst in views):
+            stack, order = "hstack", sorted(range(len(views)), key=lambda i: views[i][1].x)
+        else:
+            raise ValueError(f"滤镜图引擎不支持的输出布局: {layout}")
+
+        splitter = graph.add("split", str(len(views))) if len(views) > 1 else None
+        if splitter is not None:
+            source.link_to(splitter)
+        parts = []
+        for output_index, view_index in enumerate(order):
+            src, dst = views[view_index]
+            crop = graph.add("crop", f"{src.width}:{src.height}:{src.x}:{src.y}")
+            if splitter is None:
+                source.link_to(crop)
+            else:
+                splitter.link_to(crop, output_index, 0)
+            part = crop
+            # 补齐到拼接方向之外的画面宽/高，黑边在右侧或下方
+            pad_width = layout.width if stack == "vstack" else src.width
+            pad_height = layout.height if stack == "hstack" else src.height
+            if (pad_width, pad_height) != (src.width, src.height):
+                part = chain(part, ("pad", f"{pad_width}:{pad_height}:0:0:black"))
+            parts.append(part)
+
+        if len(parts) > 1:
+            node = graph.add(stack, f"inputs={len(parts)}")
+            for input_index, part in enumerate(parts):
+                part.link_to(node, 0, input_index)
+        else:
+            node = parts[0]
+
+        # 缩放与像素格式转换使用与 reformat 相同的 bilinear 插值
+        node = chain(
+            node,
+            ("scale", f"{layout.output_width}:{layout.output_height}:flags=bilinear"),
+            ("format", pix_fmt),
+            ("buffersink", ""),
+        )
+        graph.configure()
+        return graph
+
+
+def plan_buffers(
+    frame_bytes: int,
+    pipeline: bool,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    memory_limit: Optional[int] = None,
+) -> Tuple[int, int]:
+    """返回 (帧池容量, 流水线队列容量)
+
+    流水线模式下每个队列位置约需一帧解码画面与一帧输出画面，帧池比队列多两帧
+    （分别被重排与编码阶段占用），使帧池本身不成为瓶颈；给定 memory_limit（字节）时
+    缩小队列，使缓冲的画面总量不超过该上限（至少保留一个队列位置）。
+    """
+
+    if queue_size < 1:
+        raise ValueError(f"队列容量必须为正数，当前：{queue_size}")
+    if memory_limit is not None and memory_limit <= 0:
+        raise ValueError(f"内存上限必须为正数，当前：{memory_limit}")
+    if not pipeline:
+        return 1, queue_size
+    if memory_limit is not None:
+        slots = memory_limit // max(2 * frame_bytes, 1) - 2
+        queue_size = max(1, min(queue_size, slots))
+    return queue_size + 2, queue_size
+
+
+def _add_output_streams(
+    in_container,
+    out_container,
+    out_width: int,
+    out_height: int,
+    streams: Optional[Iterable] = None,
+    codec_name: Optional[str] = None,
+    bit_rate: Optional[int] = None,
+) -> Dict[int, av.stream.Stream]:
+    """按输入容器的流结构创建输出流，视频流使用新的画面尺寸
+
+    streams 为需要映射的输入流，默认映射全部流；codec_name / bit_rate 覆盖视频流
+    沿用的编码器与码率。
+    """
+
+    stream_map = {}
+
+    for in_stream in in_container.streams if streams is None else streams:
+        if in_stream.type == "video":
+            video_bit_rate = bit_rate or in_stream.bit_rate
+            out_stream = out_container.add_stream(
+                codec_name=codec_name or in_stream.codec_context.codec.name,
+                rate=in_stream.average_rate,
+                width=out_width,
+                height=out_height,
+                bit_rate=video_bit_rate or 0,
+                time_base=in_stream.time_base,
+                options={
+                    "width": str(out_width),
+                    "height": str(out_height),
+                    "pix_fmt": str(in_stream.pix_fmt),
+                    "bit_rate": str(video_bit_rate),
+                    "time_base": str(in_stream.time_base),
+                    "bit_rate_tolerance": str(
+                        in_stream.codec_context.bit_rate_tolerance
+                    ),
+                },
+            )
+        elif in_stream.type == "audio":
+            out_stream = out_container.add_stream(
+                codec_name=in_stream.codec_context.codec.name,
+                rate=in_stream.sample_rate,
+                bit_rate=in_stream.bit_rate or 0,
+                time_base=in_stream.time_base,
+                options={
+                    "channels": str(in_stream.channels),
+                    "layout": str(in_stream.codec_context.layout),
+                    "bit_rate": str(in_stream.bit_rate),
+                    "time_base": str(in_stream.time_base),
+                    "bit_rate_tolerance": str(
+                        in_stream.codec_context.bit_rate_tolerance
+                    ),
+                },
+            )
+        else:
+            out_stream = out_container.add_stream(
+                codec_name=in_stream.codec_context.codec.name,
+                time_base=in_stream.time_base,
+                options={
+                    "time_base": str(in_stream.time_base),
+                },
+            )
+        if in_stream.type != "video" and in_stream.codec_context.extradata:
+            # 透传的数据包依赖原始的编码参数（如 AAC 的 AudioSpecificConfig），
+            # 封装为 MPEG-TS 等格式时需要据此生成帧头
+            out_stream.codec_context.extradata = in_stream.codec_context.extradata
+        stream_map[in_stream.index] = out_stream
+
+    return stream_map
+
+
+def _resolve_threads(threads: int, speed: Optional[str]) -> int:
+    """未显式指定线程数但选择了速度档位时，按进程可用的 CPU 数自动设置"""
+
+    if speed is not None and speed not in presets.SPEED_PRESETS:
+        raise ValueError(f"不支持的速度档位: {speed}")
+    if threads <= 0 and speed is not None:
+        return presets.available_cpus()
+    return threads
+
+
+def _configure_decoders(
+    codec_contexts: Iterable, threads: int, speed: Optional[str] = None
 ) -> None:
-    """将SBS格式转换为TAB格式"""
+    """设置解码器线程：threads 为 0 时沿用 libav 的自动设置，
+    指定速度档位时启用帧级与片级多线程"""
 
-    with av.open(input_path, mode="r") as in_container:
-        left_width = int(width * split)
-        right_width = width - left_width
+    for codec_context in codec_contexts:
+        # 复用的输入容器可能已在格式检测时打开过解码器，此时无法再修改线程设置；
+        # probe.VideoProbe 在打开容器时已按相同的设置配置过
+        if codec_context.is_open:
+            continue
+        if speed is not None:
+            codec_context.thread_type = "AUTO"
+        if threads > 0:
+            codec_context.thread_count = threads
 
-        tab_width = max(left_width, right_width)
-        tab_height = height * 2
 
-        with av.open(output_path, mode="w") as out_container:
-            stream_map = {}
-
-            for in_stream in in_container.streams:
-                if in_stream.type == "video":
-                    out_stream = out_container.add_stream(
-                        codec_name=in_stream.codec_context.codec.name,
-                        rate=in_stream.average_rate,
-                        width=tab_width,
-                        height=tab_height,
-                        bit_rate=in_stream.bit_rate,
-                        time_base=in_stream.time_base,
-                        options={
-                            "width": str(tab_width),
-                            "height": str(tab_height),
-                            "pix_fmt": str(in_stream.pix_fmt),
-                            "bit_rate": str(in_stream.bit_rate),
-                            "time_base": str(in_stream.time_base),
-                            "bit_rate_tolerance": str(
-                                in_stream.codec_context.bit_rate_tolerance
-                            ),
-                        },
-                    )
-                elif in_stream.type == "audio":
-                    out_stream = out_container.add_stream(
-                        codec_name=in_stream.codec_context.codec.name,
-                        rate=in_stream.sample_rate,
-                        bit_rate=in_stream.bit_rate,
-                        time_base=in_stream.time_base,
-                        options={
-                            "channels": str(in_stream.channels),
-                            "layout": str(in_stream.codec_context.layout),
-                            "bit_rate": str(in_stream.bit_rate),
-                            "time_base": str(in_stream.time_base),
-                            "bit_rate_tolerance": str(
-                                in_stream.codec_context.bit_rate_tolerance
-                            ),
-                        },
-                    )
-                else:
-                    out_stream = out_container.add_stream(
-                        codec_name=in_stream.codec_context.codec.name,
-                        time_base=in_stream.time_base,
-                        options={
-                            "time_base": str(in_stream.time_base),
-                        },
-                    )
-                stream_map[in_stream.index] = out_stream
+def _configure_encoders(
+    codec_contexts: Iterable, threads: int, speed: Optional[str] = None
+) -> None:
+    """设置编码器线程，指定速度档位时同时启用帧级/片级多线程并应用该编码器的预设"""
 
-            processed_frames = 0
+    for codec_context in codec_contexts:
+        if speed is not None:
+            codec_context.thread_type = "AUTO"
+            codec_context.options = {
+                **codec_context.options,
+                **presets.encoder_options(codec_context.name, speed, threads),
+            }
+        if threads > 0:
+            codec_context.thread_count = threads
 
-            for packet in in_container.demux():
-                in_stream_idx = packet.stream.index
-                out_stream = stream_map.get(in_stream_idx)
-                if out_stream is None:
-                    continue
 
-                if packet.stream.type == "video":
-                    for frame in packet.decode():
-                        if frame.format.name.startswith("yuv"):
-                            frame = frame.reformat(width, height, "rgb24")
-                        img = frame.to_ndarray()
+def open_input(input_path: str, input_format: Optional[str] = None):
+    """打开输入容器，路径为 "-" 时从标准输入读取（不可定位的流）"""
 
-                        left_part = img[:, :left_width, :]
-                        right_part = img[:, left_width:, :]
+    if input_path == STREAM_PATH:
+        return av.open(sys.stdin.buffer, mode="r", format=input_format)
+    return av.open(input_path, mode="r", format=input_format)
 
-                        tab_img = np.vstack([left_part, right_part])
 
-                        out_frame = av.VideoFrame.from_ndarray(tab_img, format="rgb24")
-                        out_frame = out_frame.reformat(
-                            tab_width, tab_height, out_stream.pix_fmt
-                        )
-                        out_frame.pts = frame.pts
-                        out_frame.time_base = frame.time_base
+def _segment_options(
+    output_path: str, format_name: str, segment_seconds: float
+) -> Dict[str, str]:
+    """分段写入的封装选项：HLS / DASH 的分段文件与输出同名并加序号，放在同一目录下"""
+
+    directory, name = os.path.split(output_path)
+    name = os.path.splitext(name)[0]
+    if format_name == "hls":
+        return {
+            "hls_time": str(segment_seconds),
+            # EVENT 播放列表只追加分段，写完一段即可开始播放，结束时补上 ENDLIST
+            "hls_playlist_type": "event",
+            "hls_segment_type": "fmp4",
+            "hls_fmp4_init_filename": f"{name}_init.mp4",
+            "hls_segment_filename": os.path.join(directory, f"{name}_%05d.m4s"),
+            # 分段先写入临时文件，完成后才改名出现，上传工具不会读到写了一半的分段
+            "hls_flags": "independent_segments+temp_file",
+        }
+    if format_name == "dash":
+        return {
+            "seg_duration": str(segment_seconds),
+            "use_template": "1",
+            "use_timeline": "1",
+            "init_seg_name": f"{name}_init_$RepresentationID$.m4s",
+            "media_seg_name": f"{name}_$RepresentationID$_$Number%05d$.m4s",
+        }
+    if format_name in FRAGMENTED_FORMATS:
+        return {
+            "movflags": "frag_keyframe+empty_moov+default_base_moof",
+            "min_frag_duration": str(round(segment_seconds * 1_000_000)),
+        }
+    # Matroska、MPEG-TS 等格式本身即可边写边读，只需按分段时长插入关键帧
+    return {}
+
+
+def segment_files(output_path: str) -> List[str]:
+    """输出为 HLS / DASH 时在同一目录下写入的分段、初始化分段与临时文件（只列出已存在的）"""
 
-                        for out_packet in out_stream.encode(out_frame):
-                            out_packet.stream = out_stream
-                            out_container.mux(out_packet)
+    directory, name = os.path.split(output_path)
+    name = os.path.splitext(name)[0]
+    prefix = os.path.join(glob.escape(directory), glob.escape(name))
+    patterns = (
+        # HLS：{name}_init.mp4、{name}_00001.m4s 及写入中的 .tmp
+        f"{prefix}_init.mp4",
+        f"{prefix}_[0-9]*.m4s*",
+        # DASH：{name}_init_0.m4s、{name}_0_00001.m4s
+        f"{prefix}_init_*.m4s*",
+        f"{prefix}_*_[0-9]*.m4s*",
+        # 播放列表先写入 .tmp 再改名
+        f"{glob.escape(output_path)}.tmp",
+    )
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
 
-                        if progress_callback and frames > 0:
-                            processed_frames += 1
-                            progress = min(processed_frames / frames * 100, 100.0)
-                            progress_callback(progress)
 
+def segmented_output(
+    output_path: str,
+    output_format: Optional[str] = None,
+    segment_seconds: Optional[float] = None,
+) -> bool:
+    """在打开输出之前判断是否分段写入，供转换前的参数校验使用"""
+
+    return (
+        segment_seconds is not None
+        or output_format in SEGMENTED_FORMATS
+        or os.path.splitext(output_path)[1].lower() in (".m3u8", ".mpd")
+    )
+
+
+def segment_duration(
+    out_container, segment_seconds: Optional[float]
+) -> Optional[float]:
+    """输出容器实际使用的分段时长：HLS / DASH 未指定时取默认值，其余格式未指定时不分段"""
+
+    if segment_seconds is None and out_container.format.name in SEGMENTED_FORMATS:
+        return DEFAULT_SEGMENT_SECONDS
+    return segment_seconds
+
+
+def open_output(
+    output_path: str,
+    output_format: Optional[str] = None,
+    segment_seconds: Optional[float] = None,
+):
+    """打开输出容器，路径为 "-" 时写入标准输出
+
+    标准输出不可定位，未指定格式时使用 Matroska；MP4/MOV 改为分片写入，
+    无需在结尾回写 moov。
+    给定 segment_seconds（秒）或输出为 HLS / DASH（.m3u8 / .mpd）时分段写入：
+    HLS / DASH 每写完一个分片 MP4 分段即更新播放列表，MP4/MOV 每个分段写为一个分片，
+    下游在转换开始后数秒内即可开始上传或播放，结束时无需回写或复制整个文件。
+    分段边界处的关键帧由转换流程按时间强制插入，见 _segment_keyframes。
+    """
+
+    if segment_seconds is not None and segment_seconds <= 0:
+        raise ValueError(f"分段时长必须为正数，当前：{segment_seconds}")
+
+    if output_path != STREAM_PATH:
+        container = av.open(output_path, mode="w", format=output_format)
+        segment_seconds = segment_duration(container, segment_seconds)
+        if segment_seconds is not None:
+            # 封装选项在写入文件头时才生效，按 libav 实际选用的封装格式设置
+            container.options.update(
+                _segment_options(output_path, container.format.name, segment_seconds)
+            )
+        return container
+
+    output_format = output_format or DEFAULT_STREAM_FORMAT
+    if output_format in SEGMENTED_FORMATS:
+        raise ValueError(f"{output_format} 分段输出须写入文件，不能写入标准输出")
+    options = {}
+    if output_format in FRAGMENTED_FORMATS:
+        options["movflags"] = "frag_keyframe+empty_moov+default_base_moof"
+        if segment_seconds is not None:
+            options["min_frag_duration"] = str(round(segment_seconds * 1_000_000))
+    return av.open(sys.stdout.buffer, mode="w", format=output_format, options=options)
+
+
+@contextmanager
+def _open_input(
+    input_path: str, in_container=None, input_format: Optional[str] = None
+) -> Iterator:
+    """打开输入容器；传入已打开的容器时直接复用，由调用方负责关闭"""
+
+    if in_container is not None:
+        yield in_container
+        return
+    with open_input(input_path, input_format) as container:
+        yield container
+
+
+def _prefetch(iterable: Iterable, queue_size: int) -> Iterator:
+    """在后台线程中迭代 iterable，经有界队列把结果按原顺序交给调用方"""
+
+    items: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+        finally:
+            # 下游提前结束时关闭上游生成器，使其所在的流水线阶段也随之退出
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _demux_decode(
+    in_container,
+    stream_indices: Iterable[int],
+    start_pts: Optional[int] = None,
+    end_pts: Optional[int] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Iterator:
+    """解复用并解码：视频流产出解码后的帧，其余流原样产出数据包
+
+    产出 (输入流序号, 帧或数据包)，只处理 stream_indices 中的流。
+    给定 start_pts / end_pts 时只产出显示时间戳位于 [start_pts, end_pts) 的视频帧。
+    """
+
+    stream_indices = set(stream_indices)
+    decode = profiling.wrap(profiler, "decode", av.Packet.decode)
+
+    for packet in profiling.iterate(profiler, "demux", in_container.demux()):
+        index = packet.stream.index
+        if index not in stream_indices:
+            continue
+
+        if packet.stream.type == "video":
+            for frame in decode(packet):
+                if frame.pts is not None:
+                    if start_pts is not None and frame.pts < start_pts:
+                        continue
+                    if end_pts is not None and frame.pts >= end_pts:
+                        return
+                yield index, frame
+        elif packet.dts is not None:
+            # 跳过解复用结束时用于冲刷解码器的空数据包
+            yield index, packet
+
+
+def _copy_packet(packet: av.Packet) -> av.Packet:
+    """复制数据包：封装时会取走数据包的内容，同一数据包写入多个输出前需各自复制"""
+
+    copy = av.Packet(bytes(packet))
+    copy.pts = packet.pts
+    copy.dts = packet.dts
+    copy.duration = packet.duration
+    copy.time_base = packet.time_base
+    copy.is_keyframe = packet.is_keyframe
+    return copy
+
+
+def _broadcast(
+    items: Iterable, count: int, queue_size: int
+) -> Tuple[List[Iterator], Callable[[], None]]:
+    """在后台线程中迭代 items，把每一项分发给 count 个消费者，返回各消费者的迭代器
+    及停止函数
+
+    视频帧只读共享，不复制；透传的数据包为每个消费者各复制一份。各消费者经容量为
+    queue_size 的有界队列取数，最慢的消费者决定整体进度。停止函数使所有迭代器尽快
+    结束并等待后台线程退出，之后才能关闭上游。
+    """
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(count)]
+    stop = threading.Event()
+
+    def put(items_queue: "queue.Queue", item) -> bool:
+        while not stop.is_set():
+            try:
+                items_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for index, item in items:
+                if isinstance(item, av.VideoFrame):
+                    copies = [item] * count
                 else:
-                    packet.stream = out_stream
+                    copies = [item] + [_copy_packet(item) for _ in range(count - 1)]
+                for items_queue, copy in zip(queues, copies):
+                    if not put(items_queue, ((index, copy), None)):
+                        return
+            for items_queue in queues:
+                put(items_queue, (_END, None))
+        except BaseException as e:
+            for items_queue in queues:
+                put(items_queue, (_END, e))
 
-                    out_container.mux(packet)
+    def consume(items_queue: "queue.Queue") -> Iterator:
+        while True:
+            try:
+                item, error = items_queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
 
-            for out_stream in stream_map.values():
-                for out_packet in out_stream.encode():
-                    out_packet.stream = out_stream
-                    out_container.mux(out_packet)
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
 
+    def close() -> None:
+        stop.set()
+        thread.join()
 
-def tab_to_sbs(
+    return [consume(items_queue) for items_queue in queues], close
+
+
+def _range_pts(
+    video_stream, start: Optional[float], duration: Optional[float]
+) -> Tuple[Optional[int], Optional[int]]:
+    """把相对文件开头的 start / duration（秒）换算为视频流中 [start_pts, end_pts) 的时间戳"""
+
+    time_base = video_stream.time_base
+    base = video_stream.start_time or 0
+    start_pts = base + round((start or 0.0) / time_base)
+    end_pts = None if duration is None else start_pts + round(duration / time_base)
+    return start_pts if start else None, end_pts
+
+
+def _trim_range(
+    items: Iterable,
+    streams,
+    video_stream,
+    start: Optional[float],
+    duration: Optional[float],
+) -> Iterator:
+    """裁剪透传数据包到与视频相同的时间范围，并把所有时间戳前移 start 秒
+
+    视频帧已在解码时按显示时间戳精确裁剪；音频等透传流不重新编码，按数据包的
+    时间戳取舍。
+    """
+
+    start = start or 0.0
+    begin = float((video_stream.start_time or 0) * video_stream.time_base) + start
+    end = None if duration is None else begin + duration
+    offsets = {stream.index: round(start / stream.time_base) for stream in streams}
+
+    for index, item in items:
+        offset = offsets[index]
+        if isinstance(item, av.VideoFrame):
+            if item.pts is not None:
+                item.pts -= offset
+        else:
+            pts = item.pts if item.pts is not None else item.dts
+            seconds = float(pts * item.time_base)
+            if seconds < begin or (end is not None and seconds >= end):
+                continue
+            item.pts = None if item.pts is None else item.pts - offset
+            item.dts = item.dts - offset
+        yield index, item
+
+
+def _lookahead(items: Iterator, frame_count: int) -> Tuple[List, Iterator]:
+    """预读 items 直到得到 frame_count 个视频帧，返回已读部分及从头重放的迭代器"""
+
+    buffered = []
+    frames = 0
+    for item in items:
+        buffered.append(item)
+        if isinstance(item[1], av.VideoFrame):
+            frames += 1
+            if frames >= frame_count:
+                break
+
+    def replay() -> Iterator:
+        try:
+            yield from buffered
+            yield from items
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    return buffered, replay()
+
+
+def _rearrange_frames(
+    items: Iterable,
+    stream_map: Dict[int, av.stream.Stream],
+    layout: Layout,
+    width: int,
+    height: int,
+    pixel_mode: str,
+    pool: Optional[FramePool] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> Iterator:
+    """对视频帧做画面重排，数据包直接透传"""
+
+    if pixel_mode == "filter":
+        filter_frame = profiling.wrap(
+            profiler, "filter", FilterArranger(layout, width, height)
+        )
+    else:
+        arrange = profiling.wrap(profiler, "rearrange", _arrange)
+        to_encoder_format = profiling.wrap(profiler, "reformat", _to_encoder_format)
+
+    for index, item in items:
+        if isinstance(item, av.VideoFrame):
+            if pixel_mode == "filter":
+                item = filter_frame(item, stream_map[index].pix_fmt)
+            else:
+                arranged = arrange(item, layout, width, height, pixel_mode, pool)
+                item = to_encoder_format(
+                    arranged, item, layout, stream_map[index].pix_fmt, pool
+                )
+        yield index, item
+
+
+def _segment_keyframes(items: Iterable, segment_seconds: float) -> Iterator:
+    """按分段时长强制关键帧：每个分段的首帧设为 I 帧，其余帧清除从源视频沿用的帧类型
+
+    解码帧带有源视频的帧类型，直接送入编码器时源视频的关键帧也会成为输出的关键帧，
+    分段边界随之偏移；清除后分段边界只由时间决定，与编码器的 GOP 设置无关。
+    """
+
+    next_time = None
+    for index, item in items:
+        if isinstance(item, av.VideoFrame):
+            time = item.time
+            if time is not None and (next_time is None or time >= next_time):
+                item.pict_type = av.video.frame.PictureType.I
+                segment = math.floor(time / segment_seconds + 1e-9)
+                next_time = (segment + 1) * segment_seconds
+            else:
+                item.pict_type = av.video.frame.PictureType.NONE
+        yield index, item
+
+
+def _encode_mux(
+    out_container,
+    items: Iterable,
+    stream_map: Dict[int, av.stream.Stream],
+    tracker: Optional[progress.ProgressTracker] = None,
+    pool: Optional[FramePool] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> int:
+    """编码视频帧并与透传的数据包一起写入输出容器，返回编码的帧数
+
+    给定 pool 时，帧送入编码器后即归还帧池；给定 tracker 时每编码一帧更新一次进度。
+    """
+
+    processed_frames = 0
+    bytes_written = 0
+    video_bytes = 0
+    encode = profiling.wrap(profiler, "encode", av.video.stream.VideoStream.encode)
+    mux = profiling.wrap(profiler, "mux", out_container.mux)
+
+    for index, item in items:
+        out_stream = stream_map[index]
+        if isinstance(item, av.VideoFrame):
+            for out_packet in encode(out_stream, item):
+                out_packet.stream = out_stream
+                video_bytes += out_packet.size
+                mux(out_packet)
+            if pool is not None:
+                pool.release(item)
+
+            processed_frames += 1
+            if tracker is not None:
+                tracker.update(
+                    processed_frames, bytes_written + video_bytes, video_bytes
+                )
+
+        else:
+            item.stream = out_stream
+            bytes_written += item.size
+
+            mux(item)
+
+    for out_stream in stream_map.values():
+        # 只有视频流经过编码器，透传的流没有需要冲刷的编码器缓存
+        if out_stream.type != "video":
+            continue
+        for out_packet in encode(out_stream):
+            out_packet.stream = out_stream
+            video_bytes += out_packet.size
+            mux(out_packet)
+
+    if tracker is not None:
+        tracker.update(processed_frames, bytes_written + video_bytes, video_bytes)
+    return processed_frames
+
+
+def _convert_branches(
+    items: Iterable,
+    branches: List[Tuple],
+    width: int,
+    height: int,
+    pixel_mode: str,
+    queue_size: int,
+    tracker: Optional[progress.ProgressTracker] = None,
+    profiler: Optional[profiling.Profiler] = None,
+) -> int:
+    """把解码结果分发给多个输出，每个输出在独立线程中重排、编码并封装
+
+    branches 中每项为 (输出容器, 流映射, 布局, 帧池, 分段时长)。任一输出出错时其余
+    输出随之停止，错误在所有线程退出后抛出。返回编码的帧数。
+    """
+
+    sources, stop = _broadcast(items, len(branches), queue_size)
+    trackers = (
+        tracker.branches(len(branches)) if tracker is not None else [None] * len(branches)
+    )
+    results = [0] * len(branches)
+    errors: List[BaseException] = []
+
+    def run(index: int) -> None:
+        out_container, stream_map, layout, pool, segment_seconds = branches[index]
+        rearranged = _rearrange_frames(
+            sources[index],
+            stream_map,
+            layout,
+            width,
+            height,
+            pixel_mode,
+            pool,
+            profiler,
+        )
+        if segment_seconds is not None:
+            rearranged = _segment_keyframes(rearranged, segment_seconds)
+        try:
+            results[index] = _encode_mux(
+                out_container, rearranged, stream_map, trackers[index], pool, profiler
+            )
+        except BaseException as e:
+            errors.append(e)
+            # 唤醒可能阻塞在帧池上的其他输出，使其尽快退出
+            for _, _, _, other_pool, _ in branches:
+                other_pool.close()
+            stop()
+        finally:
+            rearranged.close()
+
+    workers = [
+        threading.Thread(target=run, args=(index,), daemon=True)
+        for index in range(len(branches))
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        stop()
+        for _, _, _, pool, _ in branches:
+            pool.close()
+        for worker in workers:
+            worker.join()
+
+    if errors:
+        raise errors[0]
+    return results[0]
+
+
+def convert_segment(
+    mode: str,
     input_path: str,
     output_path: str,
     width: int,
     height: int,
-    frames: int,
     split: float,
-    progress_callback=None,
-) -> None:
-    """将SBS格式转换为TAB格式"""
+    start_pts: Optional[int] = None,
+    end_pts: Optional[int] = None,
+    pixel_mode: str = "native",
+    threads: int = 0,
+    speed: Optional[str] = None,
+    half: bool = False,
+    profiler: Optional[profiling.Profiler] = None,
+) -> int:
+    """只转换首个视频流中显示时间戳位于 [start_pts, end_pts) 的帧，返回写入的帧数
 
-    with av.open(input_path, mode="r") as in_container:
-        top_height = int(height * split)
-        bottom_height = height - top_height
+    start_pts 应为关键帧的时间戳，输入会先定位到该关键帧再开始解码；
+    输出只包含视频流，帧保留原始时间戳，供分段并行转换后拼接使用。
+    """
+
+    if pixel_mode not in PIXEL_MODES:
+        raise ValueError(f"不支持的像素处理模式: {pixel_mode}")
 
-        tab_width = width * 2
-        tab_height = max(top_height, bottom_height)
+    layout = plan_layout(mode, width, height, split, half)
+    threads = _resolve_threads(threads, speed)
+
+    with av.open(input_path, mode="r") as in_container:
+        video_stream = in_container.streams.video[0]
+        _configure_decoders([video_stream.codec_context], threads, speed)
 
         with av.open(output_path, mode="w") as out_container:
-            stream_map = {}
-
-            for in_stream in in_container.streams:
-                if in_stream.type == "video":
-                    out_stream = out_container.add_stream(
-                        codec_name=in_stream.codec_context.codec.name,
-                        rate=in_stream.average_rate,
-                        width=tab_width,
-                        height=tab_height,
-                        bit_rate=in_stream.bit_rate,
-                        time_base=in_stream.time_base,
-                        options={
-                            "width": str(tab_width),
-                            "height": str(tab_height),
-                            "pix_fmt": str(in_stream.pix_fmt),
-                            "bit_rate": str(in_stream.bit_rate),
-                            "time_base": str(in_stream.time_base),
-                            "bit_rate_tolerance": str(
-                                in_stream.codec_context.bit_rate_tolerance
-                            ),
-                        },
+            stream_map = _add_output_streams(
+                in_container,
+                out_container,
+                layout.output_width,
+                layout.output_height,
+                streams=[video_stream],
+            )
+            _configure_encoders(
+                [stream_map[video_stream.index].codec_context], threads, speed
+            )
+
+            if start_pts is not None:
+                in_container.seek(start_pts, backward=True, stream=video_stream)
+
+            pool = FramePool()
+            items = _rearrange_frames(
+                _demux_decode(in_container, stream_map, start_pts, end_pts, profiler),
+                stream_map,
+                layout,
+                width,
+                height,
+                pixel_mode,
+                pool,
+                profiler,
+            )
+            try:
+                return _encode_mux(
+                    out_container, items, stream_map, pool=pool, profiler=profiler
+                )
+            finally:
+                pool.close()
+                items.close()
+
+
+def convert(
+    mode: Optional[str],
+    input_path: str,
+    output_path: str,
+    width: int,
+    height: int,
+    frames: int,
+    split: float,
+    tracker: Optional[progress.ProgressTracker] = None,
+    pixel_mode: str = "native",
+    pipeline: bool = False,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    threads: int = 0,
+    speed: Optional[str] = None,
+    in_container=None,
+    detector: Optional[Callable[[List[np.ndarray]], Tuple[str, float]]] = None,
+    detect_frames: int = DEFAULT_DETECT_FRAMES,
+    input_format: Optional[str] = None,
+    output_format: Optional[str] = None,
+    memory_limit: Optional[int] = None,
+    profiler: Optional[profiling.Profiler] = None,
+    half: bool = False,
+    start: Optional[float] = None,
+    duration: Optional[float] = None,
+    outputs: Sequence[OutputSpec] = (),
+    segment_seconds: Optional[float] = None,
+) -> int:
+    """sbs_to_tab / tab_to_sbs 的公共转换流程，返回编码的帧数
+
+    pipeline 为 True 时，解码、画面重排、编码/封装分别运行在独立线程中，
+    阶段之间通过容量为 queue_size 的有界队列衔接；输出与顺序执行完全一致。
+    threads 为视频解码器与编码器各自使用的线程数，0 表示由 libav 自动决定。
+    speed 为 presets.SPEED_PRESETS 中的速度档位：编解码器启用帧级/片级多线程，编码器
+    使用该档位的预设，未指定 threads 时按进程可用的 CPU 数设置线程数；为 None 时
+    保持编码器默认设置。
+    in_container 为已打开的输入容器（如 probe.VideoProbe 持有的容器），避免重复打开文件。
+    mode 为 None 时先缓存前 detect_frames 个解码帧，交给 detector 得到 (mode, split)，
+    再把缓存的帧送入编码器，整个过程无需定位，适用于管道输入。
+    输入/输出路径为 "-" 时读写标准输入/输出，input_format / output_format 指定封装格式。
+    重排结果写入预先分配、循环复用的输出帧；memory_limit（字节）限制流水线中缓冲的画面总量。
+    给定 profiler 时记录解复用、解码、重排、像素格式转换、编码与封装各阶段的耗时。
+    给定 tracker 时每编码一帧更新一次进度，tracker 未设置总帧数时以 frames 为准。
+    half 为 True 时输出与源视频分辨率相同的半宽 SBS / 半高 TAB。
+    给定 start / duration（秒）时只转换该时间范围：先定位到起点之前最近的关键帧，
+    解码到终点即停止，视频按帧精确裁剪，音频等透传流取同一范围内的数据包，
+    输出时间戳从 0 开始。
+    outputs 为同时写入的其他输出：每帧只解码一次，各输出从同一解码帧重排并在各自的
+    线程中编码、封装，见 _convert_branches。
+    segment_seconds 指定主输出分段写入的分段时长（秒），输出为 HLS / DASH 时默认分段，
+    见 open_output。
+    """
+
+    if pixel_mode not in PIXEL_MODES:
+        raise ValueError(f"不支持的像素处理模式: {pixel_mode}")
+    if (start is not None and start < 0) or (duration is not None and duration <= 0):
+        raise ValueError(f"无效的时间范围：起点 {start}，时长 {duration}")
+    if mode is None and detector is None:
+        raise ValueError("未指定转换模式时必须提供分割线检测函数")
+    threads = _resolve_threads(threads, speed)
+    if tracker is not None and tracker.total_frames <= 0:
+        tracker.total_frames = frames
+    specs = [
+        OutputSpec(
+            output_path,
+            "half" if half else "full",
+            format=output_format,
+            segment_seconds=segment_seconds,
+        ),
+        *outputs,
+    ]
+
+    with _open_input(input_path, in_container, input_format) as in_container:
+        video_streams = in_container.streams.video
+        _configure_decoders(
+            [stream.codec_context for stream in video_streams], threads, speed
+        )
+
+        decoded_format = video_streams[0].codec_context.format if video_streams else None
+        pool_size, queue_size = plan_buffers(
+            _frame_bytes(
+                decoded_format.name if decoded_format else "yuv420p", width, height
+            )
+            * len(specs),
+            pipeline,
+            queue_size,
+            memory_limit,
+        )
+        pools = [FramePool(pool_size) for _ in specs]
+
+        start_pts = end_pts = None
+        if start or duration is not None:
+            start_pts, end_pts = _range_pts(video_streams[0], start, duration)
+            if start_pts is not None and input_path != STREAM_PATH:
+                # 直接定位到起点之前最近的关键帧，只解码其后的画面
+                in_container.seek(start_pts, backward=True, stream=video_streams[0])
+
+        stages = [
+            _demux_decode(
+                in_container,
+                [s.index for s in in_container.streams],
+                start_pts,
+                end_pts,
+                profiler,
+            )
+        ]
+        try:
+            if start or duration is not None:
+                stages.append(
+                    _trim_range(
+                        stages[-1],
+                        in_container.streams,
+                        video_streams[0],
+                        start,
+                        duration,
                     )
-                elif in_stream.type == "audio":
-                    out_stream = out_container.add_stream(
-                        codec_name=in_stream.codec_context.codec.name,
-                        rate=in_stream.sample_rate,
-                        bit_rate=in_stream.bit_rate,
-                        time_base=in_stream.time_base,
-                        options={
-                            "channels": str(in_stream.channels),
-                            "layout": str(in_stream.codec_context.layout),
-                            "bit_rate": str(in_stream.bit_rate),
-                            "time_base": str(in_stream.time_base),
-                            "bit_rate_tolerance": str(
-                                in_stream.codec_context.bit_rate_tolerance
-                            ),
-                        },
+                )
+            if pipeline:
+                stages.append(_prefetch(stages[-1], queue_size))
+
+            if mode is None:
+                buffered, replay = _lookahead(stages[-1], detect_frames)
+                stages.append(replay)
+                with profiling.stage(profiler, "detect.search"):
+                    mode, split = detector(
+                        [
+                            item.to_ndarray(format="bgr24")
+                            for _, item in buffered
+                            if isinstance(item, av.VideoFrame)
+                        ]
                     )
-                else:
-                    out_stream = out_container.add_stream(
-                        codec_name=in_stream.codec_context.codec.name,
-                        time_base=in_stream.time_base,
-                        options={
-                            "time_base": str(in_stream.time_base),
-                        },
+
+            layouts = [plan_output(mode, width, height, split, spec) for spec in specs]
+
+            with ExitStack() as outputs:
+                branches = []
+                for spec, layout, pool in zip(specs, layouts, pools):
+                    out_container = outputs.enter_context(
+                        open_output(spec.path, spec.format, spec.segment_seconds)
+                    )
+                    stream_map = _add_output_streams(
+                        in_container,
+                        out_container,
+                        layout.output_width,
+                        layout.output_height,
+                        codec_name=spec.codec,
+                        bit_rate=spec.bit_rate,
+                    )
+                    _configure_encoders(
+                        [
+                            stream.codec_context
+                            for stream in stream_map.values()
+                            if stream.type == "video"
+                        ],
+                        threads,
+                        speed,
+                    )
+                    branches.append(
+                        (
+                            out_container,
+                            stream_map,
+                            layout,
+                            pool,
+                            segment_duration(out_container, spec.segment_seconds),
+                        )
                     )
 
-                stream_map[in_stream.index] = out_stream
+                if len(branches) > 1:
+                    return _convert_branches(
+                        stages[-1],
+                        branches,
+                        width,
+                        height,
+                        pixel_mode,
+                        queue_size,
+                        tracker,
+                        profiler,
+                    )
 
-            processed_frames = 0
+                out_container, stream_map, layout, pool, segment_seconds = branches[0]
+                stages.append(
+                    _rearrange_frames(
+                        stages[-1],
+                        stream_map,
+                        layout,
+                        width,
+                        height,
+                        pixel_mode,
+                        pool,
+                        profiler,
+                    )
+                )
+                if segment_seconds is not None:
+                    stages.append(_segment_keyframes(stages[-1], segment_seconds))
+                if pipeline:
+                    stages.append(_prefetch(stages[-1], queue_size))
 
-            for packet in in_container.demux():
-                in_stream_idx = packet.stream.index
-                out_stream = stream_map.get(in_stream_idx)
-                if out_stream is None:
-                    continue
+                return _encode_mux(
+                    out_container,
+                    stages[-1],
+                    stream_map,
+                    tracker,
+                    pool,
+                    profiler,
+                )
+        finally:
+            # 先关闭帧池唤醒可能阻塞在 acquire 上的重排线程，
+            # 再由下游到上游依次关闭，确保出错或中断时后台线程全部退出
+            for pool in pools:
+                pool.close()
+            for stage in reversed(stages):
+                stage.close()
 
-                if packet.stream.type == "video":
-                    for frame in packet.decode():
-                        if frame.format.name.startswith("yuv"):
-                            frame = frame.reformat(width, height, "rgb24")
-                        img = frame.to_ndarray()
 
-                        top_part = img[:top_height, :, :]
-                        bottom_part = img[top_height:, :, :]
+def _percent_tracker(
+    progress_callback: Optional[Callable[[float], None]], frames: int
+) -> Optional[progress.ProgressTracker]:
+    """把 sbs_to_tab / tab_to_sbs 的 progress_callback（以完成百分比为参数，每编码一帧
+    调用一次）包装为 ProgressTracker；总帧数未知时与原来一样不回调"""
 
-                        tab_img = np.hstack([top_part, bottom_part])
+    if progress_callback is None or frames <= 0:
+        return None
 
-                        out_frame = av.VideoFrame.from_ndarray(tab_img, format="rgb24")
-                        out_frame = out_frame.reformat(
-                            tab_width, tab_height, out_stream.pix_fmt
-                        )
-                        out_frame.pts = frame.pts
-                        out_frame.time_base = frame.time_base
+    def report(snapshot: progress.Progress) -> None:
+        progress_callback(snapshot.percent)
 
-                        for out_packet in out_stream.encode(out_frame):
-                            out_packet.stream = out_stream
-                            out_container.mux(out_packet)
+    return progress.ProgressTracker(frames, callback=report, interval=0)
 
-                        if progress_callback and frames > 0:
-                            processed_frames += 1
-                            progress = min(processed_frames / frames * 100, 100)
-                            progress_callback(progress)
 
-                else:
-                    packet.stream = out_stream
+def sbs_to_tab(
+    input_path: str,
+    output_path: str,
+    width: int,
+    height: int,
+    frames: int,
+    split: float,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    *,
+    tracker: Optional[progress.ProgressTracker] = None,
+    **options,
+) -> int:
+    """将SBS格式转换为TAB格式，options 见 convert
+
+    progress_callback 以完成百分比（0–100）为参数，每编码一帧调用一次；需要速度、
+    码率、剩余时间或取消时改为传入 tracker，两者不能同时给出。
+    """
+
+    if progress_callback is not None and tracker is not None:
+        raise ValueError("progress_callback 与 tracker 不能同时指定")
+    return convert(
+        "sbs2tab",
+        input_path,
+        output_path,
+        width,
+        height,
+        frames,
+        split,
+        tracker or _percent_tracker(progress_callback, frames),
+        **options,
+    )
 
-                    out_container.mux(packet)
 
-            for out_stream in stream_map.values():
-                for out_packet in out_stream.encode():
-                    out_packet.stream = out_stream
-                    out_container.mux(out_packet)
+def tab_to_sbs(
+    input_path: str,
+    output_path: str,
+    width: int,
+    height: int,
+    frames: int,
+    split: float,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    *,
+    tracker: Optional[progress.ProgressTracker] = None,
+    **options,
+) -> int:
+    """将TAB格式转换为SBS格式，参数见 sbs_to_tab"""
+
+    if progress_callback is not None and tracker is not None:
+        raise ValueError("progress_callback 与 tracker 不能同时指定")
+    return convert(
+        "tab2sbs",
+        input_path,
+        output_path,
+        width,
+        height,
+        frames,
+        split,
+        tracker or _percent_tracker(progress_callback, frames),
+        **options,
+    )
@@ -1,11 +1,16 @@
 import enum
 from pathlib import Path
 import random
+import sys
 import av
-import cv2
 import numpy as np
-from typing import Tuple, Optional, List
-from skimage.metrics import structural_similarity as ssim
+from typing import Callable, Iterator, Tuple, Optional, List
+
+import profiling
+import progress
+
+# cv2 与 skimage（连带 scipy）的导入耗时数百毫秒，只在实际进行分割线检测的函数中导入，
+# 指定转换模式或按宽高比即可判断格式时不会加载
 
 
 class VideoFormat(enum.Enum):
@@ -65,130 +70,485 @@ def get_video_format(width: int, height: int) -> VideoFormat:
         elif min_tab_diff < min_sbs_diff:
             return VideoFormat.tab
         else:
-            print(f"无法根据宽高比判断视频格式")
+            print(f"无法根据宽高比判断视频格式", file=sys.stderr)
             return VideoFormat.notsure
     elif sbs_candidate:
         return VideoFormat.sbs
     elif tab_candidate:
         return VideoFormat.tab
     else:
-        print(f"无法根据宽高比判断视频格式")
+        print(f"无法根据宽高比判断视频格式", file=sys.stderr)
         return VideoFormat.notsure
 
 
-def sample_frames(
+def _sample_targets(
+    container,
+    video_stream,
+    num_frames: int,
+    random_seed: Optional[int],
+    middle_ratio: float,
+) -> List[int]:
+    """在视频中间区域随机挑选待抽取的帧序号
+
+    帧数按流时长 × 帧率计算；流时长缺失时（如部分 MKV）依次改用容器时长估算、
+    流头部记录的帧数，都无法得到时再扫描数据包计数。
+    """
+
+    total_frames = (
+        int(video_stream.duration * video_stream.time_base * video_stream.average_rate)
+        if video_stream.duration and video_stream.time_base
+        else 0
+    )
+    if total_frames <= 0:
+        total_frames = (
+            estimate_frame_count(container, video_stream)
+            or video_stream.frames
+            or count_frames(container, video_stream)
+        )
+
+    if total_frames <= 0:
+        raise ValueError("无法获取视频帧数")
+
+    actual_num = min(num_frames, total_frames)
+
+    edge_ratio = (1 - middle_ratio) / 2
+    start = max(0, int(total_frames * edge_ratio))
+    end = min(total_frames - 1, int(total_frames * (1 - edge_ratio)))
+
+    if end - start + 1 < actual_num:
+        start, end = 0, total_frames - 1
+
+    if random_seed is not None:
+        random.seed(random_seed)
+    return sorted(random.sample(range(start, end + 1), actual_num))
+
+
+def _decode_sequential(container, video_stream, frame_indices: List[int]) -> Iterator:
+    """从头顺序解码，取出指定序号的帧（容器不支持定位时使用）"""
+
+    targets = set(frame_indices)
+    remaining = len(targets)
+    for frame_idx, frame in enumerate(container.decode(video_stream)):
+        if frame_idx in targets:
+            yield frame
+            remaining -= 1
+            if remaining <= 0:
+                return
+
+
+def _decode_seeking(container, video_stream, frame_indices: List[int]) -> Iterator:
+    """对每个目标帧先定位到之前最近的关键帧，再解码到目标时间戳为止"""
+
+    start_time = video_stream.start_time or 0
+    frame_duration = 1 / (video_stream.average_rate * video_stream.time_base)
+    for frame_idx in frame_indices:
+        target_pts = start_time + int(frame_idx * frame_duration)
+        container.seek(target_pts, backward=True, stream=video_stream)
+        for frame in container.decode(video_stream):
+            if frame.pts is None or frame.pts >= target_pts:
+                yield frame
+                break
+
+
+def iter_sample_frames(
     video_path: str,
     num_frames: int = 10,
     random_seed: Optional[int] = None,
     middle_ratio: float = 0.8,
-) -> List[np.ndarray]:
-    """内部函数：用AV抽取帧"""
+    seek: bool = True,
+    container=None,
+) -> Iterator[np.ndarray]:
+    """逐帧产出抽样得到的 BGR 画面，seek 为 True 时按关键帧定位而非从头解码
+
+    传入已打开的 container 时直接复用且不关闭它。
+    """
 
     if num_frames < 1:
         raise ValueError(f"抽取帧数必须为正数，当前：{num_frames}")
     if not (0 < middle_ratio <= 1):
         raise ValueError(f"中间区域占比必须在(0,1]，当前：{middle_ratio}")
 
-    try:
+    if container is None:
         with av.open(video_path) as container:
-            video_stream = container.streams.video[0]
-            total_frames = (
-                int(video_stream.duration * video_stream.time_base * video_stream.average_rate)
-                if video_stream.duration and video_stream.time_base
-                else 0
+            yield from iter_sample_frames(
+                video_path, num_frames, random_seed, middle_ratio, seek, container
             )
+        return
 
-            if total_frames <= 0:
-                raise ValueError("无法获取视频帧数")
-
-            actual_num = min(num_frames, total_frames)
+    video_stream = container.streams.video[0]
+    frame_indices = _sample_targets(
+        container, video_stream, num_frames, random_seed, middle_ratio
+    )
 
-            edge_ratio = (1 - middle_ratio) / 2
-            start = max(0, int(total_frames * edge_ratio))
-            end = min(total_frames - 1, int(total_frames * (1 - edge_ratio)))
+    if seek and video_stream.average_rate:
+        decoded = _decode_seeking(container, video_stream, frame_indices)
+    else:
+        decoded = _decode_sequential(container, video_stream, frame_indices)
 
-            if end - start + 1 < actual_num:
-                start, end = 0, total_frames - 1
+    for frame in decoded:
+        yield frame.to_ndarray(format="bgr24")
 
-            if random_seed is not None:
-                random.seed(random_seed)
-            frame_indices = sorted(random.sample(range(start, end + 1), actual_num))
 
-            frames: List[np.ndarray] = []
-            frame_idx = 0
-            for frame in container.decode(video_stream):
-                if frame_idx in frame_indices:
-                    img = frame.to_ndarray(format="bgr24")
-                    frames.append(img)
-                    if len(frames) >= actual_num:
-                        break
-                frame_idx += 1
+def sample_frames(
+    video_path: str,
+    num_frames: int = 10,
+    random_seed: Optional[int] = None,
+    middle_ratio: float = 0.8,
+    seek: bool = True,
+) -> List[np.ndarray]:
+    """内部函数：用AV抽取帧"""
 
-            if not frames:
-                raise ValueError("AV未成功抽取任何帧")
-            return frames
+    try:
+        frames = list(
+            iter_sample_frames(video_path, num_frames, random_seed, middle_ratio, seek)
+        )
+        if not frames:
+            raise ValueError("AV未成功抽取任何帧")
+        return frames
 
     except Exception as e:
         raise RuntimeError(f"AV抽取帧失败：{str(e)}")
 
 
+# 分割线搜索方式：pyramid 在降采样金字塔上由粗到精搜索，exhaustive 为逐像素穷举的参考实现
+SPLIT_SEARCH_METHODS = ("pyramid", "exhaustive")
+
+# 金字塔最粗一层的最长边（像素）
+PYRAMID_COARSE_SIZE = 256
+# 每一层保留进入下一层细化的候选数
+PYRAMID_TOP_K = 3
+# 细化时在上一层候选映射位置两侧搜索的半径（像素）
+PYRAMID_REFINE_RADIUS = 2
+# 投影相关预筛选后保留交给 SSIM 评分的候选数
+PREFILTER_KEEP = 8
+
+
+def _split_similarity(gray: np.ndarray, pos: int, axis: int, win_size: int) -> float:
+    """以 pos 为分割线，计算前后两部分（后者缩放到前者尺寸）的结构相似度"""
+
+    import cv2
+    from skimage.metrics import structural_similarity as ssim
+
+    if axis == 1:
+        first, second = gray[:, :pos], gray[:, pos:]
+    else:
+        first, second = gray[:pos, :], gray[pos:, :]
+    second_resized = cv2.resize(second, (first.shape[1], first.shape[0]))
+    return ssim(first, second_resized, win_size=win_size)  # type: ignore
+
+
+def _search_range(length: int) -> range:
+    return range(int(length * 0.3), int(length * 0.7))
+
+
+def _search_exhaustive(gray: np.ndarray, axis: int) -> Tuple[int, float]:
+    """滑动窗口逐像素穷举分割线位置"""
+
+    best_sim = -1.0
+    best_pos = -1
+    for pos in _search_range(gray.shape[axis]):
+        sim = _split_similarity(gray, pos, axis, 11)
+        if sim > best_sim:
+            best_sim = sim
+            best_pos = pos
+    return best_pos, best_sim
+
+
+def _build_pyramid(gray: np.ndarray) -> List[np.ndarray]:
+    """逐级减半构建图像金字塔，直到最长边不超过 PYRAMID_COARSE_SIZE"""
+
+    import cv2
+
+    pyramid = [gray]
+    while max(pyramid[-1].shape) > PYRAMID_COARSE_SIZE:
+        height, width = pyramid[-1].shape
+        # 最短边的 30% 仍需容纳 SSIM 窗口
+        if min(height, width) // 2 * 0.3 < 7:
+            break
+        pyramid.append(
+            cv2.resize(pyramid[-1], (width // 2, height // 2), interpolation=cv2.INTER_AREA)
+        )
+    return pyramid
+
+
+def _profile_candidates(
+    gray: np.ndarray, axis: int, candidates: range, keep: int
+) -> List[int]:
+    """用行/列均值投影的相关系数对候选位置做廉价预筛选，返回得分最高的 keep 个"""
+
+    profile = gray.mean(axis=0 if axis == 1 else 1)
+    scores = []
+    for pos in candidates:
+        first, second = profile[:pos], profile[pos:]
+        second_resized = np.interp(
+            np.linspace(0, len(second) - 1, len(first)), np.arange(len(second)), second
+        )
+        if first.std() == 0 or second_resized.std() == 0:
+            corr = -1.0
+        else:
+            corr = float(np.corrcoef(first, second_resized)[0, 1])
+        scores.append((corr, pos))
+    scores.sort(reverse=True)
+    return [pos for _, pos in scores[:keep]]
+
+
+def _search_pyramid(
+    gray: np.ndarray, axis: int, prefilter: bool = False
+) -> Tuple[int, float]:
+    """在最粗一层全范围评分，再逐层只细化得分最高的几个候选附近"""
+
+    pyramid = _build_pyramid(gray)
+
+    coarse = pyramid[-1]
+    candidates = list(_search_range(coarse.shape[axis]))
+    if prefilter:
+        candidates = _profile_candidates(coarse, axis, candidates, PREFILTER_KEEP)
+    win_size = 11 if len(pyramid) == 1 else 7
+    scored = sorted(
+        ((_split_similarity(coarse, pos, axis, win_size), pos) for pos in candidates),
+        reverse=True,
+    )[:PYRAMID_TOP_K]
+
+    for index in range(len(pyramid) - 2, -1, -1):
+        level = pyramid[index]
+        scale = level.shape[axis] / pyramid[index + 1].shape[axis]
+        search_range = _search_range(level.shape[axis])
+        positions = set()
+        for _, pos in scored:
+            center = round(pos * scale)
+            for candidate in range(
+                center - PYRAMID_REFINE_RADIUS, center + PYRAMID_REFINE_RADIUS + 1
+            ):
+                if candidate in search_range:
+                    positions.add(candidate)
+        # 最精细一层使用与穷举搜索相同的窗口，保证得分与阈值含义一致
+        win_size = 11 if index == 0 else 7
+        scored = sorted(
+            (
+                (_split_similarity(level, pos, axis, win_size), pos)
+                for pos in sorted(positions)
+            ),
+            reverse=True,
+        )[:PYRAMID_TOP_K]
+
+    if not scored:
+        return -1, -1.0
+    best_sim, best_pos = scored[0]
+    return best_pos, best_sim
+
+
+class _SplitVotes:
+    """累计各帧的分割线检测结果"""
+
+    def __init__(self, frame_width: int, frame_height: int, threshold_sim: float):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.threshold_sim = threshold_sim
+        self.vertical: List[int] = []
+        self.horizontal: List[int] = []
+
+    def add(self, frame: np.ndarray, method: str, prefilter: bool) -> None:
+        import cv2
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        # 1. 检测竖向分割（SBS）：找左右最相似的竖直线
+        # 2. 检测横向分割（TB）：找上下最相似的水平线
+        if method == "exhaustive":
+            best_v_x, best_v_sim = _search_exhaustive(gray, 1)
+            best_h_y, best_h_sim = _search_exhaustive(gray, 0)
+        else:
+            best_v_x, best_v_sim = _search_pyramid(gray, 1, prefilter)
+            best_h_y, best_h_sim = _search_pyramid(gray, 0, prefilter)
+
+        if best_v_sim > self.threshold_sim:
+            self.vertical.append(best_v_x)
+        if best_h_sim > self.threshold_sim:
+            self.horizontal.append(best_h_y)
+
+    def agreed(self, min_frames: int, tolerance: float) -> bool:
+        """占多数的方向已有至少 min_frames 帧，且其分割比例的极差不超过 tolerance"""
+
+        if len(self.vertical) > len(self.horizontal):
+            positions, length = self.vertical, self.frame_width
+        elif len(self.horizontal) > len(self.vertical):
+            positions, length = self.horizontal, self.frame_height
+        else:
+            return False
+        if len(positions) < min_frames:
+            return False
+        return (max(positions) - min(positions)) / length <= tolerance
+
+    def result(self, digits: Optional[int] = 1) -> Tuple[VideoFormat, float]:
+        """占多数的方向及平均分割比例，比例保留 digits 位小数，None 时不取整"""
+
+        if len(self.vertical) > len(self.horizontal):
+            avg_x = np.mean(self.vertical)
+            ratio = avg_x / self.frame_width
+            format = VideoFormat.sbs
+        elif len(self.horizontal) > len(self.vertical):
+            avg_y = np.mean(self.horizontal)
+            ratio = avg_y / self.frame_height
+            format = VideoFormat.tab
+        else:
+            return VideoFormat.notsure, 0
+        return format, float(ratio if digits is None else round(ratio, digits))
+
+
 def detect_split_direction_and_position(
-    frames: list[np.ndarray], threshold_sim=0.65
+    frames: list[np.ndarray],
+    threshold_sim=0.65,
+    method: str = "pyramid",
+    prefilter: bool = False,
+    check: Optional[Callable[[], None]] = None,
+    digits: Optional[int] = 1,
 ) -> Tuple[VideoFormat, float]:
-    """检测分割线方向（横向/竖向）及位置比例"""
+    """检测分割线方向（横向/竖向）及位置比例
+
+    method 为 pyramid 时由粗到精搜索，exhaustive 时逐像素穷举；
+    prefilter 为 True 时先用行/列投影相关性筛掉大部分候选（仅 pyramid 生效）。
+    给定 check 时每检测一帧前调用一次，可抛出异常（如 progress.Cancelled）中止检测。
+    分割比例保留 digits 位小数，None 时返回搜索得到的原始比例。
+    """
+    if method not in SPLIT_SEARCH_METHODS:
+        raise ValueError(f"不支持的分割线搜索方式: {method}")
     if not frames:
         return VideoFormat.notsure, 0
 
-    vertical_candidates = []
-    horizontal_candidates = []
     frame_height, frame_width = frames[0].shape[:2]
-
+    votes = _SplitVotes(frame_width, frame_height, threshold_sim)
     for frame in frames:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if check is not None:
+            check()
+        votes.add(frame, method, prefilter)
+    return votes.result(digits)
+
+
+def detect_split_from_video(
+    video_path: str,
+    num_frames: int = 10,
+    threshold_sim=0.65,
+    method: str = "pyramid",
+    prefilter: bool = False,
+    early_stop_tolerance: Optional[float] = None,
+    min_agree_frames: int = 3,
+    random_seed: Optional[int] = None,
+    container=None,
+    profiler: Optional[profiling.Profiler] = None,
+    check: Optional[Callable[[], None]] = None,
+    digits: Optional[int] = 1,
+) -> Tuple[VideoFormat, float]:
+    """边抽帧边检测分割线
+
+    early_stop_tolerance 不为 None 时，一旦已有 min_agree_frames 帧检测出的分割比例
+    相差不超过该容差即停止抽帧，检测耗时基本与片长无关。
+    传入已打开的 container 时直接复用且不关闭它。
+    给定 profiler 时分别记录抽帧（detect.sample）与分割线搜索（detect.search）的耗时。
+    给定 check 时每抽取一帧调用一次，用于在检测过程中响应取消（progress.Cancelled
+    原样抛出）。分割比例的取整同 detect_split_direction_and_position。
+    """
+    if method not in SPLIT_SEARCH_METHODS:
+        raise ValueError(f"不支持的分割线搜索方式: {method}")
+
+    votes = None
+    frames = iter_sample_frames(
+        video_path, num_frames, random_seed, container=container
+    )
+    try:
+        for frame in profiling.iterate(profiler, "detect.sample", frames):
+            if check is not None:
+                check()
+            if votes is None:
+                frame_height, frame_width = frame.shape[:2]
+                votes = _SplitVotes(frame_width, frame_height, threshold_sim)
+                add = profiling.wrap(profiler, "detect.search", votes.add)
+            add(frame, method, prefilter)
+            if early_stop_tolerance is not None and votes.agreed(
+                min_agree_frames, early_stop_tolerance
+            ):
+                break
+    except progress.Cancelled:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"AV抽取帧失败：{str(e)}")
+    finally:
+        frames.close()
+
+    if votes is None:
+        raise RuntimeError("AV抽取帧失败：AV未成功抽取任何帧")
+    return votes.result(digits)
 
-        # 1. 检测竖向分割（SBS）：滑动窗口找左右最相似的竖直线
-        best_v_sim = -1
-        best_v_x = -1
-
-        for x in range(int(frame_width * 0.3), int(frame_width * 0.7)):
-            left = gray[:, :x]
-            right = gray[:, x:]
-
-            right_resized = cv2.resize(right, (left.shape[1], left.shape[0]))
-            sim = ssim(left, right_resized, win_size=11)
-            if sim > best_v_sim:  # type: ignore
-                best_v_sim = sim
-                best_v_x = x
-
-        # 2. 检测横向分割（TB）：滑动窗口找上下最相似的水平线
-        best_h_sim = -1
-        best_h_y = -1
-
-        for y in range(int(frame_height * 0.3), int(frame_height * 0.7)):
-            top = gray[:y, :]
-            bottom = gray[y:, :]
-
-            bottom_resized = cv2.resize(bottom, (top.shape[1], top.shape[0]))
-            sim = ssim(top, bottom_resized, win_size=11)
-            if sim > best_h_sim:  # type: ignore
-                best_h_sim = sim
-                best_h_y = y
-
-        if best_v_sim > threshold_sim:  # type: ignore
-            vertical_candidates.append(best_v_x)
-        if best_h_sim > threshold_sim:  # type: ignore
-            horizontal_candidates.append(best_h_y)
-
-    if len(vertical_candidates) > len(horizontal_candidates):
-        avg_x = np.mean(vertical_candidates)
-        ratio = avg_x / frame_width
-        return VideoFormat.sbs, float(round(ratio, 1))
-    elif len(horizontal_candidates) > len(vertical_candidates):
-        avg_y = np.mean(horizontal_candidates)
-        ratio = avg_y / frame_height
-        return VideoFormat.tab, float(round(ratio, 1))
+
+def frame_rate(video_stream) -> Optional[float]:
+    """视频流的平均帧率，无法确定时返回 None"""
+
+    rate = video_stream.average_rate or video_stream.guessed_rate
+    return float(rate) if rate else None
+
+
+def estimate_frame_count(container, video_stream) -> int:
+    """由时长 × 帧率估算帧数，时长或帧率未知时返回 0"""
+
+    rate = frame_rate(video_stream)
+    if not rate:
+        return 0
+    if video_stream.duration and video_stream.time_base:
+        duration = float(video_stream.duration * video_stream.time_base)
+    elif container.duration:
+        duration = container.duration / av.time_base
     else:
-        return VideoFormat.notsure, 0
+        return 0
+    return max(0, round(duration * rate))
+
+
+def count_frames(
+    container, video_stream, check: Optional[Callable[[], None]] = None
+) -> int:
+    """只解复用、不解码地统计视频数据包个数（即帧数），完成后定位回文件开头
+
+    给定 check 时每读取一个数据包调用一次，可抛出异常中止扫描。
+    """
+
+    count = 0
+    try:
+        for packet in container.demux(video_stream):
+            if check is not None:
+                check()
+            if packet.size:
+                count += 1
+    finally:
+        container.seek(0)
+    return count
+
+
+def read_video_info(
+    container, scan: bool = True, check: Optional[Callable[[], None]] = None
+) -> Tuple[int, int, int]:
+    """从已打开的容器读取首个视频流的宽、高与帧数
+
+    容器未记录帧数时先按时长 × 帧率估算，仍无法确定且 scan 为 True 时扫描一遍数据包
+    计数（check 见 count_frames）；都不可行时帧数为 0（未知）。
+    """
+
+    video_stream = next(
+        (stream for stream in container.streams if stream.type == "video"), None
+    )
+    if not video_stream:
+        raise RuntimeError("视频无有效视频流，无法获取信息")
+
+    codec_ctx = video_stream.codec_context
+    if not codec_ctx:
+        raise RuntimeError("无法获取视频流的编码器上下文")
+
+    width = codec_ctx.width  # type: ignore
+    height = codec_ctx.height  # type: ignore
+    total_frames = video_stream.frames
+    if total_frames <= 0:
+        total_frames = estimate_frame_count(container, video_stream)
+    if total_frames <= 0 and scan:
+        total_frames = count_frames(container, video_stream, check)
+
+    return width, height, total_frames
 
 
 def get_video_info(
@@ -199,24 +559,7 @@ def get_video_info(
     container = None
     try:
         container = av.open(input_path)
-        video_stream = next(
-            (stream for stream in container.streams if stream.type == "video"), None
-        )
-        if not video_stream:
-            raise RuntimeError("视频无有效视频流，无法获取信息")
-
-        codec_ctx = video_stream.codec_context
-        if not codec_ctx:
-            raise RuntimeError("无法获取视频流的编码器上下文")
-
-        width = codec_ctx.width  # type: ignore
-        height = codec_ctx.height  # type: ignore
-        total_frames = 100
-
-        if video_stream.frames > 0:
-            total_frames = video_stream.frames
-
-        return width, height, total_frames
+        return read_video_info(container)
 
     except Exception as e:
         raise RuntimeError(f"AV获取视频信息失败：{str(e)}")
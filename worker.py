@@ -0,0 +1,446 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+
+import batch
+import converter
+import job_queue
+import path_check
+import probe
+import progress
+import transformer_av
+
+
+# 续约并写入进度的最长间隔（秒），实际间隔不超过租约的三分之一
+HEARTBEAT_INTERVAL = 2.0
+# 队列中没有可领取的任务时，两次查询之间的间隔（秒）
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 工作进程内复用的队列连接与探测缓存，由 _init_process 创建
+_queue: Optional[job_queue.JobQueue] = None
+_cache: Optional[probe.ProbeCache] = None
+
+
+def _init_process(queue_path: str, cache_dir: Optional[str], use_cache: bool) -> None:
+    """工作进程初始化：打开队列连接，并预先加载转换与分割线检测用到的模块，
+    之后处理的每个任务都不再付出解释器启动与导入的开销"""
+
+    global _queue, _cache
+    # 中断由主进程处理：先停止领取新任务，再通过队列通知正在运行的任务停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _queue = job_queue.JobQueue(queue_path)
+    _cache = probe.ProbeCache(cache_dir) if use_cache else None
+
+    import cv2  # noqa: F401
+    from skimage.metrics import structural_similarity  # noqa: F401
+
+
+def _job_options(options: Dict) -> Dict:
+    """把队列中以 JSON 保存的转换参数还原为 converter.convert_file 的参数"""
+
+    options = dict(options)
+    if options.get("outputs"):
+        options["outputs"] = [
+            transformer_av.OutputSpec(**spec) for spec in options["outputs"]
+        ]
+    return options
+
+
+def _run_job(
+    job_id: int,
+    worker: str,
+    lease_seconds: float,
+    retry_delay: float,
+    threads: int,
+) -> str:
+    """工作进程入口：转换一个已租用的任务，返回任务的最终状态
+
+    后台线程定期续约并写入最新进度；续约失败（任务被取消或租约已被收回）时通知
+    转换在下一帧前停止。每次尝试先写入各自的临时文件，成功后再改名为输出路径，
+    租约被收回后仍在运行的旧进程不会与重新领取该任务的工作进程写同一个文件，
+    失败时也只删除本次尝试的临时文件，见 converter.StagedOutput。
+    """
+
+    job = _queue.get(job_id)
+    if job is None or job.status != "running" or job.worker != worker:
+        return "lost"
+
+    cancel_event = threading.Event()
+    stopped = threading.Event()
+    latest: Dict[str, progress.Progress] = {}
+
+    def heartbeat() -> None:
+        interval = min(HEARTBEAT_INTERVAL, lease_seconds / 3)
+        with job_queue.JobQueue(_queue.path) as queue:
+            while not stopped.wait(interval):
+                snapshot = latest.get("progress")
+                try:
+                    leased = queue.renew(
+                        job_id,
+                        worker,
+                        lease_seconds,
+                        None if snapshot is None else snapshot.to_dict(),
+                    )
+                except sqlite3.Error:
+                    # 数据库暂时不可用时继续转换，下次再续约
+                    continue
+                if not leased:
+                    cancel_event.set()
+                    return
+
+    def record(snapshot: progress.Progress) -> None:
+        latest["progress"] = snapshot
+
+    thread = threading.Thread(target=heartbeat, daemon=True)
+    thread.start()
+    options = _job_options(job.options)
+    options.setdefault("threads", threads)
+    staged = converter.StagedOutput(job.output_path, options)
+    try:
+        path_check.validate_input_path(job.input_path)
+        path_check.validate_output_dir(job.output_path)
+        mode = converter.convert_file(
+            job.input_path,
+            staged.output_path,
+            progress_callback=record,
+            cancel_event=cancel_event,
+            cache=_cache,
+            **staged.options,
+        )
+        staged.commit()
+    except progress.Cancelled:
+        stopped.set()
+        job = _queue.get(job_id)
+        if job is not None and job.status == "cancelled":
+            staged.discard()
+            return "cancelled"
+        # 任务已归还队列或被其他进程领取，直接写入输出路径的分段输出可能已由对方接手
+        staged.discard(direct=False)
+        if job is not None and job.status == "queued":
+            return "released"
+        return "lost"
+    except Exception as e:
+        stopped.set()
+        status = _queue.fail(job_id, worker, str(e), retry_delay)
+        staged.discard(direct=status is not None)
+        if status is None:
+            return "lost"
+        return status
+    finally:
+        stopped.set()
+        thread.join()
+
+    snapshot = latest.get("progress")
+    if not _queue.complete(
+        job_id, worker, mode, None if snapshot is None else snapshot.to_dict()
+    ):
+        return "lost"
+    return "done"
+
+
+class Worker:
+    """常驻的转换工作进程：从任务队列领取任务，交给预热好的进程池转换
+
+    进程池中的进程在启动时加载好 PyAV、NumPy 与分割线检测模块，之后逐个处理任务，
+    不再为每个文件启动新进程。concurrency 为同时转换的任务数，默认与批量模式相同；
+    多个节点可以各自运行 Worker 消费同一个共享存储上的队列。
+    stop 后不再领取新任务，等待正在转换的任务完成；abort 时把正在转换的任务归还
+    队列（不计入尝试次数），各工作进程在下次续约时发现并停止转换。
+    """
+
+    def __init__(
+        self,
+        queue_path: str,
+        concurrency: Optional[int] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = job_queue.DEFAULT_LEASE_SECONDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        retry_delay: float = job_queue.DEFAULT_RETRY_DELAY,
+        cache_dir: Optional[str] = None,
+        use_cache: bool = True,
+        threads: Optional[int] = None,
+        report: Optional[Callable[[job_queue.Job, str], None]] = None,
+    ):
+        if lease_seconds <= 0:
+            raise ValueError(f"租约时长必须为正数，当前：{lease_seconds}")
+        self.queue_path = queue_path
+        self.concurrency, default_threads = batch.plan_concurrency(concurrency)
+        self.threads = threads or default_threads
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.report = report
+        self._stopping = threading.Event()
+        self._aborting = threading.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def abort(self) -> None:
+        self._aborting.set()
+        self._stopping.set()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.concurrency,
+            initializer=_init_process,
+            initargs=(self.queue_path, self.cache_dir, self.use_cache),
+        )
+
+    def run(self, drain: bool = False) -> None:
+        """循环领取并转换任务，直到 stop / abort；drain 为 True 时队列中没有可领取的
+        任务且没有正在转换的任务即退出"""
+
+        queue = job_queue.JobQueue(self.queue_path)
+        executor = self._executor()
+        running: Dict[Future, job_queue.Job] = {}
+        released = False
+        try:
+            while True:
+                if self._aborting.is_set() and not released:
+                    for job in running.values():
+                        queue.release(job.id, self.worker_id)
+                    released = True
+
+                while not self.stopping and len(running) < self.concurrency:
+                    job = queue.claim(self.worker_id, self.lease_seconds)
+                    if job is None:
+                        break
+                    running[
+                        executor.submit(
+                            _run_job,
+                            job.id,
+                            self.worker_id,
+                            self.lease_seconds,
+                            self.retry_delay,
+                            self.threads,
+                        )
+                    ] = job
+
+                if not running:
+                    if self.stopping or drain:
+                        return
+                    self._stopping.wait(self.poll_interval)
+                    continue
+
+                done, _ = wait(
+                    running, timeout=self.poll_interval, return_when=FIRST_COMPLETED
+                )
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        status = future.result()
+                    except BrokenProcessPool as e:
+                        # 工作进程异常退出（如被系统杀死），进程池随之失效，需要重建
+                        broken = True
+                        status = (
+                            queue.fail(
+                                job.id,
+                                self.worker_id,
+                                f"工作进程异常退出: {e}",
+                                self.retry_delay,
+                            )
+                            or "lost"
+                        )
+                    except Exception as e:
+                        status = (
+                            queue.fail(job.id, self.worker_id, str(e), self.retry_delay)
+                            or "lost"
+                        )
+                    if self.report is not None:
+                        self.report(job, status)
+                if broken:
+                    executor.shutdown(wait=False)
+                    executor = self._executor()
+        finally:
+            executor.shutdown(wait=True)
+            queue.close()
+
+
+def _format_job(job: job_queue.Job) -> str:
+    parts = [f"#{job.id}", job.status, f"优先级 {job.priority}"]
+    parts.append(f"尝试 {job.attempts}/{job.max_attempts}")
+    if job.status == "running" and job.progress is not None:
+        snapshot = progress.Progress(
+            **{field: job.progress[field] for field in progress.Progress._fields}
+        )
+        parts.append(progress.format_human(snapshot))
+    parts.append(f"{job.input_path} -> {job.output_path}")
+    if job.error and job.status != "done":
+        parts.append(f"错误: {job.error}")
+    return " ".join(parts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="常驻转换工作进程：从 SQLite 任务队列领取并转换任务"
+        "（任务由 main.py --queue 加入）"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="运行工作进程")
+    run_parser.add_argument(
+        "queue", help="任务队列数据库路径（多个节点可共用共享存储上的同一文件）"
+    )
+    run_parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="同时转换的任务数，默认按 CPU 数与每个任务的编解码线程数推算",
+    )
+    run_parser.add_argument(
+        "--threads", type=int, help="每个任务的编解码线程数，默认按 CPU 数 ÷ 并发数推算"
+    )
+    run_parser.add_argument("--worker-id", help="工作进程标识，默认为 主机名:进程号")
+    run_parser.add_argument(
+        "--lease",
+        type=float,
+        default=job_queue.DEFAULT_LEASE_SECONDS,
+        metavar="SECONDS",
+        help="任务租约时长（秒），工作进程失联超过该时长后任务重新入队",
+    )
+    run_parser.add_argument(
+        "--retry-delay",
+        type=float,
+        default=job_queue.DEFAULT_RETRY_DELAY,
+        metavar="SECONDS",
+        help="失败任务首次重试前的等待时间（秒），之后每次加倍",
+    )
+    run_parser.add_argument(
+        "--poll",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        metavar="SECONDS",
+        help="队列为空时查询新任务的间隔（秒）",
+    )
+    run_parser.add_argument(
+        "--drain", action="store_true", help="队列中没有可领取的任务时退出，而不是持续等待"
+    )
+    run_parser.add_argument("--cache-dir", help="探测/检测结果缓存目录")
+    run_parser.add_argument(
+        "--no-cache", action="store_true", help="不读取也不写入探测/检测结果缓存"
+    )
+
+    status_parser = commands.add_parser("status", help="查看任务状态与进度")
+    status_parser.add_argument("queue", help="任务队列数据库路径")
+    status_parser.add_argument(
+        "--status", choices=list(job_queue.JOB_STATUSES), help="只列出该状态的任务"
+    )
+    status_parser.add_argument(
+        "--json", action="store_true", help="每行输出一个任务的 JSON 记录"
+    )
+
+    for name, help_text in (
+        ("cancel", "取消等待中或运行中的任务"),
+        ("retry", "把失败或已取消的任务重新入队"),
+    ):
+        command_parser = commands.add_parser(name, help=help_text)
+        command_parser.add_argument("queue", help="任务队列数据库路径")
+        command_parser.add_argument(
+            "ids", nargs="+", type=int, metavar="ID", help="任务号"
+        )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        labels = {
+            "done": "完成",
+            "queued": "稍后重试",
+            "failed": "失败",
+            "cancelled": "已取消",
+            "released": "已归还队列",
+            "lost": "租约已失效",
+        }
+
+        def report(job: job_queue.Job, status: str) -> None:
+            label = labels.get(status, status)
+            print(
+                f"[{label}] #{job.id} {job.input_path} -> {job.output_path}",
+                file=sys.stderr,
+                flush=True,
+            )
+
+        try:
+            worker = Worker(
+                args.queue,
+                args.concurrency,
+                args.worker_id,
+                args.lease,
+                args.poll,
+                args.retry_delay,
+                args.cache_dir,
+                not args.no_cache,
+                args.threads,
+                report,
+            )
+        except Exception as e:
+            print(f"启动失败: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+
+        def interrupt(signum, frame) -> None:
+            # 第一次中断：不再领取新任务，等待正在转换的任务完成；再次中断：归还任务并尽快退出
+            if worker.stopping:
+                print("正在归还未完成的任务并退出", file=sys.stderr, flush=True)
+                worker.abort()
+            else:
+                print(
+                    "不再领取新任务，等待正在转换的任务完成（再次中断立即停止）",
+                    file=sys.stderr,
+                    flush=True,
+                )
+                worker.stop()
+
+        signal.signal(signal.SIGINT, interrupt)
+        signal.signal(signal.SIGTERM, interrupt)
+        print(
+            f"工作进程 {worker.worker_id} 已启动：并发 {worker.concurrency}，"
+            f"每任务 {worker.threads} 线程",
+            file=sys.stderr,
+            flush=True,
+        )
+        worker.run(args.drain)
+        return
+
+    with job_queue.JobQueue(args.queue) as queue:
+        if args.command == "status":
+            jobs = queue.jobs(args.status)
+            for job in jobs:
+                if args.json:
+                    print(json.dumps(job.to_dict(), ensure_ascii=False))
+                else:
+                    print(_format_job(job))
+            if not args.json:
+                counts = queue.counts()
+                print(
+                    "，".join(f"{status} {count}" for status, count in counts.items()),
+                    file=sys.stderr,
+                )
+            return
+
+        action = queue.cancel if args.command == "cancel" else queue.retry
+        failed = [job_id for job_id in args.ids if not action(job_id)]
+        if failed:
+            print(
+                f"以下任务不存在或状态不允许该操作: {', '.join(map(str, failed))}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()